@@ -0,0 +1,206 @@
+import unittest
+import random
+import numpy as np
+from queue import Queue
+from agents_data import AgentsData
+from box2d_simulation import Box2DSimulation
+
+def make_queues():
+    return {
+        'eco_to_box2d': Queue(),
+        'eco_to_visual': Queue(),
+        'eco_to_box2d_init': Queue(),
+        'eco_to_visual_init': Queue(),
+        'eco_to_tf_init': Queue(),
+        'eco_to_tf': Queue(),
+        'box2d_to_eco': Queue(),
+        'tf_to_box2d': Queue(),
+        'box2d_to_tf': Queue(),
+        'box2d_to_visual_render': Queue(),
+        'box2d_to_eco_collisions': Queue()
+    }
+
+class TestAgentsDataEvents(unittest.TestCase):
+    def setUp(self):
+        self.queues = make_queues()
+        self.ad = AgentsData(self.queues)
+        for i in range(20):
+            self.ad.add_agent_no_notify(i % 8 + 1, (i * 10.0, i * 10.0))
+
+    def test_one_batch_per_flush(self):
+        for i in range(30):
+            self.ad.add_agent(1, (500.0, 500.0), (1.0, 2.0))
+        self.ad.remove_agent(3)
+        self.ad.flush_agent_events()
+        self.assertEqual(self.queues['eco_to_box2d'].qsize(), 1)
+        self.assertEqual(self.queues['eco_to_visual'].qsize(), 1)
+        batch = self.queues['eco_to_box2d'].get_nowait()
+        self.assertEqual(batch['action'], 'batch')
+        self.assertEqual(len(batch['added_ids']), 30)
+        self.assertEqual(batch['added_positions'].shape, (30, 2))
+        np.testing.assert_array_equal(batch['added_velocities'][0], (1.0, 2.0))
+        self.assertEqual(list(batch['removed_ids']), [3])
+        np.testing.assert_array_equal(batch['agent_ids'], self.ad.agents['id'][:self.ad.current_agent_count])
+
+    def test_nothing_sent_without_events(self):
+        self.ad.flush_agent_events()
+        self.assertTrue(self.queues['eco_to_box2d'].empty())
+
+    def test_add_then_remove_in_same_tick_cancels(self):
+        agent_id = self.ad.add_agent(2, (100.0, 100.0))
+        self.ad.remove_agent(agent_id)
+        self.ad.flush_agent_events()
+        self.assertTrue(self.queues['eco_to_box2d'].empty())
+
+    def test_box2d_follows_agents_data_order(self):
+        box2d = Box2DSimulation(self.queues)
+        self.ad.send_data_to_box2d_initialize()
+        box2d.initialize()
+        rng = random.Random(0)
+        for _ in range(5):
+            for _ in range(rng.randint(0, 10)):
+                self.ad.add_agent(rng.randint(1, 8), (rng.uniform(0, 2000), rng.uniform(0, 2000)))
+            for _ in range(rng.randint(0, 10)):
+                self.ad.remove_agent(rng.choice(list(self.ad.available_agent_ids())))
+            self.ad.flush_agent_events()
+            box2d.process_ecosystem_queue()
+            count = self.ad.current_agent_count
+            self.assertEqual(box2d.current_agent_count, count)
+            np.testing.assert_array_equal(box2d.agent_ids[:count], self.ad.agents['id'][:count])
+            np.testing.assert_array_equal(box2d.species[:count], self.ad.agents['species'][:count])
+
+class TestAgentsDataIndex(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(1)
+        self.ad = AgentsData(make_queues())
+        for i in range(30):
+            self.ad.add_agent_no_notify(i % 8 + 1, (i * 10.0, i * 10.0))
+
+    def assert_index_consistent(self):
+        count = self.ad.current_agent_count
+        ids = self.ad.agents['id'][:count]
+        np.testing.assert_array_equal(self.ad.id_to_index[ids], np.arange(count))
+        self.assertEqual(np.count_nonzero(self.ad.id_to_index >= 0), count)
+
+    def test_index_follows_add_and_remove(self):
+        rng = random.Random(3)
+        for _ in range(20):
+            self.ad.remove_agent(rng.choice(self.ad.available_agent_ids().tolist()))
+            self.ad.add_agent(rng.randint(1, 8), (1.0, 2.0))
+            self.assert_index_consistent()
+        count = self.ad.current_agent_count
+        dead = np.zeros(count, dtype=bool)
+        dead[::4] = True
+        self.ad.remove_agents_by_mask(dead)
+        self.assert_index_consistent()
+        self.ad.add_agents(np.array([1, 2, 3]), np.zeros((3, 2)))
+        self.assert_index_consistent()
+
+    def test_index_of_batches(self):
+        self.ad.remove_agent(4)
+        index = self.ad.index_of(np.array([0, 4, 29, -1, 10 ** 6]))
+        np.testing.assert_array_equal(index[[1, 3, 4]], [-1, -1, -1])
+        self.assertEqual(self.ad.agents['id'][index[0]], 0)
+        self.assertEqual(self.ad.agents['id'][index[2]], 29)
+        self.assertEqual(self.ad.index_of(4), -1)
+
+class TestAgentsDataLifecycle(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.queues = make_queues()
+        self.ad = AgentsData(self.queues)
+        for i in range(40):
+            self.ad.add_agent_no_notify(i % 8 + 1, (i * 10.0, i * 10.0))
+
+    def test_check_deaths_compacts_in_one_pass(self):
+        count = self.ad.current_agent_count
+        dead = np.zeros(count, dtype=bool)
+        dead[[0, 5, 6, 39]] = True
+        dead_ids = self.ad.agents['id'][:count][dead]
+        alive_ids = self.ad.agents['id'][:count][~dead]
+        self.ad.agents['life_energy'][:count][dead] = 0
+        radius = self.ad._species_radius[self.ad.agents['species'][:count][dead]]
+        energy = self.ad.check_deaths()
+        self.assertAlmostEqual(energy, float(np.sum(radius ** 2)), places=3)
+        self.assertEqual(self.ad.current_agent_count, count - 4)
+        np.testing.assert_array_equal(self.ad.agents['id'][:count - 4], alive_ids)
+        self.assertTrue(np.all(self.ad.agents['id'][count - 4:count] == 0))
+        self.assertEqual(sorted(self.ad.available_ids), sorted(dead_ids.tolist()))
+        self.ad.flush_agent_events()
+        self.assertEqual(self.queues['eco_to_box2d'].qsize(), 1)
+        self.assertEqual(sorted(self.queues['eco_to_box2d'].get_nowait()['removed_ids']), sorted(dead_ids.tolist()))
+
+    def test_check_reproductions_spawns_in_bulk(self):
+        count = self.ad.current_agent_count
+        self.ad.agents['life_energy'][:count] = 100
+        self.ad.agents['life_energy'][[2, 3]] = 3000
+        self.ad.agents['reproduction_rate'][:count] = 1
+        self.ad.available_ids = [7]
+        born = self.ad.check_reproductions()
+        self.assertEqual(born, 2)
+        self.assertEqual(self.ad.current_agent_count, count + 2)
+        children = self.ad.agents[count:count + 2]
+        self.assertEqual(children['id'].tolist(), [7, 40])
+        np.testing.assert_array_equal(children['species'], self.ad.agents['species'][[2, 3]])
+        np.testing.assert_allclose(children['life_energy'], [1500, 1500])
+        np.testing.assert_allclose(self.ad.agents['life_energy'][[2, 3]], [1500, 1500])
+        self.assertTrue(np.all(np.abs(children['position'] - self.ad.agents['position'][[2, 3]]) <= 3))
+
+    def test_reproductions_respect_capacity(self):
+        self.ad.max_agents_num = 41
+        count = self.ad.current_agent_count
+        self.ad.agents['life_energy'][:count] = 3000
+        self.ad.agents['reproduction_rate'][:count] = 1
+        self.assertEqual(self.ad.check_reproductions(), 1)
+        self.assertEqual(self.ad.current_agent_count, 41)
+
+    def test_box2d_follows_lifecycle(self):
+        box2d = Box2DSimulation(self.queues)
+        self.ad.send_data_to_box2d_initialize()
+        box2d.initialize()
+        count = self.ad.current_agent_count
+        self.ad.agents['life_energy'][:count:3] = 0
+        self.ad.agents['life_energy'][1:count:5] = 3000
+        self.ad.agents['reproduction_rate'][:count] = 1
+        self.ad.check_deaths()
+        self.ad.check_reproductions()
+        self.ad.flush_agent_events()
+        box2d.process_ecosystem_queue()
+        count = self.ad.current_agent_count
+        self.assertEqual(box2d.current_agent_count, count)
+        np.testing.assert_array_equal(box2d.agent_ids[:count], self.ad.agents['id'][:count])
+        # frames tell AgentsData which batch they include
+        self.assertEqual(box2d.batch, self.ad.batch)
+        box2d.send_data_to_eco_visual()
+        self.assertEqual(self.queues['box2d_to_eco'].get_nowait()['batch'], self.ad.batch)
+
+    def test_stale_box2d_frame_is_mapped_by_agent_id(self):
+        ad = AgentsData(make_queues())
+        for x in (100.0, 200.0, 300.0, 400.0, 500.0):
+            ad.add_agent_no_notify(1, (x, 0.0))
+        ad.send_data_to_box2d_initialize()
+        frame_ids = ad.agents['id'][:5].copy()
+        # one death and one birth: same count, rows reordered, not yet applied by Box2D
+        ad.agents['life_energy'][0] = 0
+        ad.check_deaths()
+        newborn_id = ad.add_agent(1, (900.0, 0.0))
+        self.assertEqual(newborn_id, frame_ids[0])  # the dead agent's id is recycled
+        ad.flush_agent_events()
+        positions = np.array([[101.0, 0], [201.0, 0], [301.0, 0], [401.0, 0], [501.0, 0]], dtype=np.float32)
+        velocities = np.arange(10, dtype=np.float32).reshape(5, 2)
+        ad._box2d_to_eco.put({'positions': positions, 'velocities': velocities, 'agent_ids': frame_ids, 'batch': 0})
+        ad.update()
+        self.assertEqual(ad.current_agent_count, 5)
+        np.testing.assert_array_equal(ad.agents['position'][ad.index_of(frame_ids[1:])], positions[1:])
+        np.testing.assert_array_equal(ad.agents['velocity'][ad.index_of(frame_ids[1:])], velocities[1:])
+        # the newborn keeps its own values until Box2D has applied the batch that adds it
+        newborn = ad.index_of(newborn_id)
+        np.testing.assert_array_equal(ad.agents['position'][newborn], [900.0, 0.0])
+        np.testing.assert_array_equal(ad.agents['velocity'][newborn], [0.0, 0.0])
+        positions[0] = (901.0, 0.0)
+        ad._box2d_to_eco.put({'positions': positions, 'velocities': velocities, 'agent_ids': frame_ids, 'batch': 1})
+        ad.update()
+        np.testing.assert_array_equal(ad.agents['position'][newborn], [901.0, 0.0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+import unittest
+import numpy as np
+from queue import Queue
+from box2d_simulation import Box2DSimulation
+from shared_frame_buffer import SharedFrameBuffer
+from solver_iterations import SolverIterations
+
+def make_queues():
+    return {
+        'eco_to_box2d_init': Queue(),
+        'eco_to_box2d': Queue(),
+        'tf_to_box2d': Queue(),
+        'box2d_to_tf': Queue(),
+        'box2d_to_eco': Queue(),
+        'box2d_to_visual_render': Queue(),
+        'box2d_to_eco_collisions': Queue()
+    }
+
+class TestBox2DSimulation(unittest.TestCase):
+    def setUp(self):
+        self.queues = make_queues()
+        self.sim = Box2DSimulation(self.queues)
+        self.num_agents = 50
+        rng = np.random.default_rng(0)
+        self.queues['eco_to_box2d_init'].put({
+            'positions': rng.uniform(0, 2000, (self.num_agents, 2)).astype(np.float32),
+            'velocities': np.zeros((self.num_agents, 2), dtype=np.float32),
+            'species': rng.integers(1, 9, self.num_agents).astype(np.int32),
+            'agent_ids': np.arange(self.num_agents, dtype=np.int32),
+            'current_agent_count': self.num_agents
+        })
+        self.sim.initialize()
+
+    def test_forces_are_applied_by_index(self):
+        forces = np.zeros((self.sim.max_agents_num, 2), dtype=np.float32)
+        forces[3] = (1000, 0)
+        self.sim.update_positions()
+        start_positions = self.sim.positions[:self.num_agents].copy()
+        self.queues['tf_to_box2d'].put({'forces': forces, 'current_agent_count': self.num_agents})
+        self.sim.update()
+        moved = np.linalg.norm(self.sim.positions[:self.num_agents] - start_positions, axis=1) > 0
+        self.assertTrue(moved[3])
+        self.assertGreater(self.sim.velocities[3, 0], 0)
+        self.assertEqual(moved.sum(), 1)
+        self.assertEqual(set(self.sim.timings), {'update_forces', 'step', 'update_positions', 'contacts'})
+
+    def test_forces_are_mapped_by_agent_id(self):
+        # forces computed before agent 0 was swap-removed: agent 49 now sits in slot 0
+        agent_ids = np.arange(self.num_agents, dtype=np.int32)
+        forces = np.zeros((self.num_agents, 2), dtype=np.float32)
+        forces[49] = (1000, 0)
+        self.queues['eco_to_box2d'].put({'action': 'remove', 'agent_id': 0})
+        self.sim.process_ecosystem_queue()
+        self.sim.update_positions()
+        start_positions = self.sim.positions[:self.sim.current_agent_count].copy()
+        self.sim.apply_forces(forces, agent_ids)
+        self.sim.step()
+        self.sim.update_positions()
+        moved = np.linalg.norm(self.sim.positions[:self.sim.current_agent_count] - start_positions, axis=1) > 0
+        self.assertEqual(list(np.where(moved)[0]), [self.sim.id_to_index[49]])
+
+    def test_body_table_follows_agent_ids(self):
+        self.sim.update_positions()
+        self.queues['eco_to_box2d'].put({'action': 'remove', 'agent_id': 7, 'current_agent_count': self.num_agents - 1})
+        self.queues['eco_to_box2d'].put({'action': 'add', 'agent_id': 7, 'species': 1, 'position': (10.0, 20.0),
+                                         'velocity': (0, 0), 'current_agent_count': self.num_agents})
+        self.sim.process_ecosystem_queue()
+        self.sim.update_positions()
+        count = self.sim.current_agent_count
+        self.assertEqual(count, self.num_agents)
+        self.assertEqual(len(self.sim.body_list), count)
+        for index, agent_id in enumerate(self.sim.agent_ids[:count]):
+            self.assertEqual(self.sim.id_to_index[agent_id], index)
+        index = self.sim.id_to_index[7]
+        np.testing.assert_allclose(self.sim.positions[index], (10.0, 20.0))
+
+    def test_swap_remove_matches_agents_data_order(self):
+        expected = list(range(self.num_agents))
+        for agent_id in (7, 0, 49, 20):
+            self.queues['eco_to_box2d'].put({'action': 'remove', 'agent_id': agent_id})
+            index = expected.index(agent_id)
+            expected[index] = expected[-1]
+            expected.pop()
+        self.sim.process_ecosystem_queue()
+        np.testing.assert_array_equal(self.sim.agent_ids[:self.sim.current_agent_count], expected)
+        self.assertEqual(self.sim.id_to_index[7], -1)
+        self.assertTrue(np.all(self.sim.agent_ids[self.sim.current_agent_count:] == -1))
+
+    def test_force_age_is_measured_from_the_positions_frame(self):
+        self.sim.update()
+        positions = self.queues['box2d_to_tf'].get_nowait()
+        self.assertEqual(positions['frame'], self.sim.frame)
+        self.sim.update()
+        self.sim.force_age.reset()
+        forces = np.zeros((self.num_agents, 2), dtype=np.float32)
+        self.queues['tf_to_box2d'].put({'forces': forces, 'agent_ids': self.sim.agent_ids[:self.num_agents].copy(),
+                                        'current_agent_count': self.num_agents,
+                                        'frame': positions['frame'], 'timestamp': positions['timestamp']})
+        self.sim.update()
+        self.sim.update()
+        # computed from the positions one frame before the latest
+        self.assertEqual(self.sim.force_age.frame_counts.tolist(), [0, 1, 0, 0, 0, 0, 0, 0])
+        self.assertEqual((self.sim.force_age.ticks, self.sim.force_age.ticks_without_forces), (2, 1))
+
+    def test_only_the_newest_forces_are_applied_per_tick(self):
+        shared = SharedFrameBuffer(self.sim.max_agents_num, {'forces': ('f', 2), 'agent_ids': ('i', 1)})
+        apply_forces = self.sim.apply_forces
+        for channel in (Queue(), shared):
+            with self.subTest(channel=type(channel).__name__):
+                self.sim._tf_to_box2d = channel
+                applied = []
+                self.sim.apply_forces = lambda forces, agent_ids=None: (applied.append(forces[0, 0]), apply_forces(forces, agent_ids))
+                self.sim.update()
+                self.sim.force_age.reset()
+                agent_ids = self.sim.agent_ids[:self.num_agents].copy()
+                # several force frames arrive between ticks
+                for tick in range(3):
+                    for value in range(4):
+                        forces = np.full((self.num_agents, 2), tick * 10 + value, dtype=np.float32)
+                        channel.put({'forces': forces, 'agent_ids': agent_ids, 'current_agent_count': self.num_agents,
+                                     'frame': self.sim.frame - 1, 'timestamp': self.sim.frame_time})
+                    self.sim.update()
+                self.sim.update()
+                self.assertEqual(applied, [3, 13, 23])
+                self.assertEqual(self.sim.force_age.frame_counts.sum(), 3)
+                self.assertEqual((self.sim.force_age.ticks, self.sim.force_age.ticks_without_forces), (4, 1))
+
+    def test_substeps_keep_forces_for_the_whole_tick(self):
+        forces = np.zeros((self.sim.max_agents_num, 2), dtype=np.float32)
+        forces[3] = (1000, 0)
+        self.sim.apply_forces(forces)
+        self.sim.step()
+        self.sim.update_positions()
+        single_velocity = self.sim.velocities[3, 0]
+
+        sim = Box2DSimulation(make_queues())
+        sim.substeps = 4
+        sim._add_slot(0, int(self.sim.species[3]), (1000.0, 1000.0))
+        sim.apply_forces(forces[3:4])
+        sim.step()
+        sim.update_positions()
+        self.assertAlmostEqual(sim.velocities[0, 0], single_velocity, delta=abs(single_velocity) * 0.05)
+        # the force is cleared after the tick
+        velocity = sim.velocities[0, 0]
+        sim.step()
+        sim.update_positions()
+        self.assertLess(sim.velocities[0, 0], velocity)
+
+class TestContactRecording(unittest.TestCase):
+    def setUp(self):
+        self.queues = make_queues()
+        self.sim = Box2DSimulation(self.queues)
+        rng = np.random.default_rng(2)
+        num_agents = 200
+        self.queues['eco_to_box2d_init'].put({
+            'positions': rng.uniform(900, 1100, (num_agents, 2)).astype(np.float32),
+            'velocities': np.zeros((num_agents, 2), dtype=np.float32),
+            'species': rng.integers(1, 9, num_agents).astype(np.int32),
+            'agent_ids': np.arange(num_agents, dtype=np.int32),
+            'current_agent_count': num_agents
+        })
+        self.sim.initialize()
+        self.sim.contact_recorder.pairs = np.empty((8, 2), dtype=np.int32)
+
+    def brute_force_touching(self):
+        count = self.sim.current_agent_count
+        positions = self.sim.positions[:count]
+        radii = self.sim.radius_table[self.sim.species[:count]]
+        distance = np.linalg.norm(positions[:, None] - positions[None, :], axis=2)
+        first, second = np.nonzero(np.triu(distance < radii[:, None] + radii[None, :], 1))
+        ids = self.sim.agent_ids[:count]
+        return {tuple(sorted((int(ids[a]), int(ids[b])))) for a, b in zip(first, second)}
+
+    def test_pairs_match_brute_force(self):
+        self.sim.update()
+        expected = self.brute_force_touching()
+        self.assertGreater(len(expected), 8)  # the buffer grew
+        self.assertEqual(self.sim.contact_recorder.contact_count, len(expected))
+        collisions = self.queues['box2d_to_eco_collisions'].get_nowait()['collisions']
+        self.assertEqual(collisions.dtype, np.int32)
+        self.assertEqual({tuple(pair) for pair in collisions.tolist()}, expected)
+
+    def test_only_new_contacts_are_reported(self):
+        self.sim.update()
+        touching = self.brute_force_touching()
+        self.queues['box2d_to_eco_collisions'].get_nowait()
+        self.sim.update()
+        now_touching = self.brute_force_touching()
+        collisions = self.queues['box2d_to_eco_collisions'].get_nowait()['collisions'] \
+            if not self.queues['box2d_to_eco_collisions'].empty() else np.zeros((0, 2), dtype=np.int32)
+        self.assertEqual({tuple(pair) for pair in collisions.tolist()}, now_touching - touching)
+
+    def test_pairs_are_kept_until_taken(self):
+        self.queues['box2d_to_eco_collisions'] = Queue(maxsize=1)
+        self.sim._box2d_to_eco_collisions = self.queues['box2d_to_eco_collisions']
+        self.queues['box2d_to_eco_collisions'].put({'collisions': np.zeros((0, 2), dtype=np.int32)})
+        self.sim.update()
+        pending = self.sim.contact_recorder.count
+        self.assertGreater(pending, 0)
+        self.queues['box2d_to_eco_collisions'].get_nowait()
+        self.sim.update()
+        self.assertEqual(self.sim.contact_recorder.count, 0)
+        self.assertGreaterEqual(len(self.queues['box2d_to_eco_collisions'].get_nowait()['collisions']), pending)
+
+    def test_recording_can_be_disabled(self):
+        self.sim.update()
+        self.assertGreater(self.sim.contact_recorder.max_penetration, 0)
+        self.queues['box2d_to_eco_collisions'].get_nowait()
+        self.sim.set_contact_recording(False)
+        self.sim.update()
+        self.assertEqual(self.sim.contact_recorder.contact_count, 0)
+        self.assertEqual(self.sim.contact_recorder.max_penetration, 0)
+        self.assertTrue(self.queues['box2d_to_eco_collisions'].empty())
+
+    def test_adaptive_iterations_search_once_per_window_without_recording(self):
+        self.sim.solver_iterations = SolverIterations(8, 3, budget_ms=1000, max_penetration=0.05, window=4)
+        self.sim.set_contact_recording(False)
+        searches = []
+        touching_pairs = self.sim.contact_recorder.touching_pairs
+        self.sim.contact_recorder.touching_pairs = lambda *args: (searches.append(1), touching_pairs(*args))[1]
+        for _ in range(8):
+            self.sim.update()
+        self.assertEqual(len(searches), 2)
+        self.assertGreater(self.sim.solver_iterations.penetration, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import random
+import tempfile
+import unittest
+import numpy as np
+from queue import Queue
+from ecosystem import Ecosystem
+from box2d_simulation import Box2DSimulation
+from checkpoint import save_checkpoint, load_checkpoint
+
+def make_queues():
+    return {
+        'eco_to_box2d': Queue(),
+        'eco_to_visual': Queue(),
+        'eco_to_box2d_init': Queue(),
+        'eco_to_visual_init': Queue(),
+        'eco_to_tf_init': Queue(),
+        'eco_to_tf': Queue(),
+        'box2d_to_eco': Queue(),
+        'tf_to_box2d': Queue(),
+        'box2d_to_tf': Queue(),
+        'box2d_to_visual_render': Queue(),
+        'box2d_to_eco_collisions': Queue()
+    }
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(3)
+        random.seed(3)
+        self.path = os.path.join(tempfile.mkdtemp(), 'world.npz')
+        self.eco = Ecosystem(make_queues())
+        self.eco.initialize()
+        ad = self.eco.ad
+        ad.agents['velocity'][:ad.current_agent_count] = np.random.uniform(-1, 1, (ad.current_agent_count, 2))
+        # free a few ids so the allocator state is not trivial
+        for agent_id in (5, 17, 2):
+            ad.remove_agent(agent_id)
+        self.eco.env_energy = 1234.5
+
+    def test_round_trip_restores_agents_and_allocator(self):
+        ad = self.eco.ad
+        save_checkpoint(self.path, self.eco)
+        queues = make_queues()
+        restored = Ecosystem(queues)
+        restored.initialize(self.path)
+        count = ad.current_agent_count
+        self.assertEqual(restored.ad.current_agent_count, count)
+        np.testing.assert_array_equal(restored.ad.agents[:count], ad.agents[:count])
+        self.assertEqual(restored.ad.next_id, ad.next_id)
+        self.assertEqual(restored.ad.available_ids, ad.available_ids)
+        self.assertEqual(restored.env_energy, 1234.5)
+        np.testing.assert_array_equal(restored.ad.id_to_index, ad.id_to_index)
+        # the next allocated id is the same as in the original run
+        self.assertEqual(restored.ad.add_agent(1, (0.0, 0.0)), ad.add_agent(1, (0.0, 0.0)))
+        # Box2D gets the positions and velocities in one init message
+        init_data = queues['eco_to_box2d_init'].get_nowait()
+        self.assertEqual(init_data['current_agent_count'], count)
+        np.testing.assert_array_equal(init_data['velocities'], ad.agents['velocity'][:count])
+
+    def test_velocities_follow_agent_ids_when_the_order_changes(self):
+        queues = make_queues()
+        eco = Ecosystem(queues)
+        eco.initialize()
+        ad = eco.ad
+        box2d = Box2DSimulation(queues)
+        box2d.initialize()
+        for index, body in enumerate(box2d.body_list):
+            body.linearVelocity = (index, -index)
+        box2d.update_positions()
+        box2d.send_data_to_eco_visual()
+        ad.update()
+        # one death and one birth, then a frame Box2D sends before it applies the batch
+        ad.agents['life_energy'][0] = 0
+        ad.check_deaths()
+        newborn_id = ad.add_agent(1, (500.0, 500.0))
+        ad.flush_agent_events()
+        box2d.send_data_to_eco_visual()
+        ad.update()
+        save_checkpoint(self.path, eco)
+        agents = load_checkpoint(self.path)['agents']
+        survivors = agents[agents['id'] != newborn_id]
+        np.testing.assert_array_equal(survivors['velocity'], box2d.velocities[box2d.id_to_index[survivors['id']]])
+        np.testing.assert_array_equal(agents[agents['id'] == newborn_id]['velocity'], [[0.0, 0.0]])
+
+    def test_random_states_continue(self):
+        save_checkpoint(self.path, self.eco)
+        expected = (random.random(), np.random.random(3))
+        random.seed(99)
+        np.random.seed(99)
+        Ecosystem(make_queues()).initialize(self.path)
+        self.assertEqual(random.random(), expected[0])
+        np.testing.assert_array_equal(np.random.random(3), expected[1])
+
+    def test_checkpoint_is_compact_and_needs_no_pickle(self):
+        save_checkpoint(self.path, self.eco)
+        state = load_checkpoint(self.path)
+        self.assertEqual(len(state['agents']), self.eco.ad.current_agent_count)
+        self.assertFalse(os.path.exists(self.path + '.tmp.npz'))
+
+    def test_too_small_world_is_rejected(self):
+        save_checkpoint(self.path, self.eco)
+        eco = Ecosystem(make_queues())
+        eco.ad.max_agents_num = 10
+        with self.assertRaises(ValueError):
+            eco.initialize(self.path)
+
+if __name__ == '__main__':
+    unittest.main()
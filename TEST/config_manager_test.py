@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 from config_manager import ConfigManager, DNASpecies
 
 class TestConfigManager(unittest.TestCase):
@@ -69,6 +70,18 @@ class TestConfigManager(unittest.TestCase):
         except Exception as e:
             self.fail(f"display methods raised {type(e).__name__} unexpectedly!")
 
+    def test_species_trait_tables(self):
+        radius = self.config_manager.get_species_trait_table('RADIUS')
+        self.assertEqual(radius.shape, (9,))
+        for species in range(1, 9):
+            self.assertAlmostEqual(float(radius[species]), self.config_manager.get_species_trait_value('RADIUS', species), places=5)
+        species = np.array([3, 1, 3, 8])
+        np.testing.assert_array_equal(self.config_manager.species_traits['PREDATOR_SPECIES'][species], [4, 2, 4, 1])
+        self.assertEqual(self.config_manager.species_traits['SIZE'].dtype, np.float32)
+        self.assertNotIn('FORCE_BACKEND', self.config_manager.species_traits)
+        with self.assertRaises(KeyError):
+            self.config_manager.get_species_trait_table('BACKGROUND_COLOR')
+
 if __name__ == '__main__':
     config_manager = ConfigManager()
     print("Displaying Environment Variables:")
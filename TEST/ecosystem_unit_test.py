@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+from queue import Queue
+from ecosystem import Ecosystem
+
+def make_queues():
+    return {
+        'eco_to_box2d': Queue(),
+        'eco_to_visual': Queue(),
+        'eco_to_box2d_init': Queue(),
+        'eco_to_visual_init': Queue(),
+        'eco_to_tf_init': Queue(),
+        'eco_to_tf': Queue(),
+        'box2d_to_eco': Queue(),
+        'tf_to_box2d': Queue(),
+        'box2d_to_tf': Queue(),
+        'box2d_to_visual_render': Queue(),
+        'box2d_to_eco_collisions': Queue()
+    }
+
+class TestEcosystemCollisions(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.eco = Ecosystem(make_queues())
+        self.ad = self.eco.ad
+        # species 2 eats species 1, species 3 eats species 2
+        for species in (2, 1, 1, 2, 3, 1, 1, 1):
+            self.ad.add_agent_no_notify(species, (0.0, 0.0))
+        self.ad.agents['life_energy'][:8] = [100, 10, 20, 100, 300, 50, 40, 30]
+        self.ad.agents['life_gain'][:8] = 1000
+
+    def energy(self, agent_id):
+        return float(self.ad.agents['life_energy'][self.ad.id_to_index[agent_id]])
+
+    def test_predation_transfers_energy_once_per_prey(self):
+        # prey 1 touches predators 0 and 3: only the first pair counts
+        self.eco.resolve_collisions(np.array([[0, 1], [1, 3], [3, 2]], dtype=np.int32))
+        self.assertEqual(self.energy(1), 0)
+        self.assertEqual(self.energy(2), 0)
+        self.assertEqual(self.energy(0), 110)
+        self.assertEqual(self.energy(3), 120)
+
+    def test_eaten_predator_does_not_eat(self):
+        # 3 eats 0 (species 2), so 0 cannot eat 1 in the same tick
+        self.eco.resolve_collisions(np.array([[0, 1], [4, 0]], dtype=np.int32))
+        self.assertEqual(self.energy(0), 0)
+        self.assertEqual(self.energy(4), 400)
+        self.assertEqual(self.energy(1), 10)
+
+    def test_sharing_first_occurrence(self):
+        self.eco.sharing_energy_rate = np.ones(9, dtype=np.float32)
+        # 5 is in two sharing pairs: only (5, 6) is applied
+        self.eco.resolve_collisions(np.array([[5, 6], [7, 5]], dtype=np.int32))
+        # the richer agent gives min(life_gain, difference)
+        self.assertEqual(self.energy(5), 40)
+        self.assertEqual(self.energy(6), 50)
+        self.assertEqual(self.energy(7), 30)
+
+    def test_unknown_ids_are_ignored(self):
+        self.eco.resolve_collisions(np.array([[0, 1000], [-1, 2]], dtype=np.int32))
+        self.eco.resolve_collisions(np.zeros((0, 2), dtype=np.int32))
+        np.testing.assert_array_equal(self.ad.agents['life_energy'][:8], [100, 10, 20, 100, 300, 50, 40, 30])
+
+    def test_collisions_from_queue(self):
+        self.eco._box2d_to_eco_collisions.put({'collisions': np.array([[0, 2]], dtype=np.int32)})
+        self.eco.process_collisions()
+        self.assertEqual(self.energy(0), 120)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+from force_age import ForceAgeHistogram
+
+class TestForceAgeHistogram(unittest.TestCase):
+    def test_ages_fall_into_buckets(self):
+        histogram = ForceAgeHistogram()
+        for age_frames, age_ms in ((0, 1.0), (1, 6.0), (1, 12.0), (7, 60.0), (25, 900.0)):
+            histogram.record(age_frames, age_ms)
+        self.assertEqual(histogram.frame_counts.tolist(), [1, 2, 0, 0, 0, 1, 0, 1])
+        self.assertEqual(histogram.ms_counts.tolist(), [1, 1, 1, 0, 1, 0, 0, 1])
+
+    def test_summary_counts_ticks_without_forces(self):
+        histogram = ForceAgeHistogram()
+        self.assertIn("no forces", histogram.summary())
+        histogram.record(1, 8.0)
+        histogram.record_tick(True)
+        histogram.record_tick(False)
+        summary = histogram.summary()
+        self.assertIn("1f:1", summary)
+        self.assertIn("<10ms:1", summary)
+        self.assertIn("1/2", summary)
+        histogram.reset()
+        self.assertEqual(histogram.ticks, 0)
+        self.assertEqual(histogram.frame_counts.sum(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+import numpy as np
+from queue import Empty
+from local_queue import LocalQueue
+
+class TestLocalQueue(unittest.TestCase):
+    def test_fifo(self):
+        queue = LocalQueue()
+        for i in range(3):
+            queue.put({'action': 'batch', 'index': i})
+        self.assertEqual(queue.qsize(), 3)
+        self.assertEqual([queue.get_nowait()['index'] for _ in range(3)], [0, 1, 2])
+        self.assertTrue(queue.empty())
+        with self.assertRaises(Empty):
+            queue.get(timeout=0.1)
+
+    def test_latest_only_keeps_newest_by_reference(self):
+        queue = LocalQueue(latest_only=True)
+        positions = np.zeros((5, 2), dtype=np.float32)
+        queue.put({'positions': np.ones((5, 2))})
+        queue.put({'positions': positions})
+        self.assertIs(queue.get_nowait()['positions'], positions)
+        self.assertTrue(queue.empty())
+
+if __name__ == '__main__':
+    unittest.main()
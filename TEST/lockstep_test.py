@@ -0,0 +1,42 @@
+import unittest
+import threading
+import multiprocessing as mp
+from lockstep import LockstepScheduler
+from timer import Timer
+
+class TestLockstepScheduler(unittest.TestCase):
+    def test_stages_run_in_order(self):
+        scheduler = LockstepScheduler(dt=0.5, report_interval=1000)
+        running = mp.Value('b', True)
+        order = []
+
+        def worker(name):
+            stage = scheduler.stage(name)
+            while stage.wait(running):
+                order.append((scheduler.tick.value, name))
+                stage.finish()
+
+        threads = [threading.Thread(target=worker, args=(name,)) for name in reversed(LockstepScheduler.STAGES)]
+        for thread in threads:
+            thread.start()
+        for _ in range(3):
+            self.assertTrue(scheduler.run_tick(running))
+        running.value = False
+        for thread in threads:
+            thread.join()
+
+        expected = [(tick, name) for tick in range(3) for name in LockstepScheduler.STAGES]
+        self.assertEqual(order, expected)
+        self.assertEqual(scheduler.sim_time(), 1.5)
+        self.assertEqual([len(values) for values in scheduler.latency.values()], [3, 3, 3])
+
+    def test_timer_follows_simulated_time(self):
+        now = [0.0]
+        timer = Timer("sim", time_func=lambda: now[0])
+        self.assertFalse(timer.interval_timer(1))
+        now[0] = 1.0
+        self.assertTrue(timer.interval_timer(1))
+        self.assertFalse(timer.interval_timer(1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import logging
+import tempfile
+import unittest
+from log import SimulationLogger, RateLimitFilter
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def make_record(lineno, msg='message'):
+    return logging.LogRecord('SimulationLogger', logging.WARNING, 'file.py', lineno, msg, None, None)
+
+class TestRateLimitFilter(unittest.TestCase):
+    def test_limit_per_call_site(self):
+        rate_limit = RateLimitFilter(2)
+        passed = [rate_limit.filter(make_record(10)) for _ in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+        # another call site has its own budget
+        self.assertTrue(rate_limit.filter(make_record(11)))
+
+    def test_suppressed_count_is_reported(self):
+        rate_limit = RateLimitFilter(1)
+        rate_limit.filter(make_record(10))
+        rate_limit.filter(make_record(10))
+        rate_limit.filter(make_record(10))
+        rate_limit._sites[('file.py', 10)][0] -= 1.0  # next window
+        record = make_record(10)
+        self.assertTrue(rate_limit.filter(record))
+        self.assertEqual(record.msg, "message (suppressed 2 similar messages)")
+
+    def test_zero_disables_the_limit(self):
+        rate_limit = RateLimitFilter(0)
+        self.assertTrue(all(rate_limit.filter(make_record(10)) for _ in range(100)))
+
+class TestSimulationLogger(unittest.TestCase):
+    def setUp(self):
+        # keep the file handlers of this logger out of the real logs/ directory
+        self.log_dir = tempfile.TemporaryDirectory()
+        self.simulation_logger = SimulationLogger(log_dir=self.log_dir.name)
+        self.file_handlers = self.simulation_logger.handlers
+        self.handler = ListHandler()
+        self.simulation_logger.handlers = [self.handler]
+        for handler in list(self.simulation_logger.logger.handlers):
+            self.simulation_logger.logger.removeHandler(handler)
+        self.simulation_logger.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.simulation_logger.stop_async_logging()
+        for handler in self.file_handlers:
+            handler.close()
+        self.log_dir.cleanup()
+
+    def test_get_logger_does_not_stack_filters(self):
+        filters = len(self.simulation_logger.logger.filters)
+        first = self.simulation_logger.get_logger('First')
+        second = self.simulation_logger.get_logger('Second')
+        self.assertIs(self.simulation_logger.get_logger('First'), first)
+        self.assertEqual(len(self.simulation_logger.logger.filters), filters)
+        first.warning("from first")
+        second.warning("from second")
+        self.assertEqual([record.classname for record in self.handler.records[-2:]], ['First', 'Second'])
+
+    def test_async_logging_writes_from_the_listener_thread(self):
+        self.simulation_logger.start_async_logging()
+        self.assertNotIn(self.handler, self.simulation_logger.logger.handlers)
+        logger = self.simulation_logger.get_logger('Async')
+        for index in range(3):
+            logger.warning("record %d", index)
+        self.simulation_logger.stop_async_logging()
+        self.assertEqual([record.getMessage() for record in self.handler.records[-3:]],
+                         ['record 0', 'record 1', 'record 2'])
+        self.assertIn(self.handler, self.simulation_logger.logger.handlers)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import pickle
+import unittest
+import multiprocessing as mp
+from metrics import MetricsRegistry, NullMetrics, simulation_metrics
+from metrics_viewer import render
+
+NAME = 'yaorozu_metrics_test'
+
+def write_from_child(metrics):
+    metrics.inc('Box2D.ticks', 3)
+    metrics.observe('Box2D.step', 4.0)
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry(['ticks'], ['agents'], ['step'], edges=(1, 2, 5, 10), name=NAME)
+
+    def tearDown(self):
+        self.metrics.close()
+
+    def test_counters_and_gauges(self):
+        self.metrics.inc('ticks')
+        self.metrics.inc('ticks', 2)
+        self.metrics.set('agents', 800)
+        self.assertEqual(self.metrics.get('ticks'), 3)
+        self.assertEqual(self.metrics.get('agents'), 800)
+
+    def test_histogram_buckets_and_percentiles(self):
+        for value in (0.5, 1.5, 1.8, 3, 4, 7, 50):
+            self.metrics.observe('step', value)
+        buckets, count, total = self.metrics.histogram('step')
+        self.assertEqual(buckets.tolist(), [1, 2, 2, 1, 1])
+        self.assertEqual(count, 7)
+        self.assertAlmostEqual(total, 67.8)
+        self.assertEqual(self.metrics.percentile('step', 50), 5)
+        self.assertEqual(self.metrics.percentile('step', 99), float('inf'))
+
+    def test_viewer_attaches_by_name(self):
+        self.metrics.inc('ticks', 5)
+        self.metrics.observe('step', 3)
+        viewer = MetricsRegistry.attach(NAME)
+        self.assertEqual(viewer.layout['gauges'], ['agents'])
+        self.assertEqual(viewer.get('ticks'), 5)
+        self.assertEqual(viewer.histogram('step')[1], 1)
+        viewer.close()
+        # the owner's block is still there
+        self.assertEqual(MetricsRegistry.attach(NAME).get('ticks'), 5)
+
+    def test_viewer_renders_rates_and_percentiles(self):
+        previous = {'ticks': 0}
+        self.metrics.inc('ticks', 10)
+        self.metrics.observe('step', 3)
+        text = render(self.metrics, previous, 2.0)
+        ticks_line = next(line for line in text.splitlines() if line.startswith('ticks'))
+        self.assertEqual(ticks_line.split()[1:], ['10', '5.0'])
+        step_line = next(line for line in text.splitlines() if line.split()[:2] == ['step', '1'])
+        self.assertEqual(step_line.split()[1:], ['1', '3.00', '5', '5'])
+
+    def test_duplicate_names_are_rejected(self):
+        with self.assertRaises(ValueError):
+            MetricsRegistry(['ticks'], ['ticks'], name=NAME + '_duplicate')
+
+    def test_null_metrics_accepts_everything(self):
+        metrics = NullMetrics()
+        metrics.inc('anything')
+        metrics.set('anything', 1)
+        metrics.observe('anything', 1)
+
+class TestSimulationMetrics(unittest.TestCase):
+    def test_child_process_writes_are_visible(self):
+        metrics = simulation_metrics(['eco_to_box2d'], name=NAME + '_simulation')
+        try:
+            self.assertIn('queue.eco_to_box2d', metrics.layout['gauges'])
+            # a spawned child unpickles the registry and attaches by name
+            child = pickle.loads(pickle.dumps(metrics))
+            write_from_child(child)
+            process = mp.get_context('spawn').Process(target=write_from_child, args=(metrics,))
+            process.start()
+            process.join()
+            self.assertEqual(metrics.get('Box2D.ticks'), 6)
+            self.assertEqual(metrics.histogram('Box2D.step')[1], 2)
+        finally:
+            metrics.close()
+
+if __name__ == '__main__':
+    unittest.main()
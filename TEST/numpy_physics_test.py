@@ -0,0 +1,97 @@
+import unittest
+import numpy as np
+from queue import Queue
+from numpy_physics import NumpyPhysicsSimulation
+
+def make_queues():
+    return {
+        'eco_to_box2d_init': Queue(),
+        'eco_to_box2d': Queue(),
+        'tf_to_box2d': Queue(),
+        'box2d_to_tf': Queue(),
+        'box2d_to_eco': Queue(),
+        'box2d_to_visual_render': Queue(),
+        'box2d_to_eco_collisions': Queue()
+    }
+
+class TestNumpyPhysicsSimulation(unittest.TestCase):
+    def setUp(self):
+        self.queues = make_queues()
+        self.sim = NumpyPhysicsSimulation(self.queues)
+
+    def init_agents(self, positions, species=None):
+        positions = np.asarray(positions, dtype=np.float32)
+        count = len(positions)
+        if species is None:
+            species = np.ones(count, dtype=np.int32)
+        self.queues['eco_to_box2d_init'].put({
+            'positions': positions,
+            'velocities': np.zeros((count, 2), dtype=np.float32),
+            'species': np.asarray(species, dtype=np.int32),
+            'agent_ids': np.arange(count, dtype=np.int32),
+            'current_agent_count': count
+        })
+        self.sim.initialize()
+
+    def test_force_accelerates_only_its_agent(self):
+        self.init_agents([(100, 100), (500, 500), (900, 900)])
+        forces = np.zeros((self.sim.max_agents_num, 2), dtype=np.float32)
+        forces[1] = (1000, 0)
+        start_positions = self.sim.positions[:3].copy()
+        self.queues['tf_to_box2d'].put({'forces': forces, 'current_agent_count': 3})
+        self.sim.update()
+        moved = np.linalg.norm(self.sim.positions[:3] - start_positions, axis=1) > 0
+        self.assertEqual(list(np.where(moved)[0]), [1])
+        self.assertGreater(self.sim.velocities[1, 0], 0)
+        # forces act for one step only
+        velocity = self.sim.velocities[1].copy()
+        self.sim.step()
+        self.assertLessEqual(self.sim.velocities[1, 0], velocity[0])
+
+    def test_damping_slows_free_agents(self):
+        self.init_agents([(500, 500)])
+        self.sim.velocities[0] = (10, 0)
+        self.sim.step()
+        self.assertLess(self.sim.velocities[0, 0], 10)
+        self.assertGreater(self.sim.velocities[0, 0], 0)
+
+    def test_overlapping_agents_are_pushed_apart(self):
+        radius = float(self.sim.radius_table[1])
+        self.init_agents([(500, 500), (500 + radius, 500)])
+        start_distance = radius
+        for _ in range(30):
+            self.sim.step()
+        distance = np.linalg.norm(self.sim.positions[1] - self.sim.positions[0])
+        self.assertGreater(distance, start_distance)
+        # pushed symmetrically along x
+        self.assertLess(self.sim.positions[0, 0], 500)
+        self.assertGreater(self.sim.positions[1, 0], 500 + radius)
+
+    def test_approaching_velocity_is_removed_on_contact(self):
+        radius = float(self.sim.radius_table[1])
+        self.init_agents([(500, 500), (500 + 1.9 * radius, 500)])
+        self.sim.velocities[0] = (5, 0)
+        self.sim.velocities[1] = (-5, 0)
+        self.sim.step()
+        self.assertLessEqual(self.sim.velocities[1, 0] - self.sim.velocities[0, 0], 1e-4)
+
+    def test_forces_are_mapped_by_agent_id(self):
+        self.init_agents(np.random.default_rng(0).uniform(0, 2000, (50, 2)))
+        forces = np.zeros((50, 2), dtype=np.float32)
+        forces[49] = (1000, 0)
+        self.queues['eco_to_box2d'].put({'action': 'remove', 'agent_id': 0})
+        self.sim.process_ecosystem_queue()
+        self.sim.apply_forces(forces, np.arange(50, dtype=np.int32))
+        self.assertEqual(list(np.where(self.sim.forces[:self.sim.current_agent_count, 0] > 0)[0]),
+                         [self.sim.id_to_index[49]])
+
+    def test_touching_agents_are_reported(self):
+        radius = float(self.sim.radius_table[1])
+        self.init_agents([(500, 500), (500 + radius, 500), (1500, 1500)])
+        self.queues['tf_to_box2d'].put({'forces': np.zeros((3, 2), dtype=np.float32), 'current_agent_count': 3})
+        self.sim.update()
+        collisions = self.queues['box2d_to_eco_collisions'].get_nowait()
+        self.assertEqual([tuple(pair) for pair in collisions['collisions'].tolist()], [(0, 1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import numpy as np
+from queue import Queue
+from numpy_simulation import NumpySimulation
+
+def make_queues():
+    return {
+        'ui_to_tensorflow': Queue(),
+        'box2d_to_tf': Queue(),
+        'eco_to_tf_init': Queue(),
+        'eco_to_tf': Queue(),
+        'tf_to_box2d': Queue()
+    }
+
+class TestNumpySimulation(unittest.TestCase):
+    def setUp(self):
+        self.queues = make_queues()
+        self.sim = NumpySimulation(self.queues, max_agents=1500)
+        rng = np.random.default_rng(1)
+        self.num_agents = 1200
+        positions = np.zeros((1500, 2), dtype=np.float32)
+        positions[:self.num_agents] = rng.uniform(-200, 2200, (self.num_agents, 2))
+        species = np.zeros(1500, dtype=np.int32)
+        species[:self.num_agents] = rng.integers(1, 9, self.num_agents)
+        self.queues['eco_to_tf_init'].put({
+            'positions': positions,
+            'species': species,
+            'current_agent_count': self.num_agents
+        })
+        self.sim.initialize()
+
+    def test_grid_matches_dense(self):
+        positions = self.sim.positions[:self.num_agents]
+        dense_separation, dense_cohesion = self.sim._dense_separation_cohesion(positions)
+        grid_separation, grid_cohesion = self.sim._grid_separation_cohesion(positions)
+        np.testing.assert_allclose(grid_separation, dense_separation, atol=1e-3)
+        np.testing.assert_allclose(grid_cohesion, dense_cohesion, atol=1e-2)
+
+    def test_tiled_matches_dense(self):
+        positions = self.sim.positions[:self.num_agents]
+        self.sim.force_tile_size = 100
+        dense_separation, dense_cohesion = self.sim._dense_separation_cohesion(positions)
+        tiled_separation, tiled_cohesion = self.sim._tiled_separation_cohesion(positions)
+        np.testing.assert_allclose(tiled_separation, dense_separation, atol=1e-2)
+        np.testing.assert_allclose(tiled_cohesion, dense_cohesion, atol=1e-2)
+
+    def test_predator_prey_chases_nearest_prey(self):
+        positions = np.array([[500, 500], [505, 500], [520, 500], [1500, 1500]], dtype=np.float32)
+        predator = 2
+        prey = self.sim.prey_species[predator - 1]
+        species = np.array([predator, prey, prey, prey], dtype=np.int32)
+        forces = self.sim._predator_prey_forces(positions, species)
+        chase = np.array([self.sim.chase_weight, 0], dtype=np.float32)
+        np.testing.assert_allclose(forces[0], chase, atol=1e-4)
+        escape = np.array([self.sim.escape_weight, 0], dtype=np.float32)
+        np.testing.assert_allclose(forces[1], escape, atol=1e-4)  # the prey runs away from the predator
+        np.testing.assert_allclose(forces[3], [0, 0])
+
+    def test_update_sends_padded_forces(self):
+        self.sim.update()
+        data = self.queues['tf_to_box2d'].get_nowait()
+        self.assertEqual(data['forces'].shape, (1500, 2))
+        self.assertEqual(data['current_agent_count'], self.num_agents)
+        self.assertTrue(np.all(data['forces'][self.num_agents:] == 0))
+
+    def test_ui_parameter_update(self):
+        self.queues['ui_to_tensorflow'].put(('SEPARATION_WEIGHT', 42.0))
+        self.sim.update_ui_parameters()
+        self.assertEqual(self.sim.separation_weight, 42.0)
+
+    def test_matches_tensorflow_backend(self):
+        try:
+            from tensorflow_simulation import TensorFlowSimulation
+        except ImportError:
+            self.skipTest("TensorFlow is not installed")
+        tf_sim = TensorFlowSimulation(make_queues(), max_agents=1500)
+        tf_sim.tf_positions.assign(self.sim.positions)
+        tf_sim.tf_species.assign(self.sim.species)
+        tf_sim.tf_current_agent_count.assign(self.num_agents)
+        np.testing.assert_allclose(self.sim.calculate_forces(), tf_sim.calculate_forces().numpy(), rtol=1e-3, atol=0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import multiprocessing as mp
+import numpy as np
+from queue import Empty
+from shared_frame_buffer import SharedFrameBuffer
+
+def write_frames(buffer, num_frames):
+    for frame in range(num_frames):
+        positions = np.full((10, 2), frame, dtype=np.float32)
+        buffer.put({'positions': positions, 'agent_ids': np.arange(10, dtype=np.int32), 'current_agent_count': 10})
+
+class TestSharedFrameBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = SharedFrameBuffer(10, {'positions': ('f', 2), 'agent_ids': ('i', 1)})
+
+    def test_empty_until_written(self):
+        self.assertTrue(self.buffer.empty())
+        self.assertIsNone(self.buffer.read())
+        with self.assertRaises(Empty):
+            self.buffer.get_nowait()
+
+    def test_get_returns_latest_frame_once(self):
+        write_frames(self.buffer, 5)
+        data = self.buffer.get_nowait()
+        self.assertEqual(data['current_agent_count'], 10)
+        self.assertEqual(data['frame'], 5)
+        np.testing.assert_array_equal(data['positions'], np.full((10, 2), 4))
+        with self.assertRaises(Empty):
+            self.buffer.get_nowait()
+
+    def test_frame_written_during_get_is_not_returned_twice(self):
+        write_frames(self.buffer, 1)
+        read = self.buffer.read
+        # the writer adds a frame between the emptiness check and the read
+        self.buffer.read = lambda copy=True: (write_frames(self.buffer, 1), read(copy))[1]
+        self.assertEqual(self.buffer.get_nowait()['frame'], 2)
+        self.buffer.read = read
+        with self.assertRaises(Empty):
+            self.buffer.get_nowait()
+
+    def test_partial_count(self):
+        self.buffer.put({'positions': np.ones((10, 2), dtype=np.float32), 'agent_ids': np.arange(10), 'current_agent_count': 3})
+        data = self.buffer.get_nowait()
+        self.assertEqual(data['positions'].shape, (3, 2))
+        self.assertEqual(list(data['agent_ids']), [0, 1, 2])
+
+    def test_views_are_invalidated_when_slot_is_reused(self):
+        write_frames(self.buffer, 1)
+        frame = self.buffer.read(copy=False)
+        self.assertTrue(self.buffer.is_current(frame))
+        write_frames(self.buffer, 3)
+        self.assertFalse(self.buffer.is_current(frame))
+
+    def test_shared_across_processes(self):
+        process = mp.get_context('spawn').Process(target=write_frames, args=(self.buffer, 4))
+        process.start()
+        process.join(timeout=30)
+        data = self.buffer.get_nowait()
+        self.assertEqual(data['frame'], 4)
+        np.testing.assert_array_equal(data['positions'], np.full((10, 2), 3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from solver_iterations import SolverIterations
+
+class TestSolverIterations(unittest.TestCase):
+    def setUp(self):
+        self.policy = SolverIterations(8, 3, budget_ms=5, max_penetration=0.05, window=4)
+
+    def feed(self, step_ms, penetration):
+        changed = False
+        for _ in range(self.policy.window):
+            changed = self.policy.record(step_ms, penetration) or changed
+        return changed
+
+    def test_no_change_inside_the_window(self):
+        for _ in range(self.policy.window - 1):
+            self.assertFalse(self.policy.record(50, 0.0))
+        self.assertEqual((self.policy.velocity_iterations, self.policy.position_iterations), (8, 3))
+
+    def test_over_budget_lowers_iterations_to_the_floor(self):
+        self.assertTrue(self.feed(10, 0.5))
+        self.assertEqual((self.policy.velocity_iterations, self.policy.position_iterations), (6, 2))
+        for _ in range(10):
+            self.feed(10, 0.5)
+        self.assertEqual((self.policy.velocity_iterations, self.policy.position_iterations),
+                         (SolverIterations.MIN_VELOCITY_ITERATIONS, SolverIterations.MIN_POSITION_ITERATIONS))
+
+    def test_penetration_raises_iterations_up_to_the_configured_values(self):
+        self.feed(10, 0.0)
+        self.assertTrue(self.feed(1, 0.2))
+        self.assertEqual((self.policy.velocity_iterations, self.policy.position_iterations), (7, 3))
+        for _ in range(10):
+            self.feed(1, 0.2)
+        self.assertEqual((self.policy.velocity_iterations, self.policy.position_iterations), (8, 3))
+
+    def test_penetration_is_ignored_near_the_budget(self):
+        self.feed(10, 0.0)
+        self.assertFalse(self.feed(4.5, 0.2))
+
+    def test_small_penetration_keeps_iterations(self):
+        self.feed(10, 0.0)
+        self.assertFalse(self.feed(1, 0.01))
+
+    def test_closes_window_on_the_last_step(self):
+        closes = []
+        for _ in range(2 * self.policy.window):
+            closes.append(self.policy.closes_window)
+            self.policy.record(1, 0.0)
+        self.assertEqual(closes, [False, False, False, True] * 2)
+
+if __name__ == '__main__':
+    unittest.main()
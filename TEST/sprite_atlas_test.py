@@ -0,0 +1,39 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import unittest
+import pygame
+from pygame import Vector2
+from creature import Creature
+from sprite_atlas import SpriteAtlas
+
+class TestSpriteAtlas(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pygame.init()
+        cls.atlas = SpriteAtlas(angle_step=10)
+        cls.atlas.build([1, 2])
+
+    def test_frames_per_species(self):
+        self.assertEqual(self.atlas.num_angles, 36)
+        self.assertEqual(len(self.atlas.frames[1]), 36)
+        self.assertEqual(len(self.atlas.flash_frames[2]), 36)
+        stats = self.atlas.memory_stats()
+        self.assertEqual(stats['frames'], 2 * 2 * 36)
+        self.assertGreater(stats['bytes'], 0)
+
+    def test_angles_are_quantized(self):
+        self.assertIs(self.atlas.get_frame(1, 4), self.atlas.get_frame(1, 0))
+        self.assertIs(self.atlas.get_frame(1, 6), self.atlas.get_frame(1, 10))
+        self.assertIs(self.atlas.get_frame(1, 365), self.atlas.get_frame(1, 5))
+        self.assertIs(self.atlas.get_frame(1, -10), self.atlas.get_frame(1, 350))
+        self.assertIsNot(self.atlas.get_frame(1, 0, True), self.atlas.get_frame(1, 0))
+
+    def test_creature_uses_cached_frames(self):
+        creature = Creature(1, Vector2(100, 100), self.atlas)
+        for _ in range(50):
+            creature.update((120, 130))
+            self.assertIn(creature.image, self.atlas.frames[1] + self.atlas.flash_frames[1])
+        self.assertEqual(creature.rect.center, (120, 130))
+
+if __name__ == '__main__':
+    unittest.main()
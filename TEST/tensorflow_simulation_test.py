@@ -0,0 +1,105 @@
+import unittest
+import numpy as np
+import tensorflow as tf
+from queue import Queue
+from tensorflow_simulation import TensorFlowSimulation
+
+class TestTensorFlowSimulationForces(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        queues = {
+            'ui_to_tensorflow': Queue(),
+            'box2d_to_tf': Queue(),
+            'eco_to_tf_init': Queue(),
+            'eco_to_tf': Queue(),
+            'tf_to_box2d': Queue()
+        }
+        cls.sim = TensorFlowSimulation(queues, max_agents=1500)
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.num_agents = 1200
+        positions = rng.uniform(-200, 2200, (self.num_agents, 2)).astype(np.float32)
+        positions[:5] = positions[5]  # coincident agents must be ignored
+        self.positions = tf.constant(positions)
+
+    def test_grid_matches_dense(self):
+        distances = self.sim._calculate_distances(self.positions)
+        dense_separation = self.sim._separation(self.positions, distances)
+        dense_cohesion = self.sim._cohesion(self.positions, distances)
+        grid_separation, grid_cohesion = self.sim._grid_separation_cohesion(self.positions)
+        np.testing.assert_allclose(grid_separation.numpy(), dense_separation.numpy(), atol=1e-3)
+        np.testing.assert_allclose(grid_cohesion.numpy(), dense_cohesion.numpy(), atol=1e-2)
+
+    def test_tiled_matches_dense(self):
+        distances = self.sim._calculate_distances(self.positions)
+        dense_separation = self.sim._separation(self.positions, distances)
+        dense_cohesion = self.sim._cohesion(self.positions, distances)
+        tiled_separation, tiled_cohesion = self.sim._tiled_separation_cohesion(self.positions)
+        self.assertEqual(tiled_separation.shape, (self.num_agents, 2))
+        np.testing.assert_allclose(tiled_separation.numpy(), dense_separation.numpy(), atol=1e-2)
+        np.testing.assert_allclose(tiled_cohesion.numpy(), dense_cohesion.numpy(), atol=1e-2)
+
+    def test_fixed_shape_step_matches_and_does_not_retrace(self):
+        positions = np.zeros((self.sim.max_agents_num, 2), dtype=np.float32)
+        positions[:self.num_agents] = self.positions.numpy()
+        self.sim.tf_positions.assign(positions)
+        compiled_forces = tf.function(self.sim._calculate_fixed_shape_forces, jit_compile=True)
+        for count in (self.num_agents, 700, 1010):
+            self.sim.tf_current_agent_count.assign(count)
+            expected = self.sim.calculate_forces().numpy()
+            forces = compiled_forces().numpy()
+            self.assertEqual(forces.shape, (self.sim.max_agents_num, 2))
+            np.testing.assert_allclose(forces, expected, rtol=1e-3, atol=0.5)
+        self.assertEqual(compiled_forces.experimental_get_tracing_count(), 1)
+
+    def test_predator_prey_finds_nearest_in_range(self):
+        rng = np.random.default_rng(2)
+        species = tf.constant(rng.integers(1, 9, self.num_agents), dtype=tf.int32)
+        self.sim.escape_distance.assign(120.0)
+        self.sim.chase_distance.assign(80.0)
+        try:
+            forces = self.sim._predator_prey_forces(self.positions, species).numpy()
+            expected = self._brute_force_predator_prey(self.positions.numpy(), species.numpy())
+            active = np.ones(self.num_agents, dtype=np.float32)
+            tiled_forces = self.sim._tiled_predator_prey_forces(self.positions, species, active).numpy()
+        finally:
+            config_manager = self.sim.config_manager
+            self.sim.escape_distance.assign(config_manager.get_trait_value('ESCAPE_DISTANCE'))
+            self.sim.chase_distance.assign(config_manager.get_trait_value('CHASE_DISTANCE'))
+        self.assertTrue(np.any(expected != 0))
+        np.testing.assert_allclose(forces, expected, atol=1e-3)
+        np.testing.assert_allclose(tiled_forces, expected, atol=1e-3)
+
+    def _brute_force_predator_prey(self, positions, species):
+        predator_species = self.sim.predator_species.numpy()
+        prey_species = self.sim.prey_species.numpy()
+        distances = np.linalg.norm(positions[:, np.newaxis] - positions, axis=2)
+        forces = np.zeros_like(positions)
+        for i in range(len(positions)):
+            for targets, max_distance, weight, sign in (
+                (predator_species, 120.0, self.sim.escape_weight.numpy(), -1.0),
+                (prey_species, 80.0, self.sim.chase_weight.numpy(), 1.0),
+            ):
+                mask = (species == targets[species[i] - 1]) & (distances[i] < max_distance) & (distances[i] > 0)
+                if mask.any():
+                    j = np.where(mask)[0][np.argmin(distances[i][mask])]
+                    direction = positions[j] - positions[i]
+                    forces[i] += sign * direction / np.linalg.norm(direction) * weight
+        return forces
+
+    def test_grid_follows_distance_parameters(self):
+        self.sim.separation_distance.assign(30.0)
+        self.sim.cohesion_distance.assign(250.0)
+        try:
+            distances = self.sim._calculate_distances(self.positions)
+            dense_cohesion = self.sim._cohesion(self.positions, distances)
+            _, grid_cohesion = self.sim._grid_separation_cohesion(self.positions)
+            np.testing.assert_allclose(grid_cohesion.numpy(), dense_cohesion.numpy(), atol=1e-2)
+        finally:
+            config_manager = self.sim.config_manager
+            self.sim.separation_distance.assign(config_manager.get_trait_value('SEPARATION_DISTANCE'))
+            self.sim.cohesion_distance.assign(config_manager.get_trait_value('COHESION_DISTANCE'))
+
+if __name__ == '__main__':
+    unittest.main()
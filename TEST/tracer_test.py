@@ -0,0 +1,85 @@
+import os
+import json
+import tempfile
+import unittest
+from tracer import Tracer, tracer, span, traced, clear_traces, merge_traces
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.trace_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        tracer.enabled = False
+
+    def test_disabled_tracer_records_nothing(self):
+        local = Tracer()
+        with local.span('idle'):
+            pass
+        self.assertEqual(len(local._events), 0)
+        self.assertIsNone(local.dump())
+
+    def test_span_and_decorator_are_recorded(self):
+        @traced()
+        def work():
+            return 42
+
+        tracer.enable('Test', self.trace_dir)
+        with span('outer'):
+            self.assertEqual(work(), 42)
+        path = tracer.dump()
+        with open(path) as f:
+            events = json.load(f)
+        self.assertEqual(events[0]['ph'], 'M')
+        self.assertEqual(events[0]['args']['name'], 'Test')
+        spans = {event['name']: event for event in events[1:]}
+        self.assertEqual(set(spans), {'outer', work.__qualname__})
+        inner = spans[work.__qualname__]
+        # the inner span lies inside the outer one
+        self.assertGreaterEqual(inner['ts'], spans['outer']['ts'])
+        self.assertLessEqual(inner['ts'] + inner['dur'], spans['outer']['ts'] + spans['outer']['dur'])
+
+    def test_buffer_keeps_the_latest_spans(self):
+        tracer.enable('Test', self.trace_dir, capacity=3)
+        for index in range(5):
+            with span(f"span{index}"):
+                pass
+        self.assertEqual([event[0] for event in tracer._events], ['span2', 'span3', 'span4'])
+
+    def test_merge_joins_process_files(self):
+        for name in ('First', 'Second'):
+            tracer.enable(name, self.trace_dir)
+            with span(name.lower()):
+                pass
+            tracer.dump()
+        output_path = os.path.join(self.trace_dir, 'trace.json')
+        self.assertEqual(merge_traces(self.trace_dir, output_path), 2)
+        # merging again skips the output file itself
+        self.assertEqual(merge_traces(self.trace_dir, output_path), 2)
+        with open(output_path) as f:
+            trace = json.load(f)
+        self.assertEqual({event['name'] for event in trace['traceEvents'] if event['ph'] == 'X'}, {'first', 'second'})
+
+    def test_clear_removes_files_of_earlier_runs(self):
+        tracer.enable('Stale', self.trace_dir)
+        with span('stale'):
+            pass
+        tracer.dump()
+        other_paths = [os.path.join(self.trace_dir, name) for name in ('notes.json', 'Box2D_123.json')]
+        for path in other_paths:
+            with open(path, 'w') as f:
+                json.dump([], f)
+        clear_traces(self.trace_dir)
+        tracer.enable('Current', self.trace_dir)
+        with span('current'):
+            pass
+        tracer.dump()
+        output_path = os.path.join(self.trace_dir, 'trace.json')
+        self.assertEqual(merge_traces(self.trace_dir, output_path), 1)
+        with open(output_path) as f:
+            trace = json.load(f)
+        self.assertEqual([event['name'] for event in trace['traceEvents'] if event['ph'] == 'X'], ['current'])
+        # files the tracer did not write are left alone
+        self.assertTrue(all(os.path.exists(path) for path in other_paths))
+
+if __name__ == '__main__':
+    unittest.main()
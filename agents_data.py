@@ -4,6 +4,7 @@ from log import get_logger
 import time, random
 import threading
 from config_manager import ConfigManager
+from tracer import traced
 
 class AgentsData:
     def __init__(self, queue_dict):
@@ -31,6 +32,26 @@ class AgentsData:
         self.current_agent_count = 0
         self.next_id = 0
         self.available_ids = []
+        # agent_id -> row in self.agents (-1 if absent); the reverse is the 'id' column
+        self.id_to_index = np.full(self.max_agents_num, -1, dtype=np.int32)
+        # Number of batches sent to Box2D, and per agent id the batch that adds it there.
+        # Box2D frames carry the last batch applied, so rows of agents Box2D does not have yet
+        # (a recycled id still names the removed agent there) are not overwritten.
+        self.batch = 0
+        self.added_batch = np.zeros(self.max_agents_num, dtype=np.int64)
+
+        # per-species trait tables indexed by species id, for bulk spawns/deaths
+        traits = self.config_manager.species_traits
+        self._species_life_energy = traits['LIFE_ENERGY'].astype(np.float32)
+        self._species_loss_rate = traits['LIFE_ENERGY_LOSS_RATE'].astype(np.float32)
+        self._species_birth_threshold = traits['BIRTH_THRESHOLD'].astype(np.float32)
+        self._species_predator_rate = traits['PREDATOR_RATE'].astype(np.float32)
+        self._species_radius = traits['RADIUS'].astype(np.float32)
+        self._species_reproduction_rate = traits['REPRODUCTION_RATE'] / np.maximum(self._species_radius, 1e-6)
+
+        # add/remove events of the current tick, sent as one batch by flush_agent_events
+        self._pending_added = {}
+        self._pending_removed = []
 
         # Queue setup
         self._eco_to_box2d = queue_dict['eco_to_box2d']
@@ -70,10 +91,28 @@ class AgentsData:
                 self.add_agent_no_notify(species, (float(x[i]), float(y[i])))
             self.logger.info(f"Initialized {initial_agent_num} agents for species {species}")
                 
+        self.send_initial_data()
+        self.logger.info("Ecosystem initialization completed")
+
+    def send_initial_data(self):
         self.send_data_to_box2d_initialize()
         self.send_data_to_tf_initialize()
         self.send_data_to_visual_initialize()
-        self.logger.info("Ecosystem initialization completed")
+
+    def restore(self, agents, next_id, available_ids):
+        # Replace the whole table with a checkpointed one (agents: the active rows only)
+        count = len(agents)
+        if count > self.max_agents_num or next_id > self.max_agents_num:
+            raise ValueError(f"Checkpoint needs MAX_AGENTS_NUM >= {max(count, next_id)}, config has {self.max_agents_num}")
+        self.agents[:] = 0
+        self.agents[:count] = agents
+        self.current_agent_count = count
+        self.next_id = int(next_id)
+        self.available_ids = [int(agent_id) for agent_id in available_ids]
+        self._rebuild_id_index()
+        self._pending_added = {}
+        self._pending_removed = []
+        self.logger.info(f"Restored {count} agents (next_id={self.next_id}, {len(self.available_ids)} free ids)")
 
 
     # ------------------ add agent ---------------------
@@ -82,7 +121,7 @@ class AgentsData:
         agent_id = self._add_agent_internal(species, position, velocity)
         if agent_id is not None:
             self._notify_agent_add(agent_id, species, position, velocity)
-            self.logger.debug(f"Agent added: id={agent_id}, species={species}, position={position}")
+            self.logger.debug("Agent added: id=%s, species=%s, position=%s", agent_id, species, position)
         else:
             self.logger.error(f"Error: Cannot add agent. Maximum capacity of {self.max_agents_num} reached.")
         return agent_id
@@ -90,7 +129,7 @@ class AgentsData:
     def add_agent_no_notify(self, species, position, velocity=(0,0)):
         agent_id = self._add_agent_internal(species, position, velocity)
         if agent_id is not None:
-            self.logger.debug(f"Agent added without notification: id={agent_id}, species={species}, position={position}")
+            self.logger.debug("Agent added without notification: id=%s, species=%s, position=%s", agent_id, species, position)
         return agent_id
     
     def _add_agent_internal(self, species, position, velocity=(0, 0)):
@@ -103,6 +142,8 @@ class AgentsData:
             
             index = self.current_agent_count
             self.agents[index]['id'] = agent_id
+            self.id_to_index[agent_id] = index
+            self.added_batch[agent_id] = self.batch + 1
             self.agents[index]['species'] = species
             self.agents[index]['position'] = position
             self.agents[index]['velocity'] = velocity
@@ -110,74 +151,177 @@ class AgentsData:
             
             self.current_agent_count += 1
 
-            self.logger.debug(f"Agent added internally: id={agent_id}, species={species}, position={position}")
+            self.logger.debug("Agent added internally: id=%s, species=%s, position=%s", agent_id, species, position)
             return agent_id
         self.logger.warning("Failed to add agent: maximum capacity reached")
         return None
 
     def _set_agent_properties(self, index, species):
-        self.agents[index]['life_energy'] = self.config_manager.get_species_trait_value('LIFE_ENERGY', species)
-        self.agents[index]['loss_rate'] = self.config_manager.get_species_trait_value('LIFE_ENERGY_LOSS_RATE', species)
-        self.agents[index]['life_gain'] = self.config_manager.get_species_trait_value('LIFE_ENERGY', species)
-        self.agents[index]['birth_threshold'] = self.config_manager.get_species_trait_value('BIRTH_THRESHOLD', species)
-        self.agents[index]['predator_rate'] = self.config_manager.get_species_trait_value('PREDATOR_RATE', species)
-        radius = self.config_manager.get_species_trait_value('RADIUS', species)
-        self.agents[index]['reproduction_rate'] = self.config_manager.get_species_trait_value('REPRODUCTION_RATE', species) / radius
-        
+        # index/species may be a single agent or arrays (bulk spawn)
+        self.agents['life_energy'][index] = self._species_life_energy[species]
+        self.agents['loss_rate'][index] = self._species_loss_rate[species]
+        self.agents['life_gain'][index] = self._species_life_energy[species]
+        self.agents['birth_threshold'][index] = self._species_birth_threshold[species]
+        self.agents['predator_rate'][index] = self._species_predator_rate[species]
+        self.agents['reproduction_rate'][index] = self._species_reproduction_rate[species]
+
+    def _allocate_ids(self, num):
+        # same order as repeated available_ids.pop(), then fresh ids
+        num_reused = min(num, len(self.available_ids))
+        reused = self.available_ids[len(self.available_ids) - num_reused:][::-1]
+        del self.available_ids[len(self.available_ids) - num_reused:]
+        fresh = np.arange(self.next_id, self.next_id + num - num_reused, dtype=np.int32)
+        self.next_id += num - num_reused
+        return np.concatenate([np.array(reused, dtype=np.int32), fresh])
+
+    def add_agents(self, species, positions, velocities=None):
+        # Bulk spawn: one slice assignment for all new agents. Returns the new ids
+        # (fewer than requested when the capacity is reached).
+        num = min(len(species), self.max_agents_num - self.current_agent_count)
+        if num < len(species):
+            self.logger.warning(f"Cannot add {len(species) - num} agents: maximum capacity of {self.max_agents_num} reached.")
+        if num <= 0:
+            return np.zeros(0, dtype=np.int32)
+        species = np.asarray(species[:num], dtype=np.int32)
+        positions = np.asarray(positions[:num], dtype=np.float32)
+        velocities = np.zeros((num, 2), dtype=np.float32) if velocities is None else np.asarray(velocities[:num], dtype=np.float32)
+        agent_ids = self._allocate_ids(num)
+        new = slice(self.current_agent_count, self.current_agent_count + num)
+        self.agents['id'][new] = agent_ids
+        self.id_to_index[agent_ids] = np.arange(new.start, new.stop, dtype=np.int32)
+        self.added_batch[agent_ids] = self.batch + 1
+        self.agents['species'][new] = species
+        self.agents['position'][new] = positions
+        self.agents['velocity'][new] = velocities
+        self._set_agent_properties(new, species)
+        self.current_agent_count += num
+        for agent_id, agent_species, position, velocity in zip(agent_ids.tolist(), species.tolist(), positions, velocities):
+            self._notify_agent_add(agent_id, agent_species, position, velocity)
+        return agent_ids
+
     def _notify_agent_add(self, agent_id, species, position, velocity):
-        add_data = {
-            'action': 'add',
-            'agent_id': agent_id,
-            'species': species,
-            'position': position,
-            'velocity': velocity,
-            'current_agent_count': self.current_agent_count
+        self._pending_added[agent_id] = (species, position, velocity)
 
-        }
-        self._eco_to_box2d.put(add_data)
-        self.send_data_to_visual(add_data)
-        self.logger.debug(f"Notified agent addition: id={agent_id}")
+    def index_of(self, agent_ids):
+        # row of each agent id (scalar or array), -1 for ids that are not alive
+        agent_ids = np.asarray(agent_ids)
+        in_range = (agent_ids >= 0) & (agent_ids < self.max_agents_num)
+        return np.where(in_range, self.id_to_index[np.where(in_range, agent_ids, 0)], -1)
+
+    def _rebuild_id_index(self):
+        self.id_to_index[:] = -1
+        count = self.current_agent_count
+        self.id_to_index[self.agents['id'][:count]] = np.arange(count, dtype=np.int32)
 
     def remove_agent(self, agent_id):
-        index = np.where(self.agents['id'][:self.current_agent_count] == agent_id)[0]
-        if len(index) > 0:
-            index = index[0]
+        index = int(self.index_of(agent_id))
+        if index >= 0:
             last_index = self.current_agent_count - 1
             
             if index != last_index:
                 self.agents[index] = self.agents[last_index]
+                self.id_to_index[self.agents[index]['id']] = index
             
             self.agents[last_index] = 0  # Reset the last agent's data
+            self.id_to_index[agent_id] = -1
             self.current_agent_count -= 1
             self.available_ids.append(agent_id)
             
             self._notify_agent_removed(agent_id)
-            self.logger.info(f"Agent removed: id={agent_id}")
+            self.logger.debug("Agent removed: id=%s", agent_id)
         else:
-            self.logger.warning(f"Warning: Agent {agent_id} does not exist. No agent removed.")
+            self.logger.warning("Warning: Agent %s does not exist. No agent removed.", agent_id)
+
+    def remove_agents_by_mask(self, remove_mask):
+        # Masked compaction: survivors keep their relative order and move to the front.
+        # Returns the removed agents (structured array copy).
+        count = self.current_agent_count
+        remove_mask = np.asarray(remove_mask[:count], dtype=bool)
+        if not remove_mask.any():
+            return self.agents[:0].copy()
+        active = self.agents[:count]
+        removed = active[remove_mask].copy()
+        survivors = active[~remove_mask]
+        num_survivors = len(survivors)
+        self.agents[:num_survivors] = survivors
+        self.agents[num_survivors:count] = 0
+        self.current_agent_count = num_survivors
+        self.id_to_index[removed['id']] = -1
+        self.id_to_index[self.agents['id'][:num_survivors]] = np.arange(num_survivors, dtype=np.int32)
+        removed_ids = removed['id'].tolist()
+        self.available_ids.extend(removed_ids)
+        for agent_id in removed_ids:
+            self._notify_agent_removed(agent_id)
+        self.logger.debug("Agents removed: %s", len(removed_ids))
+        return removed
 
     def _notify_agent_removed(self, agent_id):
-        remove_data = {
-            'action': 'remove',
-            'agent_id': agent_id,
+        if agent_id in self._pending_added:
+            # added and removed within the same tick: the receivers never see it
+            del self._pending_added[agent_id]
+        else:
+            self._pending_removed.append(agent_id)
+
+    def flush_agent_events(self, send_empty=False):
+        # One message per tick with packed arrays. Receivers apply the removals, then the
+        # additions, then reorder their tables to agent_ids so slot order matches AgentsData.
+        # send_empty: still send an (empty) batch to Box2D, which waits for it in lockstep mode
+        if not self._pending_added and not self._pending_removed:
+            if send_empty:
+                self._send_batch(self._empty_batch())
+            return
+        added = self._pending_added
+        batch_data = {
+            'action': 'batch',
+            'added_ids': np.fromiter(added.keys(), dtype=np.int32, count=len(added)),
+            'added_species': np.array([value[0] for value in added.values()], dtype=np.int32),
+            'added_positions': np.array([value[1] for value in added.values()], dtype=np.float32).reshape(-1, 2),
+            'added_velocities': np.array([value[2] for value in added.values()], dtype=np.float32).reshape(-1, 2),
+            'removed_ids': np.array(self._pending_removed, dtype=np.int32),
+            'agent_ids': self.agents['id'][:self.current_agent_count].copy(),
             'current_agent_count': self.current_agent_count
+        }
+        self._pending_added = {}
+        self._pending_removed = []
+        self._send_batch(batch_data)
+        self.send_data_to_visual(batch_data)
+        self.logger.debug("Notified agent batch: added=%s, removed=%s", len(batch_data['added_ids']), len(batch_data['removed_ids']))
+
+    def _send_batch(self, batch_data):
+        self.batch += 1
+        batch_data['batch'] = self.batch
+        self._eco_to_box2d.put(batch_data)
 
+    def _empty_batch(self):
+        return {
+            'action': 'batch',
+            'added_ids': np.zeros(0, dtype=np.int32),
+            'added_species': np.zeros(0, dtype=np.int32),
+            'added_positions': np.zeros((0, 2), dtype=np.float32),
+            'added_velocities': np.zeros((0, 2), dtype=np.float32),
+            'removed_ids': np.zeros(0, dtype=np.int32),
+            'agent_ids': self.agents['id'][:self.current_agent_count].copy(),
+            'current_agent_count': self.current_agent_count
         }
-        self.send_data_to_visual(remove_data)
-        self._eco_to_box2d.put(remove_data)
-        self.logger.debug(f"Notified agent removal: id={agent_id}")
 
     # ----------------- main update ----------------------
 
+    @traced()
     def update(self):
         try:
             if not self._box2d_to_eco.empty():
                 box2d_data = self._box2d_to_eco.get_nowait()
-                positions = box2d_data['positions']
-                if len(positions) == self.current_agent_count:
-                    self.agents['position'][:self.current_agent_count] = positions
-                else:
-                    self.logger.warning(f"Agent count mismatch. Box2D(length): {len(positions)}, AgentsData(current agent count): {self.current_agent_count}")
+                # The frame may predate the last batches (deaths compact the rows), so it is
+                # mapped by agent id. Agents Box2D has not added yet keep their own values.
+                agent_ids = box2d_data['agent_ids']
+                rows = self.index_of(agent_ids)
+                current = rows >= 0
+                current[current] = self.added_batch[agent_ids[current]] <= box2d_data['batch']
+                rows = rows[current]
+                self.agents['position'][rows] = box2d_data['positions'][:len(agent_ids)][current]
+                if 'velocities' in box2d_data:
+                    # kept in sync so checkpoints hold the Box2D velocities
+                    self.agents['velocity'][rows] = box2d_data['velocities'][:len(agent_ids)][current]
         except Exception as e:
             self.logger.exception(f"Error in AgentsData update: {e}")
         
@@ -189,34 +333,26 @@ class AgentsData:
 
     def check_deaths(self):
         active_agents = self.agents[:self.current_agent_count]
-        dead_agents = active_agents[active_agents['life_energy'] <= 0]
-        energy_to_env = 0
-        
-        for dead_agent in dead_agents:
-            species = dead_agent['species']
-            radius = self.config_manager.get_species_trait_value('RADIUS', species)
-            energy_to_env += radius ** 2
-            self.remove_agent(dead_agent['id'])
-        
-        return energy_to_env
+        dead_agents = self.remove_agents_by_mask(active_agents['life_energy'] <= 0)
+        return float(np.sum(self._species_radius[dead_agents['species']] ** 2))
 
     def check_reproductions(self):
-        active_agents = self.agents[:self.current_agent_count]
-        reproducing_agents = active_agents[active_agents['life_energy'] > active_agents['birth_threshold']]
-        
-        for agent in reproducing_agents:
-            if random.random() < agent['reproduction_rate']:
-                new_position = (
-                    agent['position'][0] + random.uniform(-3, 3),
-                    agent['position'][1] + random.uniform(-3, 3)
-                )
-                new_agent_id = self.add_agent(agent['species'], new_position)
-                if new_agent_id is not None:
-                    new_agent_index = np.where(self.agents['id'] == new_agent_id)[0][0]
-                    agent['life_energy'] /= 2
-                    self.agents[new_agent_index]['life_energy'] = agent['life_energy']
-                self.logger.warning(f'Reproduction success!! species{agent["species"]} agent_id {agent["id"]} => {new_agent_id}.')
-                self.logger.warning(f'species{agent["species"]} pos {agent["position"]} new_pos {new_position}.')
+        count = self.current_agent_count
+        active_agents = self.agents[:count]
+        candidates = np.nonzero(active_agents['life_energy'] > active_agents['birth_threshold'])[0]
+        if len(candidates) == 0:
+            return 0
+        parents = candidates[np.random.random(len(candidates)) < active_agents['reproduction_rate'][candidates]]
+        parents = parents[:self.max_agents_num - count]
+        if len(parents) == 0:
+            return 0
+        # the parent gives half of its energy to the child
+        active_agents['life_energy'][parents] /= 2
+        new_positions = active_agents['position'][parents] + np.random.uniform(-3, 3, (len(parents), 2))
+        new_ids = self.add_agents(active_agents['species'][parents], new_positions)
+        self.agents['life_energy'][count:count + len(new_ids)] = active_agents['life_energy'][parents]
+        self.logger.debug("Reproductions: %s", len(new_ids))
+        return len(new_ids)
         
     # ----------------- Queues ----------------------
 
@@ -224,6 +360,7 @@ class AgentsData:
         data = {
             'positions': self.agents['position'],
             'species': self.agents['species'],
+            'agent_ids': self.agents['id'],
             'current_agent_count': self.current_agent_count
         }
         self._eco_to_tf_init.put(data)
@@ -235,8 +372,11 @@ class AgentsData:
             'velocities': self.agents['velocity'][:self.current_agent_count],
             'species': self.agents['species'][:self.current_agent_count],
             'agent_ids': self.agents['id'][:self.current_agent_count],
-            'current_agent_count': self.current_agent_count
+            'current_agent_count': self.current_agent_count,
+            'batch': self.batch
         }
+        # everything in the table is in Box2D from here on
+        self.added_batch[self.agents['id'][:self.current_agent_count]] = self.batch
         self._eco_to_box2d_init.put(data)
         self.logger.info(f"Sent initialization data to Box2D. Agent count: {self.current_agent_count}")
 
@@ -252,7 +392,7 @@ class AgentsData:
 
     def send_data_to_visual(self, data):
         self._eco_to_visual.put(data)
-        self.logger.info(f"Sent data to Visual System. Agent Add or Remove: {self.current_agent_count}")
+        self.logger.debug("Sent data to Visual System. Agent Add or Remove: %s", self.current_agent_count)
 
     def _eco_to_visual_queue(self, data):
         self._eco_to_visual.put(data)
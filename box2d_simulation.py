@@ -1,34 +1,22 @@
 import threading
-from Box2D import b2World, b2Vec2, b2BodyDef, b2_dynamicBody, b2CircleShape, b2ContactListener
+from operator import attrgetter
+from Box2D import b2World, b2Vec2, b2BodyDef, b2_dynamicBody, b2CircleShape
 import numpy as np
-import random
 import time
 from config_manager import ConfigManager
 from log import get_logger, set_log_level
-from queue import Empty
-
-class CollisionListener(b2ContactListener):
-    def __init__(self):
-        super().__init__()
-        self.collisions = set()
-
-    def BeginContact(self, contact):
-        body_a = contact.fixtureA.body
-        body_b = contact.fixtureB.body
-        collision = tuple(sorted((body_a.userData, body_b.userData)))
-        self.collisions.add(collision)
-
-    def clear(self):
-        self.collisions.clear()
+from queue import Empty, Full
+from timer import Timer
+from shared_frame_buffer import SharedFrameBuffer
+from contact_recorder import ContactRecorder
+from solver_iterations import SolverIterations
+from tracer import span
+from force_age import ForceAgeHistogram
 
 class Box2DSimulation:
-    def __init__(self, queues):
+    def __init__(self, queues, lockstep=False):
         self.logger = get_logger(self.__class__.__name__)
         self.queues = queues
-        self.world = b2World(gravity=(0, 0), doSleep=True)
-        self.collision_listener = CollisionListener()
-        self.world.contactListener = self.collision_listener
-        self.bodies = {}
         
         # Queues
         self._eco_to_box2d_init = queues['eco_to_box2d_init']
@@ -38,22 +26,57 @@ class Box2DSimulation:
         self._box2d_to_eco = queues['box2d_to_eco']
         self._box2d_to_visual_render = queues['box2d_to_visual_render']
         self._box2d_to_eco_collisions = queues['box2d_to_eco_collisions']  # New queue for collision data
+        # In shared-memory mode one frame buffer replaces box2d_to_tf/eco/visual_render
+        self._shared_frames = isinstance(self._box2d_to_tf, SharedFrameBuffer)
+        # lockstep: wait for the Ecosystem batch of this tick instead of polling
+        self.lockstep = lockstep
 
         # ConfigManager setup
         self.config_manager = ConfigManager()
         self.dt = self.config_manager.get_trait_value('DT')
         self.max_agents_num = self.config_manager.get_trait_value('MAX_AGENTS_NUM')
+        self.radius_table = self.config_manager.species_traits['RADIUS'].astype(np.float32)
+        # Contact pairs for Ecosystem; they stay in the recorder until Ecosystem takes them
+        self.contact_recorder = ContactRecorder(self.config_manager.get_trait_value('WORLD_WIDTH'),
+                                                self.config_manager.get_trait_value('WORLD_HEIGHT'))
+        self.record_contacts = bool(self.config_manager.get_trait_value('RECORD_CONTACTS'))
+        # Solver settings of world.Step; each substep advances dt / substeps
+        self.velocity_iterations = int(self.config_manager.get_trait_value('VELOCITY_ITERATIONS'))
+        self.position_iterations = int(self.config_manager.get_trait_value('POSITION_ITERATIONS'))
+        self.substeps = max(1, int(self.config_manager.get_trait_value('PHYSICS_SUBSTEPS')))
+        self.solver_iterations = None
+        if self.config_manager.get_trait_value('ADAPTIVE_ITERATIONS'):
+            if lockstep:
+                # the policy reacts to wall-clock step cost, which would break reproducibility
+                self.logger.warning("Adaptive solver iterations are disabled in lockstep mode")
+            else:
+                self.solver_iterations = SolverIterations(self.velocity_iterations, self.position_iterations,
+                                                          self.config_manager.get_trait_value('STEP_BUDGET_MS'),
+                                                          self.config_manager.get_trait_value('MAX_PENETRATION'))
 
         # Initialize numpy arrays
         self.agent_ids = np.full(self.max_agents_num, -1, dtype=np.int32)
         self.species = np.zeros(self.max_agents_num, dtype=np.int32)
         self.positions = np.zeros((self.max_agents_num, 2), dtype=np.float32)
+        self.velocities = np.zeros((self.max_agents_num, 2), dtype=np.float32)
         self.current_agent_count = 0
+        # Bodies in the same order as agent_ids, for batched force/position passes
+        self.body_list = []
+        # agent_id -> slot (-1 if absent). Removal swaps the last slot in, like AgentsData.
+        self.id_to_index = np.full(self.max_agents_num, -1, dtype=np.int32)
+
+        # per-tick timing (ms) of the batched passes
+        self.timings = {'update_forces': 0.0, 'step': 0.0, 'update_positions': 0.0, 'contacts': 0.0}
+        self.timing_timer = Timer("Box2D timings")
+        # Physics frame number, sent with every position payload; forces come back with the
+        # frame (and send time) of the positions they were computed from
+        self.frame = 0
+        self.frame_time = time.time()
+        # last Ecosystem agent batch applied, sent back with the frames (AgentsData.update)
+        self.batch = 0
+        self.force_age = ForceAgeHistogram()
+        self._init_world()
 
-        # reduce collision data
-        self.frame_counter = 0
-        self.collision_send_interval = 2
-        self.collision_sample_size = 2
     
         # エージェント管理スレッドの開始
         # self.data_lock = threading.Lock()
@@ -68,26 +91,24 @@ class Box2DSimulation:
         self.logger.info("Box2DSimulation is initializing")
         init_data = self._eco_to_box2d_init.get()
         
-        self.current_agent_count = init_data['current_agent_count']
-        self.agent_ids[:self.current_agent_count] = init_data['agent_ids']
-        self.species[:self.current_agent_count] = init_data['species']
-        
-        for i in range(self.current_agent_count):
-            agent_id = self.agent_ids[i]
-            species = self.species[i]
-            position = init_data['positions'][i]
-            velocity = init_data['velocities'][i]
-            self._create_body(agent_id, species, position, velocity)
+        for i in range(init_data['current_agent_count']):
+            self._add_slot(init_data['agent_ids'][i], init_data['species'][i],
+                           init_data['positions'][i], init_data['velocities'][i])
+        self.batch = init_data.get('batch', 0)
         
         self.logger.info(f"Box2DSimulation initialized with {self.current_agent_count} agents")
 
+    def _init_world(self):
+        self.world = b2World(gravity=(0, 0), doSleep=True)
+
     def _create_body(self, agent_id, species, position, velocity=(0, 0)):
-        linear_damping = self.config_manager.get_species_trait_value('DAMPING', species)
-        density = self.config_manager.get_species_trait_value('DENSITY', species)
-        restitution = self.config_manager.get_species_trait_value('RESTITUTION', species)
-        friction = self.config_manager.get_species_trait_value('FRICTION', species)
-        mass = self.config_manager.get_species_trait_value('MASS', species)
-        radius = self.config_manager.get_species_trait_value('RADIUS', species)
+        traits = self.config_manager.species_traits
+        linear_damping = float(traits['DAMPING'][species])
+        density = float(traits['DENSITY'][species])
+        restitution = float(traits['RESTITUTION'][species])
+        friction = float(traits['FRICTION'][species])
+        mass = float(traits['MASS'][species])
+        radius = float(traits['RADIUS'][species])
 
         # with self.data_lock:
         body_def = b2BodyDef(
@@ -102,28 +123,100 @@ class Box2DSimulation:
         body.CreateFixture(shape=circle_shape, density=density, 
                         friction=friction, restitution=restitution)
         body.mass = mass * circle_shape.radius
-        self.bodies[agent_id] = body
-        self.logger.debug(f"Created body for agent {agent_id} of species {species}")
+        self.logger.debug("Created body for agent %s of species %s", agent_id, species)
+        return body
+
+    def _destroy_body(self, body):
+        self.world.DestroyBody(body)
+
+    def _add_slot(self, agent_id, species, position, velocity=(0, 0)):
+        index = self.current_agent_count
+        self.body_list.append(self._create_body(agent_id, species, position, velocity))
+        self.agent_ids[index] = agent_id
+        self.species[index] = species
+        self.positions[index] = position
+        self.velocities[index] = velocity
+        self.id_to_index[agent_id] = index
+        self.current_agent_count += 1
+        return index
+
+    def _remove_slot(self, index):
+        # Swap-remove: the last slot moves into the hole, matching AgentsData.remove_agent
+        last_index = self.current_agent_count - 1
+        self._destroy_body(self.body_list[index])
+        self.id_to_index[self.agent_ids[index]] = -1
+        if index != last_index:
+            moved_id = self.agent_ids[last_index]
+            self.body_list[index] = self.body_list[last_index]
+            self.agent_ids[index] = moved_id
+            self.species[index] = self.species[last_index]
+            self.positions[index] = self.positions[last_index]
+            self.velocities[index] = self.velocities[last_index]
+            self.id_to_index[moved_id] = index
+        self.body_list.pop()
+        self.agent_ids[last_index] = -1
+        self.species[last_index] = 0
+        self.current_agent_count -= 1
+
+    def _index_of(self, agent_id):
+        if 0 <= agent_id < self.max_agents_num:
+            return self.id_to_index[agent_id]
+        return -1
 
     def update(self):
-        self.process_ecosystem_queue()
-        self.update_forces()
-        self.step()
-        self.update_positions()
-        self.send_data_to_tf()
-        self.send_data_to_eco_visual()
-        
-        # self.frame_counter += 1
-        # if self.frame_counter % self.collision_send_interval == 0:
-            # self.send_collision_data_to_eco()
-            
+        with span('Box2DSimulation.process_ecosystem'):
+            if self.lockstep:
+                self.process_ecosystem_batch()
+            else:
+                self.process_ecosystem_queue()
+
+        start_time = time.perf_counter()
+        with span('Box2DSimulation.update_forces'):
+            self.update_forces()
+        forces_time = time.perf_counter()
+        with span('Box2DSimulation.step'):
+            self.step()
+        step_time = time.perf_counter()
+        with span('Box2DSimulation.update_positions'):
+            self.update_positions()
+        positions_time = time.perf_counter()
+        if self.record_contacts:
+            with span('Box2DSimulation.record_contacts'):
+                self.record_contacts_step()
+        end_time = time.perf_counter()
+        self.timings['update_forces'] = (forces_time - start_time) * 1000
+        self.timings['step'] = (step_time - forces_time) * 1000
+        self.timings['update_positions'] = (positions_time - step_time) * 1000
+        self.timings['contacts'] = (end_time - positions_time) * 1000
+        if self.solver_iterations is not None:
+            self.adapt_solver_iterations()
+        if self.timing_timer.interval_timer(5):
+            self.logger.info("Box2D timings (ms): " + ", ".join(f"{name}={value:.2f}" for name, value in self.timings.items())
+                             + f" agents={self.current_agent_count} contacts={self.contact_recorder.contact_count}"
+                             + f" iterations={self.velocity_iterations}/{self.position_iterations}x{self.substeps}")
+            self.logger.info(f"Box2D force age: {self.force_age.summary()}")
+            self.force_age.reset()
+
+        self.frame += 1
+        self.frame_time = time.time()
+
+        with span('Box2DSimulation.send'):
+            if self._shared_frames:
+                self.send_shared_frame()
+            else:
+                self.send_data_to_tf()
+                self.send_data_to_eco_visual()
+
+            self.send_collision_data_to_eco()
         
     def process_ecosystem_queue(self):
         while not self._eco_to_box2d.empty():
             try:
                 update_data = self._eco_to_box2d.get_nowait()
                 action = update_data.get('action')
-                if action == 'add':
+                if action == 'batch':
+                    self._handle_agent_batch(update_data)
+                elif action == 'add':
                     self._handle_agent_added(update_data)
                 elif action == 'remove':
                     self._handle_agent_removed(update_data)
@@ -132,12 +225,19 @@ class Box2DSimulation:
             except Exception as e:
                     self.logger.exception(f"Box2DSimulation: Error processing ecosystem queue: {e}")
 
+    def process_ecosystem_batch(self, timeout=10):
+        # lockstep: Ecosystem sends exactly one batch per tick, wait until it arrives
+        update_data = self._eco_to_box2d.get(timeout=timeout)
+        self._handle_agent_batch(update_data)
+
     def agent_management_worker(self):
         while True:
             try:
                 update_data = self._eco_to_box2d.get(timeout=0.001)
                 action = update_data.get('action')
-                if action == 'add':
+                if action == 'batch':
+                    self._handle_agent_batch(update_data)
+                elif action == 'add':
                     self._handle_agent_added(update_data)
                 elif action == 'remove':
                     self._handle_agent_removed(update_data)
@@ -150,92 +250,197 @@ class Box2DSimulation:
 
     def _handle_agent_added(self, data):
         agent_id = data['agent_id']
-        species = data['species']
-        position = data['position']
-        self._create_body(agent_id, species, position)
-
-        # with self.data_lock:
-        # Update numpy arrays
-        index = self.current_agent_count
-        self.agent_ids[index] = agent_id
-        self.species[index] = species
-        self.current_agent_count += 1
-
-        self.logger.debug(f"Agent {agent_id} added to Box2D simulation.")
+        if self._index_of(agent_id) >= 0:
+            self.logger.warning(f"Box2DSimulation: Agent {agent_id} already exists in Box2D")
+            return
+        self._add_slot(agent_id, data['species'], data['position'], data.get('velocity', (0, 0)))
+        self.logger.debug("Agent %s added to Box2D simulation.", agent_id)
 
     def _handle_agent_removed(self, data):
         agent_id = data['agent_id']
-        if agent_id in self.bodies:
-            self.world.DestroyBody(self.bodies[agent_id])
-            del self.bodies[agent_id]
-            
-            # with self.data_lock:
-                # Update numpy arrays
-            index = np.where(self.agent_ids == agent_id)[0][0]
-            self.agent_ids[index:-1] = self.agent_ids[index+1:]
-            self.species[index:-1] = self.species[index+1:]
-            self.agent_ids[self.current_agent_count-1] = -1
-            self.species[self.current_agent_count-1] = 0
-            self.current_agent_count -= 1
-            
-            self.logger.info(f"Box2DSimulation: Agent {agent_id} removed from Box2D.")
+        index = self._index_of(agent_id)
+        if index >= 0:
+            self._remove_slot(index)
+            self.logger.debug("Box2DSimulation: Agent %s removed from Box2D.", agent_id)
         else:
             self.logger.warning(f"Box2DSimulation: Attempted to remove non-existent agent {agent_id} from Box2D")
 
+    def _handle_agent_batch(self, data):
+        for agent_id in data['removed_ids'].tolist():
+            index = self._index_of(agent_id)
+            if index >= 0:
+                self._remove_slot(index)
+            else:
+                self.logger.warning(f"Box2DSimulation: Attempted to remove non-existent agent {agent_id} from Box2D")
+        for agent_id, species, position, velocity in zip(data['added_ids'].tolist(), data['added_species'].tolist(),
+                                                         data['added_positions'], data['added_velocities']):
+            if self._index_of(agent_id) >= 0:
+                self.logger.warning(f"Box2DSimulation: Agent {agent_id} already exists in Box2D")
+                continue
+            self._add_slot(agent_id, species, position, velocity)
+        self._reorder_slots(data['agent_ids'])
+        self.batch = data.get('batch', self.batch)
+        self.logger.debug("Box2DSimulation: batch applied, %s agents", self.current_agent_count)
+
+    def _reorder_slots(self, agent_ids):
+        # Make the slot order identical to the AgentsData order
+        count = self.current_agent_count
+        if len(agent_ids) != count or np.array_equal(agent_ids, self.agent_ids[:count]):
+            if len(agent_ids) != count:
+                self.logger.warning("Box2DSimulation: agent count mismatch after batch. Box2D: %s, Ecosystem: %s", count, len(agent_ids))
+            return
+        order = self.id_to_index[np.clip(agent_ids, 0, self.max_agents_num - 1)]
+        if np.any(order < 0) or not np.array_equal(self.agent_ids[order], agent_ids):
+            self.logger.warning("Box2DSimulation: unknown agent ids in batch order")
+            return
+        self.agent_ids[:count] = self.agent_ids[order]
+        self.species[:count] = self.species[order]
+        self.positions[:count] = self.positions[order]
+        self.velocities[:count] = self.velocities[order]
+        self.body_list = [self.body_list[index] for index in order.tolist()]
+        self.id_to_index[self.agent_ids[:count]] = np.arange(count, dtype=np.int32)
+
     def update_forces(self):
+        # only the newest forces of this tick are applied; older ones are superseded
+        data = None
         try:
             while True:
                 data = self._tf_to_box2d.get_nowait()
-                forces = data['forces']
-                for agent_id, force in zip(self.agent_ids[:self.current_agent_count], forces):
-                    if agent_id in self.bodies:
-                        body = self.bodies[agent_id]
-                        body.ApplyForceToCenter((float(force[0]), float(force[1])), wake=True)
         except Empty:
             pass
+        if data is not None:
+            self.apply_forces(data['forces'], data.get('agent_ids'))
+            self._record_force_age(data)
+        self.force_age.record_tick(data is not None)
+
+    def _record_force_age(self, data):
+        # forces computed before any stamped positions arrived carry frame -1
+        frame = data.get('frame', -1)
+        if frame >= 0:
+            self.force_age.record(self.frame - frame, (time.time() - data['timestamp']) * 1000)
+
+    def apply_forces(self, forces, agent_ids=None):
+        count = min(self.current_agent_count, len(forces))
+        if agent_ids is not None:
+            num_forces = min(len(agent_ids), len(forces))
+            agent_ids = agent_ids[:num_forces]
+            if num_forces != self.current_agent_count or not np.array_equal(agent_ids, self.agent_ids[:num_forces]):
+                # Agents were added/removed since the forces were computed: map them by id
+                index = np.full(num_forces, -1, dtype=np.int32)
+                in_range = (agent_ids >= 0) & (agent_ids < self.max_agents_num)
+                index[in_range] = self.id_to_index[agent_ids[in_range]]
+                valid = index >= 0
+                forces_by_slot = np.zeros((self.current_agent_count, 2), dtype=np.float32)
+                forces_by_slot[index[valid]] = forces[:num_forces][valid]
+                forces, count = forces_by_slot, self.current_agent_count
+        self._apply_slot_forces(forces, count)
+
+    def _apply_slot_forces(self, forces, count):
+        # body_list is aligned with the force array index, so this is one tight pass
+        for body, force in zip(self.body_list, forces[:count].tolist()):
+            body.ApplyForceToCenter(force, True)
                     
     def step(self):
-        self.world.Step(self.dt, 36, 18 )
+        if self.substeps == 1:
+            self.world.Step(self.dt, self.velocity_iterations, self.position_iterations)
+            return
+        # keep the applied forces for every substep, Box2D clears them after each Step otherwise
+        self.world.autoClearForces = False
+        sub_dt = self.dt / self.substeps
+        for _ in range(self.substeps):
+            self.world.Step(sub_dt, self.velocity_iterations, self.position_iterations)
+        self.world.ClearForces()
+
+    def adapt_solver_iterations(self):
+        policy = self.solver_iterations
+        if self.record_contacts:
+            penetration = self.contact_recorder.max_penetration
+        elif policy.closes_window:
+            # without contact recording the overlap search runs once per window, not every step
+            count = self.current_agent_count
+            self.contact_recorder.touching_pairs(self.positions[:count], self.radius_table[self.species[:count]])
+            penetration = self.contact_recorder.max_penetration
+        else:
+            penetration = 0.0
+        if policy.record(self.timings['step'], penetration):
+            self.velocity_iterations = policy.velocity_iterations
+            self.position_iterations = policy.position_iterations
+            self.logger.info(f"Solver iterations set to {self.velocity_iterations}/{self.position_iterations} "
+                             f"(step={policy.mean_step_ms:.2f}ms, budget={policy.budget_ms}ms, "
+                             f"penetration={policy.penetration:.3f})")
+
+    def set_contact_recording(self, enabled):
+        self.record_contacts = enabled
+        self.contact_recorder.clear()
+
+    def record_contacts_step(self):
+        count = self.current_agent_count
+        self.contact_recorder.record(self.positions[:count], self.radius_table[self.species[:count]], self.agent_ids[:count])
 
     def update_positions(self):
-        for i, agent_id in enumerate(self.agent_ids[:self.current_agent_count]):
-            if agent_id in self.bodies:
-                body = self.bodies[agent_id]
-                self.positions[i] = body.position.x, body.position.y
-            else:
-                self.logger.warning(f"Body for agent {agent_id} not found. Using last known position.")
+        count = self.current_agent_count
+        if count == 0:
+            return
+        self.positions[:count] = [(p.x, p.y) for p in map(attrgetter('position'), self.body_list)]
+        self.velocities[:count] = [(v.x, v.y) for v in map(attrgetter('linearVelocity'), self.body_list)]
 
     def send_data_to_tf(self):
         
         data = {
             'positions': self.positions,
             'species': self.species,
-            'current_agent_count': self.current_agent_count
+            'agent_ids': self.agent_ids,
+            'current_agent_count': self.current_agent_count,
+            'frame': self.frame,
+            'timestamp': self.frame_time
         }
         self._box2d_to_tf.put(data)
 
+    def send_shared_frame(self):
+        # A single write serves TF, Ecosystem and Visual
+        self._box2d_to_tf.write(
+            self.current_agent_count,
+            frame=self.frame,
+            timestamp=self.frame_time,
+            batch=self.batch,
+            positions=self.positions,
+            velocities=self.velocities,
+            species=self.species,
+            agent_ids=self.agent_ids
+        )
+
     def send_data_to_eco_visual(self):
         data = {
             'positions': self.positions[:self.current_agent_count],
+            'velocities': self.velocities[:self.current_agent_count],
             'agent_ids': self.agent_ids[:self.current_agent_count],
+            'frame': self.frame,
+            'timestamp': self.frame_time,
+            'batch': self.batch
         }
         self._box2d_to_eco.put(data)
         self._box2d_to_visual_render.put(data)
 
     def send_collision_data_to_eco(self):
-        all_collisions = self.collision_listener.collisions
-        total_collisions = len(all_collisions)
-        if total_collisions > self.collision_sample_size:
-            sampled_collisions = random.sample(list(all_collisions), self.collision_sample_size)
-        else:
-            sampled_collisions = all_collisions
+        # All new contact pairs (agent ids) as one (M, 2) int32 array per tick
+        if not self.lockstep and self.contact_recorder.count == 0:
+            return
+        collisions = self.contact_recorder.unique_pairs()
         collision_data = {
-            'collisions': sampled_collisions,
+            'collisions': collisions,
         }
-        self._box2d_to_eco_collisions.put(collision_data)
-        self.collision_listener.clear()  # 衝突データをクリア
+        try:
+            if self.lockstep:
+                # Ecosystem reads exactly one message per tick
+                self._box2d_to_eco_collisions.put(collision_data)
+            else:
+                self._box2d_to_eco_collisions.put_nowait(collision_data)
+        except Full:
+            # Ecosystem has not taken the previous pairs yet: keep these for the next tick
+            return
+        self.contact_recorder.clear_pairs()  # 衝突データをクリア
         
-        self.logger.debug(f"Sent sampled collision data to Ecosystem: {len(sampled_collisions)} out of {total_collisions} collisions")
+        self.logger.debug("Sent collision data to Ecosystem: %s pairs", len(collisions))
 
     def cleanup(self):
         # シミュレーション終了時にスレッドを適切に終了させる
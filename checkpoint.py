@@ -0,0 +1,54 @@
+import os
+import random
+import numpy as np
+
+CHECKPOINT_VERSION = 1
+
+def save_checkpoint(path, ecosystem):
+    """
+    Write the Ecosystem state to a compressed .npz: the active rows of AgentsData.agents
+    (velocities included, synced from Box2D), the id allocator, the environment energy and
+    the random / np.random states of the Ecosystem process. Box2D, the force backend and
+    Visual hold no state of their own beyond that, so they start from the same init data.
+    The file is written next to the target and renamed, so a crash never leaves half a file.
+    """
+    ad = ecosystem.ad
+    version, py_state, gauss_next = random.getstate()
+    np_state = np.random.get_state()
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        version=CHECKPOINT_VERSION,
+        agents=ad.agents[:ad.current_agent_count],
+        next_id=ad.next_id,
+        available_ids=np.array(ad.available_ids, dtype=np.int32),
+        env_energy=ecosystem.env_energy,
+        py_random_version=version,
+        py_random_state=np.array(py_state, dtype=np.int64),
+        py_random_gauss=np.nan if gauss_next is None else gauss_next,
+        np_random_keys=np_state[1],
+        np_random_pos=np_state[2],
+        np_random_has_gauss=np_state[3],
+        np_random_cached_gaussian=np_state[4],
+    )
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    with np.load(path, allow_pickle=False) as data:
+        state = {name: data[name] for name in data.files}
+    if int(state['version']) != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {int(state['version'])} in {path}")
+    return state
+
+def restore_checkpoint(ecosystem, state):
+    # Load the state into a freshly constructed Ecosystem (instead of AgentsData.initialize)
+    ad = ecosystem.ad
+    if state['agents'].dtype != ad.agents.dtype:
+        raise ValueError("Checkpoint agent table does not match AgentsData.agents")
+    ad.restore(state['agents'], int(state['next_id']), state['available_ids'])
+    ecosystem.env_energy = state['env_energy'].item()
+    gauss_next = float(state['py_random_gauss'])
+    random.setstate((int(state['py_random_version']), tuple(int(value) for value in state['py_random_state']),
+                     None if np.isnan(gauss_next) else gauss_next))
+    np.random.set_state(('MT19937', state['np_random_keys'], int(state['np_random_pos']),
+                         int(state['np_random_has_gauss']), float(state['np_random_cached_gaussian'])))
@@ -1,4 +1,5 @@
 import csv, ast
+import numpy as np
 from typing import Dict, Any, Tuple, Union
 
 class DNASpecies:
@@ -25,6 +26,8 @@ class ConfigManager:
         self.file_path = file_path
         self.config: Dict[str, Any] = {}
         self.species_dna: Dict[int, DNASpecies] = {}
+        # trait -> array indexed by species id (index 0 holds GLOBAL), numeric traits only
+        self.species_traits: Dict[str, np.ndarray] = {}
         self.load_config()
 
     def load_config(self):
@@ -52,6 +55,22 @@ class ConfigManager:
                               for trait, values in self.config.items() 
                               if str(species_id) in values}
             self.species_dna[species_id] = DNASpecies(species_id, species_traits)
+        self._compile_species_traits()
+
+    def _compile_species_traits(self):
+        # 種ごとの値を配列にまとめる (traits['RADIUS'][species_array] で一括参照できる)
+        self.species_traits = {}
+        for trait, values in self.config.items():
+            parsed = [self._parse_value(values.get('GLOBAL'))]
+            parsed += [self.species_dna[species_id].get_trait(trait) for species_id in range(1, 9)]
+            if not all(isinstance(value, (int, float)) for value in parsed[1:]):
+                continue
+            if parsed[0] is None or isinstance(parsed[0], str):
+                parsed[0] = 0
+            dtype = np.int32 if all(isinstance(value, int) for value in parsed) else np.float32
+            table = np.array(parsed, dtype=dtype)
+            table.flags.writeable = False
+            self.species_traits[trait] = table
 
     def _parse_value(self, value: str) -> Any:
         if value is None or value == '':
@@ -74,6 +93,11 @@ class ConfigManager:
             raise KeyError(f"指定された種 {species} が見つかりません。")
         return self.species_dna[species].get_trait(trait)
 
+    def get_species_trait_table(self, trait: str) -> np.ndarray:
+        if trait not in self.species_traits:
+            raise KeyError(f"指定されたトレイト {trait} が数値の種別テーブルにありません。")
+        return self.species_traits[trait]
+
     def get_dna_for_species(self, species: int) -> DNASpecies:
         if species not in self.species_dna:
             raise KeyError(f"指定された種 {species} が見つかりません。")
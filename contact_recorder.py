@@ -0,0 +1,75 @@
+import numpy as np
+from spatial_grid import grid_candidate_pairs
+
+class ContactRecorder:
+    """
+    Begin-contact pairs found with NumPy after each Box2D step, in place of a b2ContactListener.
+    With a Python listener installed Box2D calls into Python for every touching contact on
+    every step (PreSolve/PostSolve included), which costs more than the step itself in dense
+    clusters. Here overlapping circles are found on the spatial grid; pairs that already
+    touched in the previous step are skipped, like BeginContact.
+    New pairs (agent ids, smaller id first) go into a growable int32 buffer until cleared.
+    """
+    def __init__(self, world_width, world_height, capacity=4096):
+        self.world_width = world_width
+        self.world_height = world_height
+        self.pairs = np.empty((capacity, 2), dtype=np.int32)
+        self.count = 0
+        self.contact_count = 0  # touching pairs in the last step
+        self._touching = np.zeros(0, dtype=np.int64)  # pair keys of the last step (sorted)
+        self.max_penetration = 0.0  # deepest overlap of the last search, as a fraction of the radius sum
+
+    def record(self, positions, radii, agent_ids):
+        first, second = self.touching_pairs(positions, radii)
+        return self.record_touching(first, second, agent_ids)
+
+    def touching_pairs(self, positions, radii):
+        # slot pairs (first < second) of overlapping circles
+        self.max_penetration = 0.0
+        if len(positions) < 2:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        query, point = grid_candidate_pairs(positions, 2 * float(radii.max()), self.world_width, self.world_height)
+        upper = query < point
+        query, point = query[upper], point[upper]
+        distance = np.linalg.norm(positions[query] - positions[point], axis=1)
+        radius_sum = radii[query] + radii[point]
+        touching = distance < radius_sum
+        if touching.any():
+            self.max_penetration = float(np.max(1.0 - distance[touching] / radius_sum[touching]))
+        return query[touching], point[touching]
+
+    def record_touching(self, first, second, agent_ids):
+        id_a = agent_ids[first].astype(np.int64)
+        id_b = agent_ids[second].astype(np.int64)
+        keys = np.unique((np.minimum(id_a, id_b) << 32) | np.maximum(id_a, id_b))
+        new_keys = keys[~np.isin(keys, self._touching, assume_unique=True)]
+        self._touching = keys
+        self.contact_count = len(keys)
+        self._append(new_keys)
+        return len(new_keys)
+
+    def _append(self, keys):
+        required = self.count + len(keys)
+        if required > len(self.pairs):
+            capacity = len(self.pairs)
+            while capacity < required:
+                capacity *= 2
+            pairs = np.empty((capacity, 2), dtype=np.int32)
+            pairs[:self.count] = self.pairs[:self.count]
+            self.pairs = pairs
+        self.pairs[self.count:required, 0] = keys >> 32
+        self.pairs[self.count:required, 1] = keys & 0xffffffff
+        self.count = required
+
+    def unique_pairs(self):
+        # Pairs recorded since the last clear_pairs(), as (M, 2) int32 without duplicates
+        return np.unique(self.pairs[:self.count], axis=0)
+
+    def clear_pairs(self):
+        self.count = 0
+
+    def clear(self):
+        self.count = 0
+        self.contact_count = 0
+        self._touching = np.zeros(0, dtype=np.int64)
+        self.max_penetration = 0.0
@@ -8,21 +8,26 @@ from log import get_logger
 
 class Creature(pygame.sprite.Sprite):
 
-    def __init__(self, species: int, position: Vector2):
+    def __init__(self, species: int, position: Vector2, atlas=None):
         super().__init__() 
         self.logger = get_logger(self.__class__.__name__)
         self.config_manager = ConfigManager()
         self.species = species
         self.dna: DNASpecies = self.config_manager.get_dna_for_species(species)
         self.position = position
+        self.atlas = atlas
         self._initialize_traits()
         self._initialize_horns()
         self._initialize_shell()
         self.surface_size = self.get_radius() * 2
         self.center = Vector2(self.surface_size / 2, self.surface_size / 2)
-        self.image = pygame.Surface((self.surface_size, self.surface_size), pygame.SRCALPHA)
-        self._create_base_surface()
-        self._create_surface()
+        if self.atlas is not None:
+            # 事前に回転済みの画像を使うので個別の Surface は作らない
+            self.image = self.atlas.get_frame(self.species, self._rotate)
+        else:
+            self.image = pygame.Surface((self.surface_size, self.surface_size), pygame.SRCALPHA)
+            self._create_base_surface()
+            self._create_surface()
         self.rect = self.image.get_rect(center=self.position)
 
 
@@ -106,6 +111,11 @@ class Creature(pygame.sprite.Sprite):
         else:
             self._flash = False
 
+        if self.atlas is not None:
+            self.image = self.atlas.get_frame(self.species, self._rotate, self._flash)
+            self.rect = self.image.get_rect(center=self.position)
+            return
+
         self._create_surface()
         self.rect.center = self.position
 
@@ -7,9 +7,11 @@ from queue import Empty
 import time
 from log import get_logger
 from timer import Timer
+from tracer import traced
+from checkpoint import save_checkpoint, load_checkpoint, restore_checkpoint
 
 class Ecosystem:
-    def __init__(self, queues):
+    def __init__(self, queues, time_func=time.time, lockstep=False):
         self.logger = get_logger(self.__class__.__name__)
         self.logger.info("Initializing Ecosystem")
         self.config_manager = ConfigManager()
@@ -20,22 +22,39 @@ class Ecosystem:
         # AgentsData 
         self.ad = AgentsData(queues)
         # set timer
-        self.add_timer = Timer("add random agent")
-        self.remove_timer = Timer("remove random agent") # Timer
+        self.add_timer = Timer("add random agent", time_func=time_func)
+        self.remove_timer = Timer("remove random agent", time_func=time_func) # Timer
+        # lockstep: Box2D waits for exactly one batch per tick
+        self.lockstep = lockstep
+        self._update_count = 0
         # queue
         self._box2d_to_eco_collisions = queues['box2d_to_eco_collisions'] # Timer
         # ecosystem parameter
         self.env_energy = self.config_manager.get_trait_value('INITIAL_ENV_ENERGY')
         self.producer_threshold = self.config_manager.get_trait_value('PRODUCER_THRESHOLD')
+        self.predator_species = self.config_manager.species_traits['PREDATOR_SPECIES']
+        self.sharing_energy_rate = self.config_manager.species_traits['SHARING_ENERGY_RATE']
         # logger
         self.logger.info(f"Ecosystem initialized with max_agents_num: {self.max_agents_num}, world_size: {self.world_width}x{self.world_height}")
 
-    def initialize(self):
-        self.ad.initialize()
+    def initialize(self, checkpoint_path=None):
+        if checkpoint_path is None:
+            self.ad.initialize()
+            return
+        restore_checkpoint(self, load_checkpoint(checkpoint_path))
+        self.ad.send_initial_data()
+        self.logger.info(f"Ecosystem restored from {checkpoint_path}")
+
+    def save_checkpoint(self, path):
+        save_checkpoint(path, self)
+        self.logger.info(f"Checkpoint saved to {path} ({self.ad.current_agent_count} agents)")
 
+    @traced()
     def update(self):
         self.ad.update()
-        # self.process_collisions()
+        # lockstep: Box2D sends one collision message per tick, from the second tick on
+        self.process_collisions(block=self.lockstep and self._update_count > 0)
+        self._update_count += 1
         # self.env_energy += self.ad.update_life_energy()
         # self.env_energy += self.ad.check_deaths()
         # self.logger.debug(f'total environment energy is {self.env_energy}')
@@ -46,64 +65,93 @@ class Ecosystem:
 
         self.random_add_agents(30,3) 
         # self.random_remove_agents(2,6.1)         
+        self.ad.flush_agent_events(send_empty=self.lockstep)
 
-    def process_collisions(self):
+    @traced()
+    def process_collisions(self, block=False):
         try:
-            collision_data = self._box2d_to_eco_collisions.get_nowait()
-            collisions = collision_data['collisions']
-            for agent_id1, agent_id2 in collisions:
-                self._handle_collision(agent_id1, agent_id2)
+            if block:
+                collision_data = self._box2d_to_eco_collisions.get(timeout=10)
+            else:
+                collision_data = self._box2d_to_eco_collisions.get_nowait()
         except Empty:
-            pass
+            return
+        self.resolve_collisions(collision_data['collisions'])
 
-    def _handle_collision(self, agent_id1, agent_id2):
-        index1 = np.where(self.ad.agent_ids == agent_id1)[0]
-        index2 = np.where(self.ad.agent_ids == agent_id2)[0]
-        
-        if len(index1) == 0 or len(index2) == 0:
-            self.logger.warning(f"Collision detected for non-existent agent(s): {agent_id1}, {agent_id2}")
+    def resolve_collisions(self, collisions):
+        # All contact pairs of a tick at once: predation first, then energy sharing.
+        # An agent takes part in at most one event of each kind per tick (first occurrence wins).
+        pairs = np.asarray(collisions, dtype=np.int64).reshape(-1, 2)
+        index = self.ad.index_of(pairs)
+        index = index[(index >= 0).all(axis=1)]
+        if len(index) == 0:
             return
-        
-        species1 = self.ad.agents['species'][index1[0]]
-        species2 = self.ad.agents['species'][index2[0]]
-    
-        if species1 == species2:
-            # Same species interaction (cooperation)
-            if random.random() < self.config_manager.get_species_trait_value('SHARING_ENERGY_RATE', species1):
-                if self.ad.life_energy[index1] > self.ad.life_energy[index2]:
-                    energy_transfer = min(self.ad.life_gain[index1], self.ad.life_energy[index1] - self.ad.life_energy[index2])
-                    self.ad.life_energy[index1] -= energy_transfer
-                    self.ad.life_energy[index2] += energy_transfer
-                    self.logger.debug(f'life energy transferred {agent_id1} to {agent_id2}. ')
-                else:
-                    energy_transfer = min(self.ad.life_gain[index2], self.ad.life_energy[index2] - self.ad.life_energy[index1])
-                    self.ad.life_energy[index2] -= energy_transfer
-                    self.ad.life_energy[index1] += energy_transfer
-                    self.logger.debug(f'life energy transferred {agent_id2} to {agent_id1}. ')
+        eaten = self._resolve_predation(index)
+        self._resolve_sharing(index, eaten)
 
-        else:
-            # Different species interaction (predation)
-            predator_species = self.config_manager.get_species_trait_value('PREDATOR_SPECIES', species1)
-            if species2 == predator_species:
-                if random.random() < self.ad.predator_rate[index2]:
-                    self.ad.life_energy[index2] += self.ad.life_energy[index1]
-                    self.ad.life_energy[index1] = 0
-            else:
-                predator_species = self.config_manager.get_species_trait_value('PREDATOR_SPECIES', species2)
-                if species1 == predator_species:
-                    if random.random() < self.ad.predator_rate[index1]:
-                        self.ad.life_energy[index1] += self.ad.life_energy[index2]
-                        self.ad.life_energy[index2] = 0
+    def _resolve_predation(self, index):
+        agents = self.ad.agents
+        life_energy = agents['life_energy']
+        species = agents['species'][index]
+        # orient every predator/prey pair as (predator, prey)
+        first_eats = species[:, 0] == self.predator_species[species[:, 1]]
+        second_eats = species[:, 1] == self.predator_species[species[:, 0]]
+        predator = np.concatenate([index[first_eats, 0], index[second_eats, 1]])
+        prey = np.concatenate([index[first_eats, 1], index[second_eats, 0]])
+        order = np.argsort(np.concatenate([np.nonzero(first_eats)[0], np.nonzero(second_eats)[0]]), kind='stable')
+        predator, prey = predator[order], prey[order]
+        success = np.random.random(len(predator)) < agents['predator_rate'][predator]
+        predator, prey = predator[success], prey[success]
+        if len(prey) == 0:
+            return prey
+        # a prey is eaten once, and an agent that is eaten this tick does not eat
+        _, first = np.unique(prey, return_index=True)
+        first = np.sort(first)
+        predator, prey = predator[first], prey[first]
+        keep = ~np.isin(predator, prey)
+        predator, prey = predator[keep], prey[keep]
+        np.add.at(life_energy, predator, life_energy[prey])
+        life_energy[prey] = 0
+        self.logger.debug("Predation events: %s", len(prey))
+        return prey
+
+    def _resolve_sharing(self, index, eaten):
+        agents = self.ad.agents
+        life_energy = agents['life_energy']
+        species = agents['species'][index]
+        same = species[:, 0] == species[:, 1]
+        same &= ~np.isin(index, eaten).any(axis=1)
+        pairs = index[same]
+        pairs = pairs[np.random.random(len(pairs)) < self.sharing_energy_rate[agents['species'][pairs[:, 0]]]]
+        if len(pairs) == 0:
+            return
+        # keep a pair only if it is the first pair of both of its agents
+        _, first = np.unique(pairs.ravel(), return_index=True)
+        first_pair = np.empty(len(agents), dtype=np.int64)
+        first_pair[pairs.ravel()[first]] = first // 2
+        rows = np.arange(len(pairs))
+        pairs = pairs[(first_pair[pairs[:, 0]] == rows) & (first_pair[pairs[:, 1]] == rows)]
+        # the richer agent gives to the poorer one
+        energy = life_energy[pairs]
+        richer = np.where(energy[:, 0] > energy[:, 1], pairs[:, 0], pairs[:, 1])
+        poorer = np.where(energy[:, 0] > energy[:, 1], pairs[:, 1], pairs[:, 0])
+        transfer = np.minimum(agents['life_gain'][richer], life_energy[richer] - life_energy[poorer])
+        life_energy[richer] -= transfer
+        life_energy[poorer] += transfer
+        self.logger.debug("Energy sharing events: %s", len(pairs))
 
     def _add_producer(self):
         if self.env_energy > self.producer_threshold:  # Threshold for adding a new producer
-            position = self.ad.available_species8_positions() + self.rnd_pos(10)
+            position = self.ad.available_species8_positions()
+            if position is None:
+                return
+            position = position + self.rnd_pos(10)
             new_agent_id = self.ad.add_agent(8, position)  # Species 8 is the producer
             if new_agent_id is not None:
-                new_index = np.where(self.ad.agent_ids == new_agent_id)[0][0]
-                self.ad.life_energy[new_index] = 1000  # Initial energy for the new producer
+                new_index = self.ad.id_to_index[new_agent_id]
+                self.ad.agents['life_energy'][new_index] = 1000  # Initial energy for the new producer
                 self.env_energy -= self.producer_threshold
-                self.logger.info(f"Added new producer agent with ID {new_agent_id} at position {position}")
+                self.logger.debug("Added new producer agent with ID %s at position %s", new_agent_id, position)
 
     def random_add_agents(self,num = 5, interval_time = 1):
         if num == 0:
@@ -114,8 +162,9 @@ class Ecosystem:
                 agent_ids = self.ad.available_agent_ids()
                 if len(agent_ids) > 10:
                     agent_id = random.choice(agent_ids)
-                    species = self.ad.agents['species'][agent_id]
-                    position = self.ad.agents['position'][agent_id]
+                    index = self.ad.id_to_index[agent_id]
+                    species = self.ad.agents['species'][index]
+                    position = self.ad.agents['position'][index]
                     if species == 0:
                         self.logger.warning("No agents available for reproduction")
                     else:
@@ -136,7 +185,7 @@ class Ecosystem:
             if len(agent_ids) > 0:
                 agent_id = random.choice(agent_ids)
                 self.ad.remove_agent(agent_id)
-                self.logger.info(f"Removed agent with ID: {agent_id}")
+                self.logger.debug("Removed agent with ID: %s", agent_id)
             else:
                 self.logger.warning("No agents available for removal")
 
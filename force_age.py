@@ -0,0 +1,46 @@
+import numpy as np
+
+class ForceAgeHistogram:
+    """
+    Age of the forces Box2D applies: how many physics frames and milliseconds passed since
+    the positions they were computed from were sent. Ticks that applied no new forces are
+    counted separately (the bodies move without steering on those ticks).
+    """
+    FRAME_EDGES = (0, 1, 2, 3, 4, 5, 10, 20)
+    MS_EDGES = (0, 5, 10, 20, 50, 100, 200, 500)
+    FRAME_LABELS = ('0f', '1f', '2f', '3f', '4f', '5-9f', '10-19f', '20f+')
+    MS_LABELS = ('<5ms', '<10ms', '<20ms', '<50ms', '<100ms', '<200ms', '<500ms', '500ms+')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frame_counts = np.zeros(len(self.FRAME_EDGES), dtype=np.int64)
+        self.ms_counts = np.zeros(len(self.MS_EDGES), dtype=np.int64)
+        self.ages_ms = []
+        self.ticks = 0
+        self.ticks_without_forces = 0
+
+    def record(self, age_frames, age_ms):
+        # bucket i holds EDGES[i] <= age < EDGES[i + 1], the last one everything above
+        self.frame_counts[max(np.searchsorted(self.FRAME_EDGES, age_frames, side='right') - 1, 0)] += 1
+        self.ms_counts[max(np.searchsorted(self.MS_EDGES, age_ms, side='right') - 1, 0)] += 1
+        self.ages_ms.append(age_ms)
+
+    def record_tick(self, applied):
+        self.ticks += 1
+        if not applied:
+            self.ticks_without_forces += 1
+
+    @staticmethod
+    def _format(labels, counts):
+        return " ".join(f"{label}:{count}" for label, count in zip(labels, counts) if count)
+
+    def summary(self):
+        if not self.ages_ms:
+            return f"no forces applied in {self.ticks} ticks"
+        ages = np.asarray(self.ages_ms)
+        return (f"frames [{self._format(self.FRAME_LABELS, self.frame_counts)}] "
+                f"ms [{self._format(self.MS_LABELS, self.ms_counts)}] "
+                f"p50={np.percentile(ages, 50):.1f}ms p95={np.percentile(ages, 95):.1f}ms "
+                f"ticks without new forces: {self.ticks_without_forces}/{self.ticks}")
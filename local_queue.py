@@ -0,0 +1,36 @@
+from collections import deque
+from queue import Empty
+
+class LocalQueue:
+    """
+    In-process stand-in for mp.Queue, used when all components run in one loop.
+    Items are handed over by reference (no pickling). With latest_only=True only the
+    newest item is kept, like a per-frame channel whose reader skips stale frames.
+    """
+    def __init__(self, latest_only=False):
+        self._items = deque(maxlen=1 if latest_only else None)
+
+    def put(self, data, block=True, timeout=None):
+        self._items.append(data)
+
+    def put_nowait(self, data):
+        self._items.append(data)
+
+    def get(self, block=True, timeout=None):
+        # Nothing else can fill the queue while we wait, so never block
+        return self.get_nowait()
+
+    def get_nowait(self):
+        try:
+            return self._items.popleft()
+        except IndexError:
+            raise Empty
+
+    def empty(self):
+        return not self._items
+
+    def full(self):
+        return False
+
+    def qsize(self):
+        return len(self._items)
@@ -0,0 +1,85 @@
+import sys
+import time
+import random
+import multiprocessing as mp
+import numpy as np
+from log import get_logger
+
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    if 'tensorflow' in sys.modules:
+        tf = sys.modules['tensorflow']
+        tf.random.set_seed(seed)
+        tf.config.experimental.enable_op_determinism()
+
+class LockstepStage:
+    """Worker side of one stage: wait for the coordinator, run one update, report back."""
+    def __init__(self, go, done):
+        self.go = go
+        self.done = done
+
+    def wait(self, running):
+        while not self.go.wait(0.1):
+            if not running.value:
+                return False
+        self.go.clear()
+        return True
+
+    def finish(self):
+        self.done.set()
+
+class LockstepScheduler:
+    """
+    Coordinator for the lockstep mode. Every tick it releases Ecosystem -> TensorFlow -> Box2D
+    one after another, so each stage sees the complete output of the previous one.
+    Time-based logic reads sim_time() (tick * DT) instead of the wall clock, which together
+    with seeded RNGs makes a run reproducible.
+    """
+    STAGES = ('Ecosystem', 'TensorFlow', 'Box2D')
+
+    def __init__(self, dt, seed=0, report_interval=5):
+        self.logger = get_logger(self.__class__.__name__)
+        self.dt = dt
+        self.seed = seed
+        self.report_interval = report_interval
+        self.tick = mp.Value('q', 0)
+        self._go = {name: mp.Event() for name in self.STAGES}
+        self._done = {name: mp.Event() for name in self.STAGES}
+        self.latency = {name: [] for name in self.STAGES}
+        self.last_report = time.time()
+
+    def stage(self, name):
+        return LockstepStage(self._go[name], self._done[name])
+
+    def sim_time(self):
+        return self.tick.value * self.dt
+
+    def run_tick(self, running):
+        if self.tick.value == 0:
+            self.last_report = time.time()
+        for name in self.STAGES:
+            start_time = time.perf_counter()
+            self._go[name].set()
+            while not self._done[name].wait(0.1):
+                if not running.value:
+                    return False
+            self._done[name].clear()
+            self.latency[name].append((time.perf_counter() - start_time) * 1000)
+        self.tick.value += 1
+        if time.time() - self.last_report >= self.report_interval:
+            self.report()
+        return True
+
+    def report(self):
+        # per-stage latency (ms) measured by the coordinator, including the hand-off
+        parts = []
+        total = 0
+        for name, values in self.latency.items():
+            if values:
+                mean = float(np.mean(values))
+                total += mean
+                parts.append(f"{name}={mean:.2f}/{float(np.max(values)):.2f}")
+        self.logger.info(f"Lockstep tick {self.tick.value} latency(ms, mean/max): " + ", ".join(parts) + f", tick={total:.2f}")
+        self.latency = {name: [] for name in self.STAGES}
+        self.last_report = time.time()
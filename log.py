@@ -24,7 +24,10 @@ if __name__ == "__main__":
 
 import logging
 import sys
-from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+import time
+import queue
+import atexit
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler, QueueHandler, QueueListener
 import os
 from datetime import datetime
 
@@ -45,13 +48,43 @@ class ColoredFormatter(logging.Formatter):
         return f"{self.COLORS.get(record.levelname, self.COLORS['RESET'])}{log_message}{self.COLORS['RESET']}"
 
 class ClassNameFilter(logging.Filter):
-    """クラス名をログレコードに追加するフィルター"""
+    """クラス名をログレコードに追加するフィルター（get_logger を通さないレコード用の既定値）"""
     def __init__(self, class_name):
         super().__init__()
         self.class_name = class_name
 
     def filter(self, record):
-        record.classname = self.class_name
+        if not hasattr(record, 'classname'):
+            record.classname = self.class_name
+        return True
+
+class RateLimitFilter(logging.Filter):
+    """
+    呼び出し箇所（ファイル・行）ごとに1秒あたり max_per_second 件まで通すフィルター。
+    捨てた件数は次に通るレコードの末尾に付ける。max_per_second が 0 なら無制限。
+    """
+    def __init__(self, max_per_second=0):
+        super().__init__()
+        self.max_per_second = max_per_second
+        self._sites = {}  # (pathname, lineno) -> [window start, passed, suppressed]
+
+    def filter(self, record):
+        if self.max_per_second <= 0:
+            return True
+        now = time.monotonic()
+        site = self._sites.get((record.pathname, record.lineno))
+        if site is None:
+            self._sites[(record.pathname, record.lineno)] = [now, 1, 0]
+            return True
+        if now - site[0] >= 1.0:
+            site[0], site[1] = now, 0
+        if site[1] >= self.max_per_second:
+            site[2] += 1
+            return False
+        site[1] += 1
+        if site[2]:
+            record.msg = f"{record.msg} (suppressed {site[2]} similar messages)"
+            site[2] = 0
         return True
 
 class SimulationLogger:
@@ -62,6 +95,13 @@ class SimulationLogger:
         
         self.logger = logging.getLogger('SimulationLogger')
         self.logger.setLevel(logging.DEBUG)
+        self.logger.addFilter(ClassNameFilter('SimulationLogger'))
+        self.rate_limit_filter = RateLimitFilter()
+        self.logger.addFilter(self.rate_limit_filter)
+        self.adapters = {}
+        self.handlers = []
+        self.listener = None
+        self.listener_pid = None
 
         self.setup_handlers()
 
@@ -71,26 +111,59 @@ class SimulationLogger:
         main_file_handler = RotatingFileHandler(main_log_path, maxBytes=10*1024*1024, backupCount=5)
         main_file_handler.setLevel(logging.DEBUG)
         main_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(classname)s - %(levelname)s - %(message)s'))
-        self.logger.addHandler(main_file_handler)
+        self.handlers.append(main_file_handler)
 
         # エラーログファイルのハンドラ
         error_log_path = os.path.join(self.log_dir, 'error.log')
         error_file_handler = TimedRotatingFileHandler(error_log_path, when='midnight', interval=1, backupCount=7)
         error_file_handler.setLevel(logging.WARNING)  # WARNING以上のみ
         error_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(classname)s - %(levelname)s - %(message)s'))
-        self.logger.addHandler(error_file_handler)
+        self.handlers.append(error_file_handler)
 
         # コンソール出力用のハンドラ
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setLevel(logging.DEBUG)
         console_handler.setFormatter(ColoredFormatter('%(asctime)s - %(classname)s - %(levelname)s - %(message)s'))
-        self.logger.addHandler(console_handler)
+        self.handlers.append(console_handler)
+        for handler in self.handlers:
+            self.logger.addHandler(handler)
 
     def get_logger(self, name):
-        """名前付きのロガーを取得するメソッド"""
-        logger = logging.LoggerAdapter(self.logger, extra={'classname': name})
-        logger.logger.addFilter(ClassNameFilter(name))
-        return logger
+        """名前付きのロガーを取得するメソッド（クラス名は LoggerAdapter の extra で付ける）"""
+        if name not in self.adapters:
+            self.adapters[name] = logging.LoggerAdapter(self.logger, extra={'classname': name})
+        return self.adapters[name]
+
+    def start_async_logging(self):
+        """
+        ハンドラの書き込みを専用スレッドに移す。呼び出し側は QueueHandler でキューに積むだけなので、
+        ファイルやコンソールの I/O でティックが止まらない。プロセスごとに呼ぶ（fork ではスレッドが引き継がれない）。
+        """
+        if self.listener is not None and self.listener_pid == os.getpid():
+            return
+        log_queue = queue.SimpleQueue()
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(QueueHandler(log_queue))
+        self.listener = QueueListener(log_queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        self.listener_pid = os.getpid()
+        atexit.register(self.stop_async_logging)
+
+    def stop_async_logging(self):
+        """キューに残ったレコードを書き出してから、ハンドラを直接書き込みに戻す"""
+        if self.listener is None or self.listener_pid != os.getpid():
+            return
+        self.listener.stop()
+        self.listener = None
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        for handler in self.handlers:
+            self.logger.addHandler(handler)
+
+    def set_rate_limit(self, max_per_second):
+        """呼び出し箇所ごとの1秒あたりの上限（0 で無制限）"""
+        self.rate_limit_filter.max_per_second = max_per_second
 
     def set_log_level(self, level):
         """ログレベルを動的に変更するメソッド"""
@@ -110,4 +183,13 @@ def get_logger(name=None):
 
 # ログレベルを変更する関数
 def set_log_level(level):
-    simulation_logger.set_log_level(level)
\ No newline at end of file
+    simulation_logger.set_log_level(level)
+
+def start_async_logging():
+    simulation_logger.start_async_logging()
+
+def stop_async_logging():
+    simulation_logger.stop_async_logging()
+
+def set_rate_limit(max_per_second):
+    simulation_logger.set_rate_limit(max_per_second)
\ No newline at end of file
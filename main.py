@@ -1,28 +1,65 @@
 import pygame
+import os
 import time
 import numpy as np
-import tensorflow as tf
+import argparse
+import functools
 import multiprocessing as mp
-from tensorflow_simulation import TensorFlowSimulation
 from box2d_simulation import Box2DSimulation
 from visual_system import VisualSystem
 from ecosystem import Ecosystem
 from config_manager import ConfigManager
-from parameter_control_ui import *
+from shared_frame_buffer import SharedFrameBuffer
+from null_queue import NullQueue
+from local_queue import LocalQueue
+from lockstep import LockstepScheduler, seed_everything
 from timer import Timer
-from log import get_logger, set_log_level
+from tracer import tracer, clear_traces, merge_traces
+from metrics import NullMetrics, simulation_metrics, DEFAULT_NAME as DEFAULT_METRICS_NAME
+from log import get_logger, set_log_level, set_rate_limit, start_async_logging, stop_async_logging
 import logging
 
 from TEST.performance_tracker import PerformanceTracker
 
 logger = get_logger(__name__)
 
-def eco_run(queues, shared_memory, running, initialization_complete, eco_init_done):
-    ecosystem = Ecosystem(queues)
+def setup_process_logging():
+    # per process: the writer thread of async logging does not survive fork
+    config_manager = ConfigManager()
+    set_rate_limit(config_manager.get_trait_value('LOG_RATE_LIMIT'))
+    if config_manager.get_trait_value('LOG_ASYNC'):
+        start_async_logging()
+
+def process_logging(run_func):
+    # Process entry point: set up logging, and flush the writer thread on every way out.
+    # Children exit through os._exit, so atexit never flushes it there.
+    @functools.wraps(run_func)
+    def wrapper(*args, **kwargs):
+        setup_process_logging()
+        try:
+            return run_func(*args, **kwargs)
+        finally:
+            stop_async_logging()
+    return wrapper
+
+@process_logging
+def eco_run(queues, shared_memory, running, initialization_complete, eco_init_done, target_fps=300, lockstep=None, trace_dir=None,
+            metrics=None, checkpoint_path=None, restore_path=None):
+    metrics = metrics or NullMetrics()
+    if trace_dir is not None:
+        tracer.enable('Ecosystem', trace_dir)
+    if lockstep is not None:
+        seed_everything(lockstep.seed)
+        ecosystem = Ecosystem(queues, time_func=lockstep.sim_time, lockstep=True)
+        stage = lockstep.stage('Ecosystem')
+    else:
+        ecosystem = Ecosystem(queues)
     timer = Timer("Ecosystem")
+    checkpoint_interval = ConfigManager().get_trait_value('CHECKPOINT_INTERVAL')
+    checkpoint_timer = Timer("Checkpoint", time_func=lockstep.sim_time if lockstep is not None else time.time)
     
     try:
-        ecosystem.initialize()
+        ecosystem.initialize(restore_path)
         eco_init_done.set()  # Signal that Ecosystem initialization is complete
         initialization_complete['Ecosystem'].set()
         logger.info("Ecosystem initialization complete")
@@ -32,26 +69,67 @@ def eco_run(queues, shared_memory, running, initialization_complete, eco_init_do
         return
     
     clock = pygame.time.Clock()
-    target_fps = 300
     
     while running.value:
         try:
+            if lockstep is not None and not stage.wait(running):
+                break
             timer.start()
+            start_time = time.perf_counter()
             ecosystem.update()
+            metrics.observe('Ecosystem.update', (time.perf_counter() - start_time) * 1000)
+            metrics.inc('Ecosystem.ticks')
+            metrics.set('Ecosystem.agents', ecosystem.ad.current_agent_count)
+            metrics.set('Ecosystem.env_energy', ecosystem.env_energy)
+            if checkpoint_path is not None and checkpoint_interval > 0 and checkpoint_timer.interval_timer(checkpoint_interval):
+                ecosystem.save_checkpoint(checkpoint_path)
             timer.print_fps(5)
             
-            # Limit the frame rate to 60 FPS
-            clock.tick(target_fps)
+            if lockstep is not None:
+                stage.finish()
+            else:
+                # target_fps == 0 runs uncapped
+                clock.tick(target_fps)
             
         except Exception as e:
             logger.exception(f"Error in Ecosystem update: {e}")
             running.value = False
             break
     
+    if checkpoint_path is not None:
+        ecosystem.save_checkpoint(checkpoint_path)
+    tracer.dump()
     logger.info("Ecosystem process ending")
 
-def tf_run(queues, shared_memory, running, initialization_complete, eco_init_done):
-    tensorflow = TensorFlowSimulation(queues)
+def create_force_simulation(queues):
+    # TensorFlow is imported only when it is the selected backend
+    backend = ConfigManager().get_trait_value('FORCE_BACKEND')
+    if backend == 'numpy':
+        from numpy_simulation import NumpySimulation
+        return NumpySimulation(queues)
+    elif backend == 'tensorflow':
+        from tensorflow_simulation import TensorFlowSimulation
+        return TensorFlowSimulation(queues)
+    raise ValueError(f"Unknown FORCE_BACKEND: {backend}")
+
+def create_physics_simulation(queues, lockstep=False):
+    backend = ConfigManager().get_trait_value('PHYSICS_BACKEND')
+    if backend == 'numpy':
+        from numpy_physics import NumpyPhysicsSimulation
+        return NumpyPhysicsSimulation(queues, lockstep=lockstep)
+    elif backend == 'box2d':
+        return Box2DSimulation(queues, lockstep=lockstep)
+    raise ValueError(f"Unknown PHYSICS_BACKEND: {backend}")
+
+@process_logging
+def tf_run(queues, shared_memory, running, initialization_complete, eco_init_done, lockstep=None, trace_dir=None, metrics=None):
+    metrics = metrics or NullMetrics()
+    if trace_dir is not None:
+        tracer.enable('TensorFlow', trace_dir)
+    tensorflow = create_force_simulation(queues)
+    if lockstep is not None:
+        seed_everything(lockstep.seed)
+        stage = lockstep.stage('TensorFlow')
     timer = Timer("TensorFlow")
     
     try:
@@ -66,18 +144,38 @@ def tf_run(queues, shared_memory, running, initialization_complete, eco_init_don
     
     while running.value:
         try:
+            if lockstep is not None and not stage.wait(running):
+                break
             timer.start()
+            start_time = time.perf_counter()
             tensorflow.update()
+            update_time = (time.perf_counter() - start_time) * 1000
+            shared_memory['tf_time'].value = update_time
+            metrics.observe('TensorFlow.update', update_time)
+            metrics.inc('TensorFlow.ticks')
             timer.print_fps(5)
+            if lockstep is not None:
+                stage.finish()
         except Exception as e:
             logger.exception(f"Error in TensorFlow update: {e}")
             running.value = False
             break
     
+    tracer.dump()
     logger.info("TensorFlow process ending")
 
-def box2d_run(queues, shared_memory, running, initialization_complete, eco_init_done):
-    box2d = Box2DSimulation(queues)
+@process_logging
+def box2d_run(queues, shared_memory, running, initialization_complete, eco_init_done, target_fps=100, lockstep=None, trace_dir=None,
+              metrics=None):
+    metrics = metrics or NullMetrics()
+    if trace_dir is not None:
+        tracer.enable('Box2D', trace_dir)
+    if lockstep is not None:
+        seed_everything(lockstep.seed)
+        box2d = create_physics_simulation(queues, lockstep=True)
+        stage = lockstep.stage('Box2D')
+    else:
+        box2d = create_physics_simulation(queues)
     timer = Timer("Box2D")
     
     try:
@@ -91,25 +189,43 @@ def box2d_run(queues, shared_memory, running, initialization_complete, eco_init_
         return
     
     clock = pygame.time.Clock()
-    target_fps = 100
     
     while running.value:
         try:
+            if lockstep is not None and not stage.wait(running):
+                break
             timer.start()
+            start_time = time.perf_counter()
             box2d.update()
+            update_time = (time.perf_counter() - start_time) * 1000
+            shared_memory['box2d_time'].value = update_time
+            metrics.observe('Box2D.update', update_time)
+            for phase, phase_time in box2d.timings.items():
+                metrics.observe(f"Box2D.{phase}", phase_time)
+            metrics.inc('Box2D.ticks')
+            metrics.set('Box2D.agents', box2d.current_agent_count)
+            metrics.set('Box2D.contact_pairs', box2d.contact_recorder.contact_count)
             # time.sleep(0.001)
             timer.print_fps(5)
             
-            clock.tick(target_fps)
+            if lockstep is not None:
+                stage.finish()
+            else:
+                clock.tick(target_fps)
         except Exception as e:
             logger.exception(f"Error in Box2D update: {e}")
             running.value = False
             break
     
+    tracer.dump()
     logger.info("Box2D process ending")
     
+@process_logging
 @PerformanceTracker.measure_time
-def visual_system_run(queues, shared_memory, running, initialization_complete, eco_init_done):
+def visual_system_run(queues, shared_memory, running, initialization_complete, eco_init_done, trace_dir=None, metrics=None):
+    metrics = metrics or NullMetrics()
+    if trace_dir is not None:
+        tracer.enable('Visual', trace_dir)
     timer = Timer("Render ")
     visual_system = VisualSystem(queues)
     
@@ -126,7 +242,10 @@ def visual_system_run(queues, shared_memory, running, initialization_complete, e
     while running.value:
         try:
             timer.start()
+            start_time = time.perf_counter()
             visual_system.update()
+            metrics.observe('Visual.update', (time.perf_counter() - start_time) * 1000)
+            metrics.inc('Visual.ticks')
             timer.print_fps(5)
             # time.sleep(0.001)
         except Exception as e:
@@ -135,18 +254,25 @@ def visual_system_run(queues, shared_memory, running, initialization_complete, e
             break
     
     visual_system.cleanup()
+    tracer.dump()
     logger.info("Visual System process ending")
 
-def run_simulation():
-    logger.info("Starting simulation")
+def run_simulation(headless=False, duration=None, lockstep=False, seed=0, ticks=None, trace_dir=None, metrics_name=None,
+                   checkpoint_path=None, restore_path=None):
+    # headless: no Visual / UI process and uncapped tick rates, for compute nodes without a display
+    # lockstep: the main process advances Ecosystem -> TensorFlow -> Box2D one tick at a time
+    # trace_dir: every process writes its spans there, merged into trace_dir/trace.json at the end
+    # metrics_name: shared memory block for metrics_viewer.py
+    # checkpoint_path: Ecosystem saves its state there periodically and at exit; restore_path: start from a checkpoint
+    setup_process_logging()
+    logger.info(f"Starting simulation{' (headless)' if headless else ''}{' (lockstep)' if lockstep else ''}")
     config_manager = ConfigManager()
+    if lockstep and config_manager.get_trait_value('IPC_MODE') != 'shared_memory':
+        raise ValueError("Lockstep mode requires IPC_MODE=shared_memory")
+    if trace_dir is not None:
+        clear_traces(trace_dir)
     
     shared_memory = {
-        'positions': mp.Array('f', config_manager.get_trait_value('MAX_AGENTS_NUM') * 2),
-        'velocities': mp.Array('f', config_manager.get_trait_value('MAX_AGENTS_NUM') * 2),
-        'forces': mp.Array('f', config_manager.get_trait_value('MAX_AGENTS_NUM') * 2),
-        'agent_ids': mp.Array('i', config_manager.get_trait_value('MAX_AGENTS_NUM')),
-        'species': mp.Array('i', config_manager.get_trait_value('MAX_AGENTS_NUM')),
         'current_agent_count': mp.Value('i', 0),
         'tf_time': mp.Value('d', 0.0),
         'box2d_time': mp.Value('d', 0.0),
@@ -181,22 +307,58 @@ def run_simulation():
         'box2d_to_eco_collisions': mp.Queue(maxsize=1)
     }
 
+    if config_manager.get_trait_value('IPC_MODE') == 'shared_memory':
+        # Per-frame data goes through shared memory instead of pickled queues
+        max_agents_num = config_manager.get_trait_value('MAX_AGENTS_NUM')
+        box2d_frames = SharedFrameBuffer(max_agents_num, {
+            'positions': ('f', 2),
+            'velocities': ('f', 2),
+            'species': ('i', 1),
+            'agent_ids': ('i', 1),
+        })
+        queues['box2d_to_tf'] = box2d_frames
+        queues['box2d_to_eco'] = box2d_frames
+        queues['box2d_to_visual_render'] = box2d_frames
+        queues['tf_to_box2d'] = SharedFrameBuffer(max_agents_num, {
+            'forces': ('f', 2),
+            'agent_ids': ('i', 1),
+        })
+
+    if headless:
+        # Nobody reads the Visual queues, so drop what is sent to them
+        queues['eco_to_visual_init'] = NullQueue()
+        queues['eco_to_visual'] = NullQueue()
+        if not isinstance(queues['box2d_to_visual_render'], SharedFrameBuffer):
+            queues['box2d_to_visual_render'] = NullQueue()
+
     initialization_complete = {
         'Ecosystem': mp.Event(),
         'TensorFlow': mp.Event(),
-        'Box2D': mp.Event(),
-        'Visual': mp.Event()
+        'Box2D': mp.Event()
     }
+    if not headless:
+        initialization_complete['Visual'] = mp.Event()
     running = mp.Value('b', True)
     eco_init_done = mp.Event()  # New event to signal Ecosystem initialization completion
 
+    scheduler = LockstepScheduler(config_manager.get_trait_value('DT'), seed) if lockstep else None
+    eco_fps, box2d_fps = (0, 0) if headless else (300, 100)
+    # queue depths are sampled by the main process; shared frame buffers and null queues have none
+    depth_queues = {name: queue for name, queue in queues.items() if not isinstance(queue, (SharedFrameBuffer, NullQueue))}
+    metrics = simulation_metrics(depth_queues, metrics_name) if metrics_name is not None else None
+    process_kwargs = {'trace_dir': trace_dir, 'metrics': metrics}
     processes = [
-        mp.Process(target=eco_run, args=(queues, shared_memory, running, initialization_complete, eco_init_done), name='Ecosystem'),
-        mp.Process(target=tf_run, args=(queues, shared_memory, running, initialization_complete, eco_init_done), name="TensorFlow"),
-        mp.Process(target=box2d_run, args=(queues, shared_memory, running, initialization_complete, eco_init_done), name="Box2D"),
-        mp.Process(target=visual_system_run, args=(queues, shared_memory, running, initialization_complete, eco_init_done), name="Visual"),
-        mp.Process(target=run_parameter_control_ui, args=(shared_memory, queues, running), name="ParameterControlUI")
+        mp.Process(target=eco_run, args=(queues, shared_memory, running, initialization_complete, eco_init_done, eco_fps, scheduler),
+                   kwargs=dict(process_kwargs, checkpoint_path=checkpoint_path, restore_path=restore_path), name='Ecosystem'),
+        mp.Process(target=tf_run, args=(queues, shared_memory, running, initialization_complete, eco_init_done, scheduler), kwargs=process_kwargs, name="TensorFlow"),
+        mp.Process(target=box2d_run, args=(queues, shared_memory, running, initialization_complete, eco_init_done, box2d_fps, scheduler), kwargs=process_kwargs, name="Box2D")
     ]
+    if not headless:
+        from parameter_control_ui import run_parameter_control_ui
+        processes += [
+            mp.Process(target=visual_system_run, args=(queues, shared_memory, running, initialization_complete, eco_init_done), kwargs=process_kwargs, name="Visual"),
+            mp.Process(target=run_parameter_control_ui, args=(shared_memory, queues, running), name="ParameterControlUI")
+        ]
 
     for process in processes:
         logger.info(f"Starting {process.name} process")
@@ -213,19 +375,135 @@ def run_simulation():
     # 全てのプロセスが初期化完了したことを通知
     logger.info("All processes initialized and running")
 
+    start_time = time.time()
     try:
         while all(p.is_alive() for p in processes):
-            time.sleep(1)
+            if duration is not None and time.time() - start_time >= duration:
+                logger.info(f"Duration of {duration}s reached")
+                break
+            if scheduler is not None:
+                if ticks is not None and scheduler.tick.value >= ticks:
+                    logger.info(f"{ticks} ticks reached")
+                    break
+                if not scheduler.run_tick(running):
+                    break
+            else:
+                time.sleep(1)
+            if metrics is not None:
+                sample_queue_depths(metrics, depth_queues)
     except KeyboardInterrupt:
         logger.info("Caught KeyboardInterrupt, terminating processes")
     finally:
+        if scheduler is not None:
+            scheduler.report()
         running.value = False
+        # let the loops see running=False and finish (trace files are written on the way out)
+        for p in processes:
+            p.join(timeout=5)
         for p in processes:
-            p.terminate()
-            p.join()
+            if p.is_alive():
+                logger.warning(f"{p.name} did not stop in time, terminating")
+                p.terminate()
+                p.join()
+        if trace_dir is not None:
+            write_trace(trace_dir)
+        if metrics is not None:
+            metrics.close()
+
+    logger.info("Simulation ended")
+
+def sample_queue_depths(metrics, queues):
+    for name, queue in queues.items():
+        try:
+            metrics.set(f"queue.{name}", queue.qsize())
+        except NotImplementedError:
+            # qsize is not available on macOS
+            pass
+
+def write_trace(trace_dir):
+    path = os.path.join(trace_dir, 'trace.json')
+    num_spans = merge_traces(trace_dir, path)
+    logger.info(f"Trace with {num_spans} spans written to {path} (open in chrome://tracing or ui.perfetto.dev)")
+
+def run_single_process(headless=False, duration=None, trace_dir=None, checkpoint_path=None, restore_path=None):
+    # Ecosystem, force backend, Box2D (and Visual) in one loop, handing arrays over by reference.
+    # For small populations, where pickling and process switches cost more than the simulation.
+    setup_process_logging()
+    logger.info(f"Starting single-process simulation{' (headless)' if headless else ''}")
+    if trace_dir is not None:
+        clear_traces(trace_dir)
+        tracer.enable('SingleProcess', trace_dir)
+    queues = {name: LocalQueue() for name in (
+        'eco_to_box2d_init', 'eco_to_box2d', 'eco_to_tf_init', 'eco_to_visual_init', 'eco_to_visual', 'ui_to_tensorflow')}
+    queues.update({name: LocalQueue(latest_only=True) for name in (
+        'eco_to_tf', 'box2d_to_visual_render', 'box2d_to_tf', 'box2d_to_eco', 'tf_to_box2d', 'box2d_to_eco_collisions')})
+    if headless:
+        queues['eco_to_visual_init'] = NullQueue()
+        queues['eco_to_visual'] = NullQueue()
+        queues['box2d_to_visual_render'] = NullQueue()
+
+    ecosystem = Ecosystem(queues)
+    ecosystem.initialize(restore_path)
+    force_simulation = create_force_simulation(queues)
+    force_simulation.initialize()
+    box2d = create_physics_simulation(queues)
+    box2d.initialize()
+    visual_system = None
+    if not headless:
+        visual_system = VisualSystem(queues)
+        visual_system.initialize()
+    logger.info("All components initialized")
+
+    timer = Timer("Single process")
+    checkpoint_interval = ConfigManager().get_trait_value('CHECKPOINT_INTERVAL')
+    checkpoint_timer = Timer("Checkpoint")
+    clock = pygame.time.Clock()
+    target_fps = 0 if headless else 100
+    start_time = time.time()
+    try:
+        while duration is None or time.time() - start_time < duration:
+            timer.start()
+            ecosystem.update()
+            force_simulation.update()
+            box2d.update()
+            if visual_system is not None:
+                visual_system.update()
+            if checkpoint_path is not None and checkpoint_interval > 0 and checkpoint_timer.interval_timer(checkpoint_interval):
+                ecosystem.save_checkpoint(checkpoint_path)
+            timer.print_fps(5)
+            clock.tick(target_fps)
+    except KeyboardInterrupt:
+        logger.info("Caught KeyboardInterrupt, stopping")
+    finally:
+        if visual_system is not None:
+            visual_system.cleanup()
+        if checkpoint_path is not None:
+            ecosystem.save_checkpoint(checkpoint_path)
+        if trace_dir is not None:
+            tracer.dump()
+            write_trace(trace_dir)
 
     logger.info("Simulation ended")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', action='store_true', help='run without Visual and UI processes, uncapped tick rates')
+    parser.add_argument('--duration', type=float, default=None, help='stop after this many seconds')
+    parser.add_argument('--lockstep', action='store_true', help='advance Ecosystem -> TensorFlow -> Box2D in a fixed order per tick')
+    parser.add_argument('--seed', type=int, default=0, help='RNG seed for lockstep mode')
+    parser.add_argument('--ticks', type=int, default=None, help='stop after this many lockstep ticks')
+    parser.add_argument('--single-process', action='store_true', help='run every component in one process (small populations)')
+    parser.add_argument('--metrics', metavar='NAME', nargs='?', const=DEFAULT_METRICS_NAME, default=None,
+                        help='publish metrics in shared memory for metrics_viewer.py')
+    parser.add_argument('--checkpoint', metavar='PATH', default=None,
+                        help='save the world to PATH (.npz) every CHECKPOINT_INTERVAL seconds and at exit')
+    parser.add_argument('--restore', metavar='PATH', default=None, help='start from a checkpoint instead of the initial seeding')
+    parser.add_argument('--trace', metavar='DIR', default=None, help='record per-process spans and write a Chrome trace to DIR/trace.json')
+    args = parser.parse_args()
     set_log_level(logging.WARNING)  # ログレベルを設定（必要に応じて変更可能）
-    run_simulation()
\ No newline at end of file
+    if args.single_process:
+        run_single_process(headless=args.headless, duration=args.duration, trace_dir=args.trace,
+                           checkpoint_path=args.checkpoint, restore_path=args.restore)
+    else:
+        run_simulation(headless=args.headless, duration=args.duration, lockstep=args.lockstep, seed=args.seed, ticks=args.ticks,
+                       trace_dir=args.trace, metrics_name=args.metrics, checkpoint_path=args.checkpoint, restore_path=args.restore)
\ No newline at end of file
@@ -0,0 +1,147 @@
+import os
+import json
+import bisect
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+DEFAULT_NAME = 'yaorozu_metrics'
+# step time buckets (ms); the last bucket holds everything above
+LATENCY_EDGES_MS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+class MetricsRegistry:
+    """
+    Counters, gauges and fixed-bucket histograms in one named shared-memory block.
+    Every value has a single writing process, so updates are plain float64 stores with no
+    lock or queue. The block starts with its own layout as JSON, so a viewer in another
+    terminal can attach by name (see metrics_viewer.py).
+
+    Layout: [header length (int64)] [layout JSON] [values (float64)]; a histogram takes
+    len(edges) + 1 bucket counts followed by its count and sum.
+    """
+    def __init__(self, counters=(), gauges=(), histograms=(), edges=LATENCY_EDGES_MS, name=DEFAULT_NAME):
+        layout = {'counters': list(counters), 'gauges': list(gauges), 'histograms': list(histograms),
+                  'edges': list(edges), 'owner_pid': os.getpid()}
+        names = layout['counters'] + layout['gauges'] + layout['histograms']
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate metric names in {names}")
+        header = json.dumps(layout).encode()
+        offset = (8 + len(header) + 7) // 8 * 8
+        size = offset + 8 * self._num_values(layout)
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left over from a run that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._shm.buf[:8] = np.int64(len(header)).tobytes()
+        self._shm.buf[8:8 + len(header)] = header
+        self.name = name
+        self._owner = True
+        self._setup(layout, offset)
+        self.values[:] = 0
+
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME):
+        registry = cls.__new__(cls)
+        registry._shm = shared_memory.SharedMemory(name=name)
+        registry.name = name
+        registry._owner = False
+        header_length = int(np.frombuffer(registry._shm.buf[:8], dtype=np.int64)[0])
+        layout = json.loads(bytes(registry._shm.buf[8:8 + header_length]).decode())
+        # Opening registers the block with this process tree's resource tracker, which would
+        # unlink it when the viewer exits. The owner and its children share the owner's tracker.
+        if layout['owner_pid'] not in (os.getpid(), os.getppid()):
+            resource_tracker.unregister(registry._shm._name, 'shared_memory')
+        registry._setup(layout, (8 + header_length + 7) // 8 * 8)
+        return registry
+
+    @staticmethod
+    def _num_values(layout):
+        return len(layout['counters']) + len(layout['gauges']) + len(layout['histograms']) * (len(layout['edges']) + 3)
+
+    def _setup(self, layout, offset):
+        self.layout = layout
+        self.edges = tuple(layout['edges'])
+        self.values = np.ndarray(self._num_values(layout), dtype=np.float64, buffer=self._shm.buf, offset=offset)
+        self._index = {}
+        position = 0
+        for name in layout['counters'] + layout['gauges']:
+            self._index[name] = position
+            position += 1
+        self._histogram_width = len(self.edges) + 3
+        for name in layout['histograms']:
+            self._index[name] = position
+            position += self._histogram_width
+
+    def __getstate__(self):
+        return {'name': self.name}
+
+    def __setstate__(self, state):
+        # child processes attach to the block by name
+        self.__dict__.update(MetricsRegistry.attach(state['name']).__dict__)
+
+    # ---------------- writer -----------------------
+
+    def inc(self, name, value=1):
+        self.values[self._index[name]] += value
+
+    def set(self, name, value):
+        self.values[self._index[name]] = value
+
+    def observe(self, name, value):
+        start = self._index[name]
+        self.values[start + bisect.bisect_left(self.edges, value)] += 1
+        self.values[start + self._histogram_width - 2] += 1
+        self.values[start + self._histogram_width - 1] += value
+
+    # ---------------- reader -----------------------
+
+    def get(self, name):
+        return float(self.values[self._index[name]])
+
+    def histogram(self, name):
+        # (bucket counts, count, sum)
+        start = self._index[name]
+        values = self.values[start:start + self._histogram_width].copy()
+        return values[:-2], float(values[-2]), float(values[-1])
+
+    def percentile(self, name, q):
+        # upper edge of the bucket holding the q-th percentile (inf for the overflow bucket)
+        buckets, count, _ = self.histogram(name)
+        if count == 0:
+            return float('nan')
+        bucket = int(np.searchsorted(np.cumsum(buckets), count * q / 100))
+        return self.edges[bucket] if bucket < len(self.edges) else float('inf')
+
+    def close(self):
+        del self.values
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+class NullMetrics:
+    """Metrics stand-in when no registry is shared (tests, single-process mode)."""
+    def inc(self, name, value=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+def simulation_metrics(queue_names=(), name=DEFAULT_NAME):
+    # Metrics written by main.run_simulation and its processes
+    stages = {
+        'Ecosystem': ('update',),
+        'TensorFlow': ('update',),
+        'Box2D': ('update', 'update_forces', 'step', 'update_positions', 'contacts'),
+        'Visual': ('update',),
+    }
+    counters = [f"{process}.ticks" for process in stages]
+    gauges = [f"{process}.agents" for process in ('Ecosystem', 'Box2D')] + ['Ecosystem.env_energy', 'Box2D.contact_pairs']
+    gauges += [f"queue.{queue_name}" for queue_name in queue_names]
+    histograms = [f"{process}.{stage}" for process, names in stages.items() for stage in names]
+    return MetricsRegistry(counters, gauges, histograms, name=name)
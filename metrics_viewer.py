@@ -0,0 +1,66 @@
+import sys
+import time
+import argparse
+from metrics import MetricsRegistry, DEFAULT_NAME
+
+def render(metrics, previous, elapsed):
+    layout = metrics.layout
+    lines = [f"yaorozu metrics ({metrics.name})  {time.strftime('%H:%M:%S')}", ""]
+
+    lines.append(f"{'counter':<36}{'total':>12}{'rate/s':>10}")
+    for name in layout['counters']:
+        value = metrics.get(name)
+        rate = (value - previous.get(name, value)) / elapsed if elapsed > 0 else 0.0
+        previous[name] = value
+        lines.append(f"{name:<36}{value:>12.0f}{rate:>10.1f}")
+    lines.append("")
+
+    lines.append(f"{'gauge':<36}{'value':>12}")
+    for name in layout['gauges']:
+        lines.append(f"{name:<36}{metrics.get(name):>12.1f}")
+    lines.append("")
+
+    lines.append(f"{'step time (ms)':<36}{'count':>10}{'mean':>9}{'p50':>8}{'p99':>8}")
+    for name in layout['histograms']:
+        _, count, total = metrics.histogram(name)
+        if count == 0:
+            lines.append(f"{name:<36}{0:>10}")
+            continue
+        lines.append(f"{name:<36}{count:>10.0f}{total / count:>9.2f}"
+                     f"{metrics.percentile(name, 50):>8g}{metrics.percentile(name, 99):>8g}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Live view of the metrics of a running simulation')
+    parser.add_argument('--name', default=DEFAULT_NAME, help='shared memory block name (main.py --metrics NAME)')
+    parser.add_argument('--interval', type=float, default=1.0, help='refresh interval in seconds')
+    parser.add_argument('--once', action='store_true', help='print one snapshot and exit')
+    args = parser.parse_args()
+
+    try:
+        metrics = MetricsRegistry.attach(args.name)
+    except FileNotFoundError:
+        print(f"No metrics block '{args.name}'. Start the simulation with main.py --metrics", file=sys.stderr)
+        sys.exit(1)
+
+    previous = {}
+    last_time = time.time()
+    try:
+        while True:
+            now = time.time()
+            text = render(metrics, previous, now - last_time)
+            last_time = now
+            if args.once:
+                print(text)
+                break
+            # clear the screen and redraw in place
+            sys.stdout.write("\033[H\033[2J" + text + "\n")
+            sys.stdout.flush()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        metrics.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+from queue import Empty
+
+class NullQueue:
+    """
+    Queue stand-in for a consumer that is not running (headless mode).
+    Everything put is dropped, and reads always find it empty.
+    """
+    def put(self, data, block=True, timeout=None):
+        pass
+
+    def put_nowait(self, data):
+        pass
+
+    def get(self, block=True, timeout=None):
+        raise Empty
+
+    def get_nowait(self):
+        raise Empty
+
+    def empty(self):
+        return True
+
+    def full(self):
+        return False
+
+    def qsize(self):
+        return 0
@@ -0,0 +1,106 @@
+import numpy as np
+from box2d_simulation import Box2DSimulation
+from spatial_grid import segment_sum
+
+# Box2D constants the step mirrors (b2_maxTranslation, b2_baumgarte, b2_linearSlop)
+MAX_TRANSLATION = 2.0
+BAUMGARTE = 0.2
+LINEAR_SLOP = 0.005
+POSITION_ITERATIONS = 3
+
+class NumpyPhysicsSimulation(Box2DSimulation):
+    """
+    Circle-only physics on the slot arrays, with the same queues and agent table as
+    Box2DSimulation (no joints, friction or restitution, which config.csv sets to 0).
+
+    Per step: v += dt * F / m, linear damping as in Box2D, one vectorized pass that
+    removes the approaching normal velocity of every overlapping pair, translation
+    clamped to MAX_TRANSLATION, then a few position passes that push overlapping
+    circles apart. Overlapping pairs come from the contact recorder's grid search and are
+    reused for contact recording.
+    """
+    def _init_world(self):
+        self.world = None
+        traits = self.config_manager.species_traits
+        self.damping_table = traits['DAMPING'].astype(np.float32)
+        # Box2D sets body.mass = MASS * radius
+        self.inv_mass_table = 1.0 / np.maximum(traits['MASS'] * traits['RADIUS'], 1e-6).astype(np.float32)
+        self.forces = np.zeros((self.max_agents_num, 2), dtype=np.float32)
+        self._touching = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    def _create_body(self, agent_id, species, position, velocity=(0, 0)):
+        # the state lives in positions/velocities; body_list only keeps the slot count
+        return None
+
+    def _destroy_body(self, body):
+        pass
+
+    def _apply_slot_forces(self, forces, count):
+        self.forces[:count] += forces[:count]
+
+    def step(self):
+        count = self.current_agent_count
+        if count == 0:
+            return
+        dt = np.float32(self.dt)
+        positions = self.positions[:count]
+        velocities = self.velocities[:count]
+        species = self.species[:count]
+        radii = self.radius_table[species]
+        inv_mass = self.inv_mass_table[species]
+
+        velocities += dt * self.forces[:count] * inv_mass[:, np.newaxis]
+        velocities *= (1.0 / (1.0 + dt * self.damping_table[species]))[:, np.newaxis]
+        self.forces[:count] = 0
+
+        first, second = self.contact_recorder.touching_pairs(positions, radii)
+        self._touching = (first, second)
+        if len(first):
+            self._solve_velocities(velocities, positions, inv_mass, first, second)
+
+        translation = np.linalg.norm(velocities, axis=1) * dt
+        too_fast = translation > MAX_TRANSLATION
+        velocities[too_fast] *= (MAX_TRANSLATION / translation[too_fast])[:, np.newaxis]
+        positions += velocities * dt
+
+        for _ in range(POSITION_ITERATIONS):
+            if len(first) == 0:
+                break
+            self._solve_positions(positions, radii, inv_mass, first, second)
+
+    def _pair_normals(self, positions, first, second):
+        delta = positions[second] - positions[first]
+        distance = np.linalg.norm(delta, axis=1)
+        normal = delta / np.maximum(distance, 1e-6)[:, np.newaxis]
+        # coincident centers: push along x
+        normal[distance < 1e-6] = (1.0, 0.0)
+        return normal, distance
+
+    def _solve_velocities(self, velocities, positions, inv_mass, first, second):
+        # inelastic contact: cancel the approaching part of the normal velocity (Jacobi pass)
+        count = len(velocities)
+        normal, _ = self._pair_normals(positions, first, second)
+        approach = np.einsum('ij,ij->i', velocities[second] - velocities[first], normal)
+        approaching = approach < 0
+        first, second, normal, approach = first[approaching], second[approaching], normal[approaching], approach[approaching]
+        impulse = (-approach / (inv_mass[first] + inv_mass[second]))[:, np.newaxis] * normal
+        velocities -= segment_sum(impulse * inv_mass[first][:, np.newaxis], first, count)
+        velocities += segment_sum(impulse * inv_mass[second][:, np.newaxis], second, count)
+
+    def _solve_positions(self, positions, radii, inv_mass, first, second):
+        count = len(positions)
+        normal, distance = self._pair_normals(positions, first, second)
+        overlap = radii[first] + radii[second] - distance
+        correction = np.clip(BAUMGARTE * (overlap - LINEAR_SLOP), 0, None)
+        share = correction / (inv_mass[first] + inv_mass[second])
+        push = share[:, np.newaxis] * normal
+        positions -= segment_sum(push * inv_mass[first][:, np.newaxis], first, count)
+        positions += segment_sum(push * inv_mass[second][:, np.newaxis], second, count)
+
+    def update_positions(self):
+        # positions/velocities are the simulation state already
+        pass
+
+    def record_contacts_step(self):
+        first, second = self._touching
+        self.contact_recorder.record_touching(first, second, self.agent_ids[:self.current_agent_count])
@@ -0,0 +1,258 @@
+import numpy as np
+from config_manager import ConfigManager
+from log import get_logger
+from queue import Empty
+from spatial_grid import grid_candidate_pairs, segment_sum
+from tracer import traced
+
+def normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+class NumpySimulation:
+    """Force backend with the same queue protocol as TensorFlowSimulation, without importing TensorFlow."""
+
+    def __init__(self, queues, max_agents=None):
+        self.logger = get_logger(self.__class__.__name__)
+        self.logger.info("Initializing NumpySimulation")
+        # queue setting
+        self.queues = queues
+        self._ui_to_tensorflow_queue = queues['ui_to_tensorflow']
+        self._box2d_to_tf = queues['box2d_to_tf']
+        self._eco_to_tf_init = queues['eco_to_tf_init']
+        self._eco_to_tf = queues['eco_to_tf']
+        self._tf_to_box2d = queues['tf_to_box2d']
+        self.config_manager = ConfigManager()
+
+        self.world_width = self.config_manager.get_trait_value('WORLD_WIDTH')
+        self.world_height = self.config_manager.get_trait_value('WORLD_HEIGHT')
+        if max_agents is None:
+            self.max_agents_num = self.config_manager.get_trait_value('MAX_AGENTS_NUM')
+        else:
+            self.max_agents_num = max_agents
+        self.neighbor_search = self.config_manager.get_trait_value('NEIGHBOR_SEARCH')
+        if self.neighbor_search not in ('dense', 'grid', 'tiled'):
+            raise ValueError(f"Unknown NEIGHBOR_SEARCH: {self.neighbor_search}")
+        self.force_tile_size = self.config_manager.get_trait_value('FORCE_TILE_SIZE')
+
+        self.world_size = np.array([self.world_width, self.world_height], dtype=np.float32)
+        self.world_center = self.world_size / 2
+        self.world_radius = np.float32(self.world_size.min() / 2 + 50)
+
+        self._init_simulation_parameters()
+        self._init_species_information()
+
+        self.positions = np.zeros((self.max_agents_num, 2), dtype=np.float32)
+        self.species = np.zeros(self.max_agents_num, dtype=np.int32)
+        self.agent_ids = np.full(self.max_agents_num, -1, dtype=np.int32)
+        self.current_agent_count = 0
+        # Box2D frame number / send time of those positions, returned with the forces
+        self.positions_frame = -1
+        self.positions_timestamp = 0.0
+
+        self.initialized = False
+        self.logger.info("NumpySimulation initialization completed")
+
+    def _init_simulation_parameters(self):
+        param_names = [
+            'MAX_FORCE', 'SEPARATION_DISTANCE', 'COHESION_DISTANCE', 'SEPARATION_WEIGHT',
+            'COHESION_WEIGHT', 'CENTER_ATTRACTION_WEIGHT', 'ROTATION_STRENGTH',
+            'CONFINEMENT_WEIGHT', 'ESCAPE_DISTANCE', 'ESCAPE_WEIGHT', 'CHASE_DISTANCE',
+            'CHASE_WEIGHT', 'PREDATOR_PREY_WEIGHT'
+        ]
+        for param in param_names:
+            setattr(self, param.lower(), np.float32(self.config_manager.get_trait_value(param)))
+
+    def _init_species_information(self):
+        traits = self.config_manager.species_traits
+        self.predator_species = traits['PREDATOR_SPECIES'][1:].astype(np.int32)
+        self.prey_species = traits['PREY_SPECIES'][1:].astype(np.int32)
+
+    # ---------------- Main -----------------------
+
+    def initialize(self):
+        self.logger.info("NumpySimulation is initializing")
+
+        while not self.initialized:
+            try:
+                data = self._eco_to_tf_init.get(timeout=0.1)
+                self._set_agents(data['positions'], data['species'], data['current_agent_count'])
+                if 'agent_ids' in data:
+                    self.agent_ids[:] = data['agent_ids']
+                self.initialized = True
+                self.logger.info(f"NumpySimulation Initialized with {self.current_agent_count} agents")
+            except Empty:
+                self.logger.warning("Waiting for initialization data from Ecosystem")
+                continue
+
+        self.logger.info("NumpySimulation initialized successfully")
+
+    def update(self):
+        self.update_property()
+        forces = self.calculate_forces()
+        self.send_forces_to_box2d(forces)
+        self.update_ui_parameters()
+
+    @traced()
+    def update_property(self):
+        try:
+            while True:
+                data = self._box2d_to_tf.get_nowait()
+                self._set_agents(data['positions'], data['species'], data['current_agent_count'])
+                if 'agent_ids' in data:
+                    count = self.current_agent_count
+                    self.agent_ids[:count] = data['agent_ids'][:count]
+                    self.agent_ids[count:] = -1
+                self.positions_frame = data.get('frame', -1)
+                self.positions_timestamp = data.get('timestamp', 0.0)
+        except Empty:
+            pass
+
+    def _set_agents(self, positions, species, count):
+        count = int(count)
+        self.positions[:count] = positions[:count]
+        self.positions[count:] = 0
+        self.species[:count] = species[:count]
+        self.species[count:] = 0
+        self.current_agent_count = count
+
+    @traced()
+    def send_forces_to_box2d(self, np_forces):
+        data = {
+            'forces': np_forces,
+            'agent_ids': self.agent_ids[:self.current_agent_count].copy(),
+            'current_agent_count': self.current_agent_count,
+            'frame': self.positions_frame,
+            'timestamp': self.positions_timestamp
+        }
+        self._tf_to_box2d.put(data)
+
+    @traced()
+    def calculate_forces(self):
+        active_count = self.current_agent_count
+        positions = self.positions[:active_count]
+        to_center = self.world_center - positions
+        distances = np.linalg.norm(to_center, axis=1, keepdims=True)
+        normalized_to_center = to_center / (distances + 1e-5)
+
+        center_force = normalized_to_center
+
+        outside_circle = (distances > self.world_radius).astype(np.float32)
+        confinement_force = outside_circle * (distances - self.world_radius) * normalized_to_center
+
+        rotation_force = np.stack([-to_center[:, 1], to_center[:, 0]], axis=1)
+        rotation_force /= np.maximum(np.linalg.norm(rotation_force, axis=1, keepdims=True), 1e-6)
+
+        if self.neighbor_search == 'grid':
+            separation, cohesion = self._grid_separation_cohesion(positions)
+        elif self.neighbor_search == 'tiled':
+            separation, cohesion = self._tiled_separation_cohesion(positions)
+        else:
+            separation, cohesion = self._dense_separation_cohesion(positions)
+
+        if self.predator_prey_weight > 0:
+            predator_prey = self._predator_prey_forces(positions, self.species[:active_count])
+        else:
+            predator_prey = np.zeros_like(positions)
+
+        forces = (self.separation_weight * separation * 1.0 +
+            self.cohesion_weight * cohesion * 0.35 +
+            self.predator_prey_weight * predator_prey * 0.46 +
+            center_force * self.center_attraction_weight * 12.8 +
+            confinement_force * self.confinement_weight * 0.056 +
+            rotation_force * self.rotation_strength * 12.8)
+
+        padded_forces = np.zeros((self.max_agents_num, 2), dtype=np.float32)
+        padded_forces[:active_count] = forces
+        return padded_forces
+
+    def _dense_separation_cohesion(self, positions):
+        diff = positions[:, np.newaxis, :] - positions
+        distances = np.linalg.norm(diff, axis=2)
+
+        mask = ((distances < self.separation_distance) & (distances > 0)).astype(np.float32)
+        steer = np.einsum('ij,ijk->ik', mask, diff)
+        count = mask.sum(axis=1, keepdims=True)
+        separation = np.where(count > 0, steer / np.maximum(count, 1), 0)
+
+        mask = ((distances < self.cohesion_distance) & (distances > 0)).astype(np.float32)
+        count = mask.sum(axis=1, keepdims=True)
+        center_of_mass = np.where(count > 0, (mask @ positions) / np.maximum(count, 1), positions)
+        return separation, center_of_mass - positions
+
+    def _tiled_separation_cohesion(self, positions):
+        # One fused pass per row tile: peak memory is tile x N instead of N x N.
+        separation = np.zeros_like(positions)
+        cohesion = np.zeros_like(positions)
+        for start in range(0, len(positions), self.force_tile_size):
+            tile_positions = positions[start:start + self.force_tile_size]
+            distances = np.linalg.norm(tile_positions[:, np.newaxis, :] - positions, axis=2)
+
+            mask = ((distances < self.separation_distance) & (distances > 0)).astype(np.float32)
+            count = mask.sum(axis=1, keepdims=True)
+            steer = count * tile_positions - mask @ positions
+            separation[start:start + len(tile_positions)] = np.where(count > 0, steer / np.maximum(count, 1), 0)
+
+            mask = ((distances < self.cohesion_distance) & (distances > 0)).astype(np.float32)
+            count = mask.sum(axis=1, keepdims=True)
+            center_of_mass = np.where(count > 0, (mask @ positions) / np.maximum(count, 1), tile_positions)
+            cohesion[start:start + len(tile_positions)] = center_of_mass - tile_positions
+        return separation, cohesion
+
+    def _grid_separation_cohesion(self, positions):
+        num_agents = len(positions)
+        cell_size = max(self.separation_distance, self.cohesion_distance)
+        agent_idx, neighbor_idx = grid_candidate_pairs(positions, cell_size, self.world_width, self.world_height)
+
+        neighbor_positions = positions[neighbor_idx]
+        diff = positions[agent_idx] - neighbor_positions
+        distances = np.linalg.norm(diff, axis=1)
+
+        mask = (distances < self.separation_distance) & (distances > 0)
+        steer = segment_sum(diff[mask], agent_idx[mask], num_agents)
+        count = np.bincount(agent_idx[mask], minlength=num_agents)[:, np.newaxis]
+        separation = np.where(count > 0, steer / np.maximum(count, 1), 0)
+
+        mask = (distances < self.cohesion_distance) & (distances > 0)
+        center_of_mass = segment_sum(neighbor_positions[mask], agent_idx[mask], num_agents)
+        count = np.bincount(agent_idx[mask], minlength=num_agents)[:, np.newaxis]
+        center_of_mass = np.where(count > 0, center_of_mass / np.maximum(count, 1), positions)
+        return separation, center_of_mass - positions
+
+    def _predator_prey_forces(self, positions, species):
+        predator_of = self.predator_species[np.maximum(species - 1, 0)]
+        prey_of = self.prey_species[np.maximum(species - 1, 0)]
+
+        nearest_predator, has_predator = self._grid_nearest(positions, species, predator_of, self.escape_distance)
+        nearest_prey, has_prey = self._grid_nearest(positions, species, prey_of, self.chase_distance)
+
+        forces = np.zeros_like(positions)
+        escape_direction = positions[has_predator] - positions[nearest_predator]
+        forces[has_predator] += normalize(escape_direction) * self.escape_weight
+        chase_direction = positions[nearest_prey] - positions[has_prey]
+        forces[has_prey] += normalize(chase_direction) * self.chase_weight
+        return forces
+
+    def _grid_nearest(self, positions, species, target_species, max_distance):
+        # Returns the nearest target for every agent that has one, plus the boolean mask of those agents
+        agent_idx, target_idx = grid_candidate_pairs(positions, max_distance, self.world_width, self.world_height,
+                                                     point_bucket=species, query_bucket=target_species)
+        distances = np.linalg.norm(positions[target_idx] - positions[agent_idx], axis=1)
+        valid = (distances < max_distance) & (distances > 0)
+        agent_idx, target_idx, distances = agent_idx[valid], target_idx[valid], distances[valid]
+
+        order = np.lexsort((distances, agent_idx))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = agent_idx[order][1:] != agent_idx[order][:-1]
+        has_target = np.zeros(len(positions), dtype=bool)
+        has_target[agent_idx[order][first]] = True
+        return target_idx[order][first], has_target
+
+    def update_ui_parameters(self):
+        while not self._ui_to_tensorflow_queue.empty():
+            try:
+                param_name, value = self._ui_to_tensorflow_queue.get_nowait()
+                if hasattr(self, param_name.lower()):
+                    setattr(self, param_name.lower(), np.float32(value))
+                    self.logger.debug("Updated UI parameter: %s = %s", param_name, value)
+            except Empty:
+                break
@@ -0,0 +1,133 @@
+import multiprocessing as mp
+import time
+import numpy as np
+from queue import Empty
+
+class SharedFrameBuffer:
+    """
+    Per-frame array channel in shared memory (one writer, any number of readers).
+
+    The writer fills the slot after the latest one, so with 3 slots a reader can hold a
+    zero-copy view for about two frames. Each slot has a sequence counter (seqlock):
+    odd while it is being written, bumped to even when complete. Readers retry when the
+    counter changed under them, so no lock and no pickling is needed on the hot path.
+
+    put()/get_nowait() mirror the mp.Queue payload dicts, so it can replace the
+    per-frame queues. Every process unpickles its own copy with its own read cursor.
+    """
+    _HEADER = 2  # [latest slot, number of frames written]
+    _SLOT = 5    # per slot: [sequence, agent count, frame number, write number, agent batch]
+
+    def __init__(self, max_agents_num, fields, num_slots=3):
+        self.max_agents_num = max_agents_num
+        self.fields = dict(fields)  # name -> (array typecode, width)
+        self.num_slots = num_slots
+        self._header = mp.RawArray('q', self._HEADER + self._SLOT * num_slots)
+        self._timestamps = mp.RawArray('d', num_slots)
+        self._buffers = {
+            name: mp.RawArray(typecode, num_slots * max_agents_num * width)
+            for name, (typecode, width) in self.fields.items()
+        }
+        self._header[0] = -1
+        self._last_read = 0
+        self._create_views()
+
+    def _create_views(self):
+        self._meta = np.frombuffer(self._header, dtype=np.int64)
+        self._slots = self._meta[self._HEADER:].reshape(self.num_slots, self._SLOT)
+        self._stamp = np.frombuffer(self._timestamps, dtype=np.float64)
+        self._views = {}
+        for name, (typecode, width) in self.fields.items():
+            view = np.frombuffer(self._buffers[name], dtype=np.dtype(typecode))
+            shape = (self.num_slots, self.max_agents_num, width) if width > 1 else (self.num_slots, self.max_agents_num)
+            self._views[name] = view.reshape(shape)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_meta', '_slots', '_stamp', '_views'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._create_views()
+
+    # ---------------- writer -----------------------
+
+    def write(self, count, frame=None, timestamp=None, batch=0, **arrays):
+        count = int(count)
+        slot = (int(self._meta[0]) + 1) % self.num_slots
+        slot_meta = self._slots[slot]
+        slot_meta[0] += 1  # odd: write in progress
+        for name, values in arrays.items():
+            self._views[name][slot, :count] = values[:count]
+        slot_meta[1] = count
+        slot_meta[3] = self._meta[1] + 1
+        slot_meta[2] = slot_meta[3] if frame is None else frame
+        slot_meta[4] = batch
+        self._stamp[slot] = time.time() if timestamp is None else timestamp
+        slot_meta[0] += 1  # even: complete
+        self._meta[0] = slot
+        self._meta[1] += 1
+
+    def put(self, data):
+        arrays = {name: data[name] for name in self.fields if name in data}
+        self.write(data['current_agent_count'], data.get('frame'), data.get('timestamp'), data.get('batch', 0), **arrays)
+
+    def put_nowait(self, data):
+        self.put(data)
+
+    # ---------------- reader -----------------------
+
+    def read(self, copy=True):
+        """
+        Latest complete frame as a payload dict, or None if nothing was written yet.
+        With copy=False the arrays are views into shared memory; call is_current(frame)
+        after using them to make sure the writer did not overwrite the slot meanwhile.
+        """
+        while True:
+            slot = int(self._meta[0])
+            if slot < 0:
+                return None
+            slot_meta = self._slots[slot]
+            sequence = int(slot_meta[0])
+            if sequence & 1:
+                continue
+            count = int(slot_meta[1])
+            frame = {name: view[slot, :count] for name, view in self._views.items()}
+            if copy:
+                frame = {name: values.copy() for name, values in frame.items()}
+            frame['current_agent_count'] = count
+            frame['frame'] = int(slot_meta[2])
+            frame['timestamp'] = float(self._stamp[slot])
+            frame['batch'] = int(slot_meta[4])
+            frame['_slot'] = slot
+            frame['_sequence'] = sequence
+            frame['_written'] = int(slot_meta[3])
+            if int(slot_meta[0]) == sequence:
+                return frame
+
+    def is_current(self, frame):
+        return int(self._slots[frame['_slot']][0]) == frame['_sequence']
+
+    def get_nowait(self, copy=True):
+        # Queue-like: raises Empty when no frame newer than the last one read exists
+        if int(self._meta[1]) == self._last_read:
+            raise Empty
+        frame = self.read(copy)
+        # the writer may have moved on since the check; remember the frame actually returned
+        self._last_read = frame['_written']
+        return frame
+
+    def get(self, block=True, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            try:
+                return self.get_nowait()
+            except Empty:
+                if not block or (deadline is not None and time.time() >= deadline):
+                    raise
+                time.sleep(0.0005)
+
+    def empty(self):
+        return int(self._meta[1]) == self._last_read
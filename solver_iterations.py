@@ -0,0 +1,53 @@
+class SolverIterations:
+    """
+    Adaptive velocity/position iteration counts for Box2D's world.Step.
+    Step cost and contact penetration are collected every step; once per window the counts
+    go down (x DECREASE) when the mean step cost exceeded the budget, and up (x INCREASE)
+    when the worst penetration grew past max_penetration while there is time to spare.
+    The configured counts are the starting point and the ceiling.
+    """
+    MIN_VELOCITY_ITERATIONS = 2
+    MIN_POSITION_ITERATIONS = 1
+    DECREASE = 0.75
+    INCREASE = 1.25
+
+    def __init__(self, velocity_iterations, position_iterations, budget_ms, max_penetration, window=30):
+        self.max_velocity_iterations = velocity_iterations
+        self.max_position_iterations = position_iterations
+        self.velocity_iterations = velocity_iterations
+        self.position_iterations = position_iterations
+        self.budget_ms = budget_ms
+        self.max_penetration = max_penetration
+        self.window = window
+        self._step_ms = []
+        self._penetration = 0.0
+        self.mean_step_ms = 0.0
+        self.penetration = 0.0
+
+    @property
+    def closes_window(self):
+        # the next record() ends the window (penetration only needs sampling then)
+        return len(self._step_ms) + 1 >= self.window
+
+    def record(self, step_ms, penetration):
+        # returns True when the iteration counts changed
+        self._step_ms.append(step_ms)
+        self._penetration = max(self._penetration, penetration)
+        if len(self._step_ms) < self.window:
+            return False
+        self.mean_step_ms = sum(self._step_ms) / len(self._step_ms)
+        self.penetration = self._penetration
+        self._step_ms = []
+        self._penetration = 0.0
+        return self._adjust()
+
+    def _adjust(self):
+        previous = (self.velocity_iterations, self.position_iterations)
+        if self.mean_step_ms > self.budget_ms:
+            self.velocity_iterations = max(self.MIN_VELOCITY_ITERATIONS, int(self.velocity_iterations * self.DECREASE))
+            self.position_iterations = max(self.MIN_POSITION_ITERATIONS, int(self.position_iterations * self.DECREASE))
+        elif self.penetration > self.max_penetration and self.mean_step_ms < self.budget_ms * self.DECREASE:
+            # only grow while the step stays well inside the budget, so the two rules do not oscillate
+            self.velocity_iterations = min(self.max_velocity_iterations, max(self.velocity_iterations + 1, int(self.velocity_iterations * self.INCREASE)))
+            self.position_iterations = min(self.max_position_iterations, max(self.position_iterations + 1, int(self.position_iterations * self.INCREASE)))
+        return (self.velocity_iterations, self.position_iterations) != previous
@@ -0,0 +1,47 @@
+import numpy as np
+
+def grid_candidate_pairs(positions, cell_size, world_width, world_height, point_bucket=None, query_bucket=None):
+    """
+    Uniform grid (cell list) neighbor candidates.
+    Returns (query_idx, point_idx) for every point in the 3x3 cells around each query,
+    restricted to points whose bucket equals the query's bucket.
+    Cells are clamped to the world grid, which keeps every pair closer than cell_size.
+    """
+    num_agents = len(positions)
+    if point_bucket is None:
+        point_bucket = np.zeros(num_agents, dtype=np.int64)
+    if query_bucket is None:
+        query_bucket = point_bucket
+
+    cell_size = max(float(cell_size), 1.0)
+    grid_w = max(int(np.ceil(world_width / cell_size)), 1)
+    grid_h = max(int(np.ceil(world_height / cell_size)), 1)
+    num_cells = grid_w * grid_h
+    cell_x = np.clip(np.floor(positions[:, 0] / cell_size).astype(np.int64), 0, grid_w - 1)
+    cell_y = np.clip(np.floor(positions[:, 1] / cell_size).astype(np.int64), 0, grid_h - 1)
+
+    keys = np.asarray(point_bucket, dtype=np.int64) * num_cells + cell_y * grid_w + cell_x
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    # The 3 cells of one grid row are contiguous in key order.
+    rows = cell_y[:, np.newaxis] + np.array([-1, 0, 1])
+    valid_rows = (rows >= 0) & (rows < grid_h)
+    row_base = np.asarray(query_bucket, dtype=np.int64)[:, np.newaxis] * num_cells + rows * grid_w
+    low_keys = row_base + np.maximum(cell_x - 1, 0)[:, np.newaxis]
+    high_keys = row_base + np.minimum(cell_x + 1, grid_w - 1)[:, np.newaxis]
+    starts = np.searchsorted(sorted_keys, low_keys.ravel(), side='left')
+    ends = np.searchsorted(sorted_keys, high_keys.ravel(), side='right')
+    lengths = np.where(valid_rows.ravel(), ends - starts, 0)
+
+    ranges = np.repeat(np.arange(lengths.size), lengths)
+    offsets = np.arange(ranges.size) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    neighbors = order[starts[ranges] + offsets]
+    return ranges // 3, neighbors
+
+def segment_sum(values, segment_ids, num_segments):
+    """Sum rows of an (M, 2) array into num_segments rows (NumPy unsorted_segment_sum)."""
+    return np.stack([
+        np.bincount(segment_ids, weights=values[:, 0], minlength=num_segments),
+        np.bincount(segment_ids, weights=values[:, 1], minlength=num_segments)
+    ], axis=1).astype(np.float32)
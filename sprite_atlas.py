@@ -0,0 +1,49 @@
+import pygame
+from typing import Dict, List
+from log import get_logger
+
+class SpriteAtlas:
+    """
+    Pre-rotated creature surfaces per species, quantized to angle_step degrees.
+    Each species has a normal and a flash variant for every angle, so Creature.update
+    only picks a cached surface instead of copying and rotating its image every frame.
+    """
+    def __init__(self, angle_step: float = 5):
+        self.logger = get_logger(self.__class__.__name__)
+        self.angle_step = float(angle_step)
+        self.num_angles = max(1, int(round(360 / self.angle_step)))
+        self.frames: Dict[int, List[pygame.Surface]] = {}
+        self.flash_frames: Dict[int, List[pygame.Surface]] = {}
+
+    def build(self, species_list):
+        # Creature を種ごとに1体作り、その base_image から全角度を生成する
+        from creature import Creature
+        for species in species_list:
+            prototype = Creature(species, pygame.Vector2(0, 0))
+            self.add_species(species, prototype.base_image, prototype.center, prototype._flash_radius)
+        stats = self.memory_stats()
+        self.logger.info(f"Sprite atlas built: {stats['species']} species, {stats['frames']} frames, "
+                         f"{stats['bytes'] / 1024 / 1024:.1f} MB")
+
+    def add_species(self, species, base_image, center, flash_radius):
+        flash_image = base_image.copy()
+        pygame.draw.circle(flash_image, (255, 255, 255), center, flash_radius)
+        angles = [i * self.angle_step for i in range(self.num_angles)]
+        self.frames[species] = [pygame.transform.rotate(base_image, angle) for angle in angles]
+        self.flash_frames[species] = [pygame.transform.rotate(flash_image, angle) for angle in angles]
+
+    def has_species(self, species):
+        return species in self.frames
+
+    def angle_index(self, angle):
+        return int(round(angle / self.angle_step)) % self.num_angles
+
+    def get_frame(self, species, angle, flash=False):
+        frames = self.flash_frames[species] if flash else self.frames[species]
+        return frames[self.angle_index(angle)]
+
+    def memory_stats(self):
+        surfaces = [s for frames in self.frames.values() for s in frames]
+        surfaces += [s for frames in self.flash_frames.values() for s in frames]
+        num_bytes = sum(s.get_width() * s.get_height() * s.get_bytesize() for s in surfaces)
+        return {'species': len(self.frames), 'frames': len(surfaces), 'bytes': num_bytes}
@@ -4,6 +4,7 @@ import time
 import numpy as np
 from log import get_logger
 from queue import Empty
+from tracer import span, traced
 
 class TensorFlowSimulation:
     def __init__(self, queues, max_agents=None):
@@ -27,6 +28,13 @@ class TensorFlowSimulation:
         else:
             self.max_agents_num = max_agents
             
+        self.neighbor_search = self.config_manager.get_trait_value('NEIGHBOR_SEARCH')
+        if self.neighbor_search not in ('dense', 'grid', 'tiled'):
+            raise ValueError(f"Unknown NEIGHBOR_SEARCH: {self.neighbor_search}")
+        self.force_tile_size = self.config_manager.get_trait_value('FORCE_TILE_SIZE')
+        self.fixed_shape = bool(self.config_manager.get_trait_value('FORCE_FIXED_SHAPE'))
+        self.jit_compile = bool(self.config_manager.get_trait_value('FORCE_JIT_COMPILE'))
+            
         self.world_size = tf.constant([self.world_width, self.world_height], dtype=tf.float32)
         self.world_center = self.world_size / 2
         self.world_radius = tf.reduce_min(self.world_size) / 2 + 50
@@ -43,9 +51,18 @@ class TensorFlowSimulation:
         self.tf_species = tf.Variable(tf.zeros([self.max_agents_num], dtype=tf.int32))
         self.tf_current_agent_count = tf.Variable(0, dtype=tf.int32)
         self.tf_forces = tf.Variable(tf.zeros((self.max_agents_num, 2), dtype=tf.float32))
+        # agent ids in the order of tf_positions, sent back with the forces
+        self.agent_ids = np.full(self.max_agents_num, -1, dtype=np.int32)
+        # Box2D frame number / send time of those positions, returned with the forces
+        self.positions_frame = -1
+        self.positions_timestamp = 0.0
 
         # Initialize species information
         self._init_species_information()
+
+        # Fixed-shape step over the whole buffer, compiled once (optionally with XLA)
+        self.compiled_forces = tf.function(self._calculate_fixed_shape_forces, jit_compile=self.jit_compile)
+        self._reported_traces = 0
         self.initialized = False
         self.logger.info("TensorFlowSimulation initialization completed")
 
@@ -65,12 +82,9 @@ class TensorFlowSimulation:
 
     def _init_species_information(self):
         self.logger.debug("Initializing species information")
-        self.predator_species = tf.constant([
-            self.config_manager.get_species_trait_value('PREDATOR_SPECIES', i) for i in range(1, 9)
-        ], dtype=tf.int32)
-        self.prey_species = tf.constant([
-            self.config_manager.get_species_trait_value('PREY_SPECIES', i) for i in range(1, 9)
-        ], dtype=tf.int32)
+        traits = self.config_manager.species_traits
+        self.predator_species = tf.constant(traits['PREDATOR_SPECIES'][1:], dtype=tf.int32)
+        self.prey_species = tf.constant(traits['PREY_SPECIES'][1:], dtype=tf.int32)
         
         self.logger.debug("Species information initialized")
     #------------------for profiling---------------------
@@ -125,41 +139,76 @@ class TensorFlowSimulation:
                 self.tf_current_agent_count.assign(tf.convert_to_tensor(data['current_agent_count'], dtype=tf.int32))
                 self.tf_positions.assign(tf.convert_to_tensor(data['positions'], dtype=tf.float32))
                 self.tf_species.assign(tf.convert_to_tensor(data['species'], dtype=tf.int32))
+                if 'agent_ids' in data:
+                    self.agent_ids[:] = data['agent_ids']
                 self.initialized = True
                 self.logger.info(f"TensorFlowSimulation Initialized with {self.tf_current_agent_count.numpy()} agents")
             except Empty:
                 self.logger.warning("Waiting for initialization data from Ecosystem")
                 continue  # Queue is empty, continue waiting
+
+        if self.fixed_shape:
+            start_time = time.time()
+            self.compiled_forces()
+            self._reported_traces = self.get_retrace_count()
+            self.logger.info(f"Compiled fixed-shape force step (jit_compile={self.jit_compile}) in {time.time() - start_time:.2f} seconds")
         
         self.logger.info("TensorFlowSimulation initialized successfully")
 
     def update(self):
         self.update_property()
-        forces = self.calculate_forces()
-        self.send_forces_to_box2d(forces.numpy()[:])
+        with span('TensorFlowSimulation.calculate_forces'):
+            if self.fixed_shape:
+                forces = self.compiled_forces()
+                self._check_retrace()
+            else:
+                forces = self.calculate_forces()
+            forces = forces.numpy()
+        self.send_forces_to_box2d(forces[:])
         self.update_ui_parameters()
+
+    def get_retrace_count(self):
+        return self.compiled_forces.experimental_get_tracing_count()
+
+    def _check_retrace(self):
+        trace_count = self.get_retrace_count()
+        if trace_count != self._reported_traces:
+            self.logger.warning(f"Fixed-shape force step was retraced (total traces: {trace_count})")
+            self._reported_traces = trace_count
                 
+    @traced()
     def update_property(self):
         try:
             while True:
                 data = self._box2d_to_tf.get_nowait()
-                new_count = tf.convert_to_tensor(data['current_agent_count'], dtype=tf.int32)
-                new_positions = tf.convert_to_tensor(data['positions'], dtype=tf.float32)
-                new_species = tf.convert_to_tensor(data['species'], dtype=tf.int32)
-                mask = tf.range(self.max_agents_num) < new_count
-                mask = tf.reshape(mask, (-1, 1))
-                self.tf_positions.assign(tf.where(mask, new_positions, tf.zeros_like(new_positions)))
-                self.tf_species.assign(tf.where(mask[:, 0], new_species, tf.zeros_like(new_species)))
-                self.tf_current_agent_count.assign(new_count)
+                count = data['current_agent_count']
+                # positions/species may be full buffers (queue) or [:count] views (shared memory)
+                new_positions = np.zeros((self.max_agents_num, 2), dtype=np.float32)
+                new_positions[:count] = data['positions'][:count]
+                new_species = np.zeros(self.max_agents_num, dtype=np.int32)
+                new_species[:count] = data['species'][:count]
+                if 'agent_ids' in data:
+                    self.agent_ids[:count] = data['agent_ids'][:count]
+                    self.agent_ids[count:] = -1
+                self.positions_frame = data.get('frame', -1)
+                self.positions_timestamp = data.get('timestamp', 0.0)
+                self.tf_positions.assign(new_positions)
+                self.tf_species.assign(new_species)
+                self.tf_current_agent_count.assign(count)
         except Empty:
             pass
         return 
         
 
+    @traced()
     def send_forces_to_box2d(self, np_forces):
+        count = int(self.tf_current_agent_count.numpy())
         data = {
             'forces': np_forces,
-            'current_agent_count': int(self.tf_current_agent_count.numpy())
+            'agent_ids': self.agent_ids[:count].copy(),
+            'current_agent_count': count,
+            'frame': self.positions_frame,
+            'timestamp': self.positions_timestamp
         }
         self._tf_to_box2d.put(data)
         # self.logger.debug(f"Sent forces to Box2D for {data['current_agent_count']} agents")
@@ -169,6 +218,55 @@ class TensorFlowSimulation:
         active_count = self.tf_current_agent_count
         positions = self.tf_positions[:active_count]
         species = self.tf_species[:active_count]
+        center_force, confinement_force, rotation_force = self._center_forces(positions)
+        
+        if self.neighbor_search == 'grid':
+            separation, cohesion = self._grid_separation_cohesion(positions)
+        elif self.neighbor_search == 'tiled':
+            separation, cohesion = self._tiled_separation_cohesion(positions)
+        else:
+            distances = self._calculate_distances(positions)
+            separation = self._separation(positions, distances)
+            cohesion = self._cohesion(positions, distances)
+        predator_prey = tf.cond(
+            self.predator_prey_weight > 0,
+            lambda: self._predator_prey_forces(positions, species),
+            lambda: tf.zeros_like(positions)
+        )
+        
+        forces = (self.separation_weight * separation * 1.0 +
+            self.cohesion_weight * cohesion * 0.35 + 
+            self.predator_prey_weight * predator_prey * 0.46 +
+            center_force * self.center_attraction_weight * 12.8 +
+            confinement_force * self.confinement_weight * 0.056 +
+            rotation_force * self.rotation_strength * 12.8)  
+        
+        padded_forces = tf.pad(forces, [[0, self.max_agents_num - active_count], [0, 0]])
+        return padded_forces
+
+    def _calculate_fixed_shape_forces(self):
+        # Works on the full max_agents_num buffer with an active mask, so every
+        # tensor has a static shape and the graph never depends on the agent count.
+        positions = self.tf_positions
+        active = tf.cast(tf.range(self.max_agents_num) < self.tf_current_agent_count, tf.float32)
+        center_force, confinement_force, rotation_force = self._center_forces(positions)
+        separation, cohesion = self._tiled_separation_cohesion(positions, active)
+        predator_prey = tf.cond(
+            self.predator_prey_weight > 0,
+            lambda: self._tiled_predator_prey_forces(positions, self.tf_species, active),
+            lambda: tf.zeros_like(positions)
+        )
+
+        forces = (self.separation_weight * separation * 1.0 +
+            self.cohesion_weight * cohesion * 0.35 +
+            self.predator_prey_weight * predator_prey * 0.46 +
+            center_force * self.center_attraction_weight * 12.8 +
+            confinement_force * self.confinement_weight * 0.056 +
+            rotation_force * self.rotation_strength * 12.8)
+        return forces * active[:, tf.newaxis]
+
+    @tf.function
+    def _center_forces(self, positions):
         to_center = self.world_center - positions
         distances = tf.norm(to_center, axis=1, keepdims=True)
         normalized_to_center = to_center / (distances + 1e-5)
@@ -183,60 +281,90 @@ class TensorFlowSimulation:
         # Create perpendicular vector for rotation (counter-clockwise)
         rotation_force = tf.stack([-to_center[:, 1], to_center[:, 0]], axis=1)
         rotation_force = tf.nn.l2_normalize(rotation_force, axis=1)
-        
-        distances = self._calculate_distances(positions)
-        separation = self._separation(positions, distances)
-        cohesion = self._cohesion(positions, distances)
-        # predator_prey = self._predator_prey_forces(self.tf_positions, distances, self.tf_species)
-        
-        forces = (self.separation_weight * separation * 1.0 +
-            self.cohesion_weight * cohesion * 0.35 + 
-            # self.predator_prey_weight * predator_prey * 0.46 +
-            center_force * self.center_attraction_weight * 12.8 +
-            confinement_force * self.confinement_weight * 0.056 +
-            rotation_force * self.rotation_strength * 12.8)  
-        
-        padded_forces = tf.pad(forces, [[0, self.max_agents_num - active_count], [0, 0]])
-        return padded_forces
+        return center_force, confinement_force, rotation_force
     
     @profile
     @tf.function
-    def _predator_prey_forces(self, positions, distances, species):
-        num_agents = tf.shape(positions)[0]
-        
-        # 捕食者と被捕食種のマスクを作成
-        predator_mask = tf.equal(tf.expand_dims(species, 1), tf.gather(self.predator_species, species - 1))
-        prey_mask = tf.equal(tf.expand_dims(species, 1), tf.gather(self.prey_species, species - 1))
-        
-        # 逃避と追跡のマスクを作成
-        escape_mask = tf.logical_and(predator_mask, distances < self.escape_distance)
-        chase_mask = tf.logical_and(prey_mask, distances < self.chase_distance)
+    def _predator_prey_forces(self, positions, species):
+        # 捕食者・獲物の種ごとのバケットをグリッドで検索し、最も近い相手だけを使う
+        predator_of = tf.gather(self.predator_species, tf.maximum(species - 1, 0))
+        prey_of = tf.gather(self.prey_species, tf.maximum(species - 1, 0))
 
-        # 最も近い捕食者と獲物を見つける
-        escape_distances = tf.where(escape_mask, distances, tf.fill(tf.shape(distances), tf.float32.max))
-        chase_distances = tf.where(chase_mask, distances, tf.fill(tf.shape(distances), tf.float32.max))
-        nearest_predator = tf.argmin(escape_distances, axis=1)
-        nearest_prey = tf.argmin(chase_distances, axis=1)
+        nearest_predator, has_predator = self._grid_nearest(positions, species, predator_of, self.escape_distance)
+        nearest_prey, has_prey = self._grid_nearest(positions, species, prey_of, self.chase_distance)
 
-        # 逃避力と追跡力を計算
         escape_direction = positions - tf.gather(positions, nearest_predator)
         chase_direction = tf.gather(positions, nearest_prey) - positions
 
         escape_force = tf.where(
-            tf.reduce_any(escape_mask, axis=1, keepdims=True),
+            has_predator[:, tf.newaxis],
             tf.nn.l2_normalize(escape_direction, axis=1) * self.escape_weight,
             tf.zeros_like(positions)
         )
         chase_force = tf.where(
-            tf.reduce_any(chase_mask, axis=1, keepdims=True),
+            has_prey[:, tf.newaxis],
             tf.nn.l2_normalize(chase_direction, axis=1) * self.chase_weight,
             tf.zeros_like(positions)
         )
         total_force = escape_force + chase_force
 
-
         return total_force
 
+    @tf.function
+    def _grid_nearest(self, positions, species, target_species, max_distance):
+        # Nearest agent of target_species[i] closer than max_distance, for every agent i
+        num_agents = tf.shape(positions)[0]
+        agent_idx, target_idx = self._grid_candidate_pairs(positions, tf.maximum(max_distance, 1.0), species, target_species)
+        distances = tf.norm(tf.gather(positions, target_idx) - tf.gather(positions, agent_idx), axis=1)
+        valid = tf.logical_and(distances < max_distance, distances > 0)
+        distances = tf.where(valid, distances, tf.float32.max)
+
+        nearest_distance = tf.math.unsorted_segment_min(distances, agent_idx, num_agents)
+        is_nearest = tf.logical_and(valid, distances <= tf.gather(nearest_distance, agent_idx))
+        nearest = tf.math.unsorted_segment_max(tf.where(is_nearest, target_idx, -1), agent_idx, num_agents)
+        has_target = nearest >= 0
+        return tf.maximum(nearest, 0), has_target
+
+    @tf.function
+    def _tiled_predator_prey_forces(self, positions, species, active):
+        # Fixed-shape variant for the compiled step: masked nearest search per row tile
+        predator_of = tf.gather(self.predator_species, tf.maximum(species - 1, 0))
+        prey_of = tf.gather(self.prey_species, tf.maximum(species - 1, 0))
+        num_agents = tf.shape(positions)[0]
+        tile_size = self.force_tile_size
+        num_tiles = (num_agents + tile_size - 1) // tile_size
+        pad = [[0, num_tiles * tile_size - num_agents]]
+        tiles = (
+            tf.reshape(tf.pad(positions, pad + [[0, 0]]), [num_tiles, tile_size, 2]),
+            tf.reshape(tf.pad(predator_of, pad), [num_tiles, tile_size]),
+            tf.reshape(tf.pad(prey_of, pad), [num_tiles, tile_size]),
+        )
+        is_active = active > 0
+
+        def tile_forces(tile):
+            tile_positions, tile_predator_of, tile_prey_of = tile
+            diff = positions - tile_positions[:, tf.newaxis, :]
+            distances = tf.norm(diff, axis=2)
+            forces = tf.zeros_like(tile_positions)
+            for target_of, max_distance, weight, sign in (
+                (tile_predator_of, self.escape_distance, self.escape_weight, -1.0),
+                (tile_prey_of, self.chase_distance, self.chase_weight, 1.0),
+            ):
+                mask = tf.logical_and(tf.equal(species, target_of[:, tf.newaxis]), is_active)
+                mask = tf.logical_and(mask, tf.logical_and(distances < max_distance, distances > 0))
+                masked_distances = tf.where(mask, distances, tf.float32.max)
+                nearest = tf.argmin(masked_distances, axis=1, output_type=tf.int32)
+                direction = tf.gather(positions, nearest) - tile_positions
+                forces += tf.where(
+                    tf.reduce_any(mask, axis=1, keepdims=True),
+                    sign * tf.nn.l2_normalize(direction, axis=1) * weight,
+                    tf.zeros_like(tile_positions)
+                )
+            return forces
+
+        forces = tf.map_fn(tile_forces, tiles, fn_output_signature=tf.float32, parallel_iterations=1)
+        return tf.reshape(forces, [-1, 2])[:num_agents]
+
 
     @profile
     @tf.function
@@ -258,6 +386,100 @@ class TensorFlowSimulation:
     
  
 
+    # ---------------- Uniform grid (cell list) -----------------------
+
+    @tf.function
+    def _grid_candidate_pairs(self, positions, cell_size, point_bucket, query_bucket):
+        # Agents are sorted by (bucket, row, column). The 3 cells of one grid row are
+        # contiguous in that order, so each query needs only 3 ranges of candidates.
+        # Cells are clamped to the world grid; clamping is monotonic, so agents outside
+        # the world still find every neighbor closer than cell_size.
+        grid_w = tf.maximum(tf.cast(tf.math.ceil(self.world_width / cell_size), tf.int32), 1)
+        grid_h = tf.maximum(tf.cast(tf.math.ceil(self.world_height / cell_size), tf.int32), 1)
+        num_cells = grid_w * grid_h
+        cell_x = tf.clip_by_value(tf.cast(tf.floor(positions[:, 0] / cell_size), tf.int32), 0, grid_w - 1)
+        cell_y = tf.clip_by_value(tf.cast(tf.floor(positions[:, 1] / cell_size), tf.int32), 0, grid_h - 1)
+
+        keys = point_bucket * num_cells + cell_y * grid_w + cell_x
+        order = tf.argsort(keys, stable=True)
+        sorted_keys = tf.gather(keys, order)
+
+        rows = cell_y[:, tf.newaxis] + tf.constant([-1, 0, 1], dtype=tf.int32)
+        valid_rows = tf.logical_and(rows >= 0, rows < grid_h)
+        row_base = query_bucket[:, tf.newaxis] * num_cells + rows * grid_w
+        low_keys = row_base + tf.maximum(cell_x - 1, 0)[:, tf.newaxis]
+        high_keys = row_base + tf.minimum(cell_x + 1, grid_w - 1)[:, tf.newaxis]
+        starts = tf.searchsorted(sorted_keys, tf.reshape(low_keys, [-1]), side='left')
+        ends = tf.searchsorted(sorted_keys, tf.reshape(high_keys, [-1]), side='right')
+        lengths = tf.where(tf.reshape(valid_rows, [-1]), ends - starts, tf.zeros_like(starts))
+
+        ranges = tf.repeat(tf.range(tf.size(lengths)), lengths)
+        offsets = tf.range(tf.reduce_sum(lengths)) - tf.gather(tf.cumsum(lengths, exclusive=True), ranges)
+        neighbors = tf.gather(order, tf.gather(starts, ranges) + offsets)
+        return ranges // 3, neighbors
+
+    @tf.function
+    def _grid_separation_cohesion(self, positions):
+        num_agents = tf.shape(positions)[0]
+        cell_size = tf.maximum(tf.maximum(self.separation_distance, self.cohesion_distance), 1.0)
+        buckets = tf.zeros([num_agents], dtype=tf.int32)
+        agent_idx, neighbor_idx = self._grid_candidate_pairs(positions, cell_size, buckets, buckets)
+
+        neighbor_positions = tf.gather(positions, neighbor_idx)
+        diff = tf.gather(positions, agent_idx) - neighbor_positions
+        distances = tf.norm(diff, axis=1)
+
+        separation_mask = tf.cast(tf.logical_and(distances < self.separation_distance, distances > 0), tf.float32)
+        steer = tf.math.unsorted_segment_sum(diff * separation_mask[:, tf.newaxis], agent_idx, num_agents)
+        count = tf.math.unsorted_segment_sum(separation_mask, agent_idx, num_agents)[:, tf.newaxis]
+        separation = tf.where(count > 0, steer / tf.maximum(count, 1.0), 0)
+
+        cohesion_mask = tf.cast(tf.logical_and(distances < self.cohesion_distance, distances > 0), tf.float32)
+        center_of_mass = tf.math.unsorted_segment_sum(neighbor_positions * cohesion_mask[:, tf.newaxis], agent_idx, num_agents)
+        count = tf.math.unsorted_segment_sum(cohesion_mask, agent_idx, num_agents)[:, tf.newaxis]
+        center_of_mass = tf.where(count > 0, center_of_mass / tf.maximum(count, 1.0), positions)
+        cohesion = center_of_mass - positions
+        return separation, cohesion
+
+    # ---------------- Tiled dense evaluation -----------------------
+
+    @tf.function
+    def _tile_separation_cohesion(self, tile_positions, positions, active):
+        # One fused pass per row tile: peak memory is tile x N instead of N x N.
+        diff = tile_positions[:, tf.newaxis, :] - positions
+        distances = tf.norm(diff, axis=2)
+
+        separation_mask = tf.cast(tf.logical_and(distances < self.separation_distance, distances > 0), tf.float32) * active
+        count = tf.reduce_sum(separation_mask, axis=1, keepdims=True)
+        steer = count * tile_positions - tf.matmul(separation_mask, positions)
+        separation = tf.where(count > 0, steer / tf.maximum(count, 1.0), 0)
+
+        cohesion_mask = tf.cast(tf.logical_and(distances < self.cohesion_distance, distances > 0), tf.float32) * active
+        count = tf.reduce_sum(cohesion_mask, axis=1, keepdims=True)
+        center_of_mass = tf.matmul(cohesion_mask, positions)
+        center_of_mass = tf.where(count > 0, center_of_mass / tf.maximum(count, 1.0), tile_positions)
+        return separation, center_of_mass - tile_positions
+
+    @tf.function
+    def _tiled_separation_cohesion(self, positions, active=None):
+        # active (N,) masks out inactive neighbors when running on the full buffer
+        num_agents = tf.shape(positions)[0]
+        if active is None:
+            active = tf.ones([num_agents], dtype=tf.float32)
+        tile_size = self.force_tile_size
+        num_tiles = (num_agents + tile_size - 1) // tile_size
+        padded = tf.pad(positions, [[0, num_tiles * tile_size - num_agents], [0, 0]])
+        tiles = tf.reshape(padded, [num_tiles, tile_size, 2])
+        separation, cohesion = tf.map_fn(
+            lambda tile: self._tile_separation_cohesion(tile, positions, active),
+            tiles,
+            fn_output_signature=(tf.float32, tf.float32),
+            parallel_iterations=1
+        )
+        separation = tf.reshape(separation, [-1, 2])[:num_agents]
+        cohesion = tf.reshape(cohesion, [-1, 2])[:num_agents]
+        return separation, cohesion
+
     @tf.function
     def _calculate_center_distances(self, positions):
         to_center = self.world_center - positions
@@ -282,6 +504,6 @@ class TensorFlowSimulation:
                 param_name, value = self._ui_to_tensorflow_queue.get_nowait()
                 if hasattr(self, param_name.lower()):
                     getattr(self, param_name.lower()).assign(value)
-                    self.logger.debug(f"Updated UI parameter: {param_name} = {value}")
+                    self.logger.debug("Updated UI parameter: %s = %s", param_name, value)
             except Empty:
                 break  # Queue is empty, exit the loop
\ No newline at end of file
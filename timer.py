@@ -1,18 +1,20 @@
 import time
 
 class Timer:
-    def __init__(self, name: str, fps_update_interval = 0.01):
+    def __init__(self, name: str, fps_update_interval = 0.01, time_func = time.time):
+        # time_func: clock source (lockstep mode passes simulated time)
+        self.time_func = time_func
         self.name = name
         self.frame_count = 0
-        self.start_time = time.time()
+        self.start_time = self.time_func()
         self.fps_update_interval = fps_update_interval
-        self.last_time = time.time()
+        self.last_time = self.time_func()
         self.time_value = 0
         self.b_print = True
         self.total_time = 0
     
     def start(self):
-        self.start_time = time.time()
+        self.start_time = self.time_func()
         
     
     def _calculate_fps(self):
@@ -24,11 +26,11 @@ class Timer:
         time.sleep(sleep_duration)
         
     def calculate_time(self):
-        self.time_value = time.time() - self.start_time
+        self.time_value = self.time_func() - self.start_time
         return self.time_value
     
     def print_lap_time(self,interval_time):
-        self.current_time = time.time() 
+        self.current_time = self.time_func() 
         if self.current_time - self.last_time >= interval_time:
             lap_time = self.calculate_time() * 1000
             print(self.name + " Lap time(ms):", f"{lap_time:4.2f}")
@@ -36,14 +38,14 @@ class Timer:
         return
     
     def interval_timer(self,interval_time):
-        self.current_time = time.time() 
+        self.current_time = self.time_func() 
         if self.current_time - self.last_time >= interval_time:
             self.last_time = self.current_time
             return True
         return False
     
     def print_lap_fps(self,interval_time):
-        self.current_time = time.time() 
+        self.current_time = self.time_func() 
         if self.current_time - self.last_time >= interval_time:
             lap_fps = 1 / self.calculate_time() 
             print(self.name + " Lap FPS:", f"{lap_fps:4.2f}")
@@ -52,7 +54,7 @@ class Timer:
     
     def print_fps(self,interval_time):
         self.frame_count += 1
-        self.current_time = time.time() 
+        self.current_time = self.time_func() 
         if self.current_time - self.last_time >= interval_time:
             # calculate fps
             fps = self._calculate_fps()
@@ -62,10 +64,10 @@ class Timer:
         return
 
     def print_average_time(self,interval_time):
-        lap_time = time.time() - self.start_time
+        lap_time = self.time_func() - self.start_time
         self.total_time += lap_time
         self.frame_count += 1
-        self.current_time = time.time() 
+        self.current_time = self.time_func() 
         if self.current_time - self.last_time >= interval_time:
             # calculate fps
             average_time = self.total_time / self.frame_count
@@ -0,0 +1,112 @@
+import os
+import re
+import json
+import glob
+import time
+import threading
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+
+# per-process file name: trace_<process>_<pid>.json
+_PROCESS_FILE_PREFIX = 'trace_'
+_PROCESS_FILE = re.compile(_PROCESS_FILE_PREFIX + r'\w+_\d+\.json$')
+
+class Tracer:
+    """
+    Span recorder for one process. Spans are (name, start, duration) tuples in a bounded
+    deque, written to <trace_dir>/trace_<process>_<pid>.json when the process stops; merge_traces()
+    joins the per-process files into one Chrome trace (chrome://tracing, ui.perfetto.dev).
+    time.monotonic_ns reads the same system-wide clock in every process, so spans from
+    different processes line up on one timeline.
+    While disabled, span() returns a shared no-op context and traced functions call straight through.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.process_name = None
+        self.trace_dir = None
+        self._events = deque()
+        self._null_span = nullcontext()
+
+    def enable(self, process_name, trace_dir, capacity=200000):
+        self.process_name = process_name
+        self.trace_dir = trace_dir
+        # oldest spans are dropped once the buffer is full
+        self._events = deque(maxlen=capacity)
+        self.enabled = True
+
+    def span(self, name):
+        if not self.enabled:
+            return self._null_span
+        return _Span(self._events, name)
+
+    def dump(self):
+        # write this process's spans; returns the file path (None while disabled)
+        if not self.enabled:
+            return None
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': self.process_name}}]
+        events += [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid, 'ts': start / 1000, 'dur': duration / 1000}
+                   for name, tid, start, duration in list(self._events)]
+        os.makedirs(self.trace_dir, exist_ok=True)
+        path = os.path.join(self.trace_dir, f"{_PROCESS_FILE_PREFIX}{self.process_name}_{pid}.json")
+        with open(path, 'w') as f:
+            json.dump(events, f)
+        return path
+
+class _Span:
+    __slots__ = ('events', 'name', 'start')
+
+    def __init__(self, events, name):
+        self.events = events
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.monotonic_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.monotonic_ns()
+        self.events.append((self.name, threading.get_ident(), self.start, end - self.start))
+        return False
+
+tracer = Tracer()
+
+def span(name):
+    return tracer.span(name)
+
+def traced(name=None):
+    # @traced() / @traced('name'); the default name is the function's qualified name
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with _Span(tracer._events, span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _process_files(trace_dir):
+    # files written by Tracer.dump (other files in the directory are left alone)
+    paths = glob.glob(os.path.join(trace_dir, f"{_PROCESS_FILE_PREFIX}*.json"))
+    return sorted(path for path in paths if _PROCESS_FILE.match(os.path.basename(path)))
+
+def clear_traces(trace_dir):
+    # Remove the per-process files of earlier runs, so merge_traces only sees this run
+    for path in _process_files(trace_dir):
+        os.remove(path)
+
+def merge_traces(trace_dir, output_path):
+    # Join the per-process files into one Chrome trace JSON; returns the number of spans
+    events = []
+    for path in _process_files(trace_dir):
+        if os.path.abspath(path) == os.path.abspath(output_path):
+            continue
+        with open(path) as f:
+            events += json.load(f)
+    with open(output_path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return sum(1 for event in events if event['ph'] == 'X')
@@ -3,11 +3,13 @@ from pygame import Vector2
 import numpy as np
 from config_manager import ConfigManager
 from creature import Creature
+from sprite_atlas import SpriteAtlas
 from typing import Dict, List
 import time
 from timer import Timer
 from queue import Empty
 from log import get_logger
+from tracer import traced
 
 
 class VisualSystem:
@@ -26,6 +28,8 @@ class VisualSystem:
         self.target_fps = self.config_manager.get_trait_value('RENDER_FPS')
         self.world_surface = pygame.Surface((self.world_width, self.world_height))
         self.all_sprites = pygame.sprite.Group()
+        self.sprite_atlas = SpriteAtlas(self.config_manager.get_trait_value('SPRITE_ANGLE_STEP'))
+        self.sprite_atlas.build(self.config_manager.species_dna.keys())
         
         # main property
         self.max_agents_num = self.config_manager.get_trait_value('MAX_AGENTS_NUM')
@@ -75,19 +79,19 @@ class VisualSystem:
         self.initialized = True
         
     def create_creature(self, agent_id: int, species: int, x: float, y: float):
-        creature = Creature(species, Vector2(x, y))
+        creature = Creature(species, Vector2(x, y), self.sprite_atlas)
         self.creatures[agent_id] = creature
         self.all_sprites.add(creature)
-        self.logger.debug(f"Created creature: agent_id={agent_id}, species={species}, position=({x}, {y})")
+        self.logger.debug("Created creature: agent_id=%s, species=%s, position=(%s, %s)", agent_id, species, x, y)
         
     def remove_creature(self, agent_id):
         if agent_id in self.creatures:
             creature = self.creatures[agent_id]
             self.all_sprites.remove(creature)
             del self.creatures[agent_id]
-            self.logger.debug(f"Removed creature: agent_id={agent_id}")
+            self.logger.debug("Removed creature: agent_id=%s", agent_id)
         else:
-            self.logger.warning(f"Attempted to remove non-existent creature: agent_id={agent_id}")
+            self.logger.warning("Attempted to remove non-existent creature: agent_id=%s", agent_id)
 
     def update(self):
         self.process_queue()
@@ -95,18 +99,22 @@ class VisualSystem:
         self.update_creatures()
         self.draw()
         
+    @traced()
     def process_queue(self):
         while True:
             try:
                 update_data = self._eco_to_visual.get_nowait()
                 action = update_data.get('action')
-                if action == 'add':
+                if action == 'batch':
+                    self._handle_agent_batch(update_data)
+                elif action == 'add':
                     self._handle_agent_added(update_data)
                 elif action == 'remove':
                     self._handle_agent_removed(update_data)
             except Empty:
                 break
 
+    @traced()
     def update_property(self):
         try:
             render_data = self._box2d_to_visual_render.get_nowait()
@@ -115,13 +123,15 @@ class VisualSystem:
         except Empty:
             pass
 
+    @traced()
     def update_creatures(self):
         for agent_id, position in zip(self.agent_ids, self.positions):
             if agent_id in self.creatures:
                 self.creatures[agent_id].update(position)    
             else:
-                self.logger.warning(f'VisualSystem : no agent_id {agent_id}!!') 
+                self.logger.warning("VisualSystem : no agent_id %s!!", agent_id) 
            
+    @traced()
     def draw(self):
         self.world_surface.fill(self.background_color)
         self.all_sprites.draw(self.world_surface)
@@ -139,14 +149,24 @@ class VisualSystem:
         self.current_agent_count = data['current_agent_count']
 
         self.create_creature(agent_id, species, position[0], position[1])
-        self.logger.debug(f"Agent {agent_id} added. Total agents: {self.current_agent_count}")
+        self.logger.debug("Agent %s added. Total agents: %s", agent_id, self.current_agent_count)
+
+    def _handle_agent_batch(self, data):
+        for agent_id in data['removed_ids'].tolist():
+            if agent_id in self.creatures:
+                self.remove_creature(agent_id)
+        for agent_id, species, position in zip(data['added_ids'].tolist(), data['added_species'].tolist(),
+                                               data['added_positions'].tolist()):
+            self.create_creature(agent_id, species, position[0], position[1])
+        self.current_agent_count = data['current_agent_count']
+        self.logger.debug("Agent batch applied. Total agents: %s", self.current_agent_count)
 
     def _handle_agent_removed(self, data):
         agent_id = data['agent_id']
         self.current_agent_count = data['current_agent_count']
         if agent_id in self.creatures:
             self.remove_creature(agent_id)
-            self.logger.debug(f"Agent {agent_id} removed . Total agents: {self.current_agent_count}")
+            self.logger.debug("Agent %s removed . Total agents: %s", agent_id, self.current_agent_count)
 
     def cleanup(self):        
         pygame.quit()